@@ -3,11 +3,27 @@ common_resources.py
 This file contains common resources utilised by;
 1) create_swagger_config.py
 2) generateschemas_from_OneFSSource.py
+3) generate_PAPIschemas_from_ClusterIP.py
 """
 
 """
 Future plan - Exclude endpoint list should be dynamic
 """
+from collections import OrderedDict, deque
+import copy
+import fnmatch
+import json
+import logging as log
+import os
+import random
+import re
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+
+import papi_schema_snapshots
 
 debug_build_exclusion_list = [
     '/1/versiontest/automatic',
@@ -130,118 +146,750 @@ def get_exclude_endpoints(papi_version):
             ])
     return exclude_end_points
 
+# first segment of a rule that selects a range of versions, e.g. 3-5 or 7-
+VERSION_RANGE_RE = re.compile(r'^(\d*)-(\d*)$')
+# path segment of a rule matching any number of end point path segments
+ANY_SEGMENTS = '**'
+
+
+class EndPointTrie(object):
+    """
+    Prefix trie of end point rules, one level per path segment. A rule is
+    an end point path whose segments may be globs, e.g. /*/sra/**, where
+    ** matches any number of segments, and whose first segment may be a
+    version range, e.g. /3-5/quota/**.
+    """
+
+    def __init__(self):
+        self.root = self.new_node()
+
+    @staticmethod
+    def new_node(any_segments=False):
+        """
+        Return an empty trie node, any_segments nodes stand for ** and
+        consume any number of segments.
+        """
+        return {'children': {}, 'patterns': {}, 'terminal': False,
+                'any_segments': any_segments}
+
+    @staticmethod
+    def segment_matcher(segment, is_version):
+        """
+        Return a function matching end point path segments against a rule
+        segment, or None if the rule segment only matches itself.
+        """
+        version_range = VERSION_RANGE_RE.match(segment) if is_version else None
+        if version_range:
+            low = int(version_range.group(1) or 0)
+            high = (int(version_range.group(2)) if version_range.group(2)
+                    else float('inf'))
+            return lambda version: (version.isdigit() and
+                                    low <= int(version) <= high)
+        if any(glob_char in segment for glob_char in '*?['):
+            return lambda name: fnmatch.fnmatchcase(name, segment)
+        return None
+
+    def add(self, rule):
+        """Add a rule to the trie."""
+        node = self.root
+        for index, segment in enumerate(rule.strip('/').split('/')):
+            if segment == ANY_SEGMENTS:
+                node = node['children'].setdefault(
+                    ANY_SEGMENTS, self.new_node(any_segments=True))
+                continue
+            matcher = self.segment_matcher(segment, index == 0)
+            if matcher is None:
+                node = node['children'].setdefault(segment, self.new_node())
+            else:
+                if segment not in node['patterns']:
+                    node['patterns'][segment] = (matcher, self.new_node())
+                node = node['patterns'][segment][1]
+        node['terminal'] = True
+
+    @staticmethod
+    def expand(nodes):
+        """Add the nodes reached through ** without consuming a segment."""
+        expanded = []
+        while nodes:
+            node = nodes.pop()
+            expanded.append(node)
+            if ANY_SEGMENTS in node['children']:
+                nodes.append(node['children'][ANY_SEGMENTS])
+        return expanded
+
+    def matches(self, end_point):
+        """Return True if end_point matches a rule in the trie."""
+        nodes = self.expand([self.root])
+        for segment in end_point.strip('/').split('/'):
+            next_nodes = []
+            for node in nodes:
+                if node['any_segments']:
+                    next_nodes.append(node)
+                child = node['children'].get(segment)
+                if child is not None:
+                    next_nodes.append(child)
+                for matcher, pattern_node in node['patterns'].values():
+                    if matcher(segment):
+                        next_nodes.append(pattern_node)
+            if not next_nodes:
+                return False
+            nodes = self.expand(next_nodes)
+        return any(node['terminal'] for node in nodes)
+
+
+class EndPointSelector(object):
+    """
+    Selects end points by include and exclude rules. Besides EndPointTrie
+    rules, an API family name such as quota stands for /*/quota/**.
+    exclude_paths are excluded as they are, without glob matching, like the
+    lists of get_exclude_endpoints.
+    An end point is selected unless it is excluded, and if there are
+    include rules only if it matches one of them.
+    """
+
+    def __init__(self, include=(), exclude=(), exclude_paths=()):
+        self.include_rules = list(include)
+        self.exclude_rules = list(exclude)
+        self.exclude_paths = set(exclude_paths)
+        self.include = None
+        if include:
+            self.include = EndPointTrie()
+            for rule in include:
+                self.include.add(self.family_rule(rule))
+        self.exclude = EndPointTrie()
+        for rule in exclude:
+            self.exclude.add(self.family_rule(rule))
+
+    @staticmethod
+    def family_rule(rule):
+        """Expand an API family name into a rule."""
+        if rule.startswith('/'):
+            return rule
+        return '/*/{}/{}'.format(rule, ANY_SEGMENTS)
+
+    def selects(self, end_point):
+        """Return True if end_point is selected."""
+        if end_point in self.exclude_paths or self.exclude.matches(end_point):
+            return False
+        return self.include is None or self.include.matches(end_point)
+
+    @property
+    def has_rules(self):
+        """Whether any include or exclude rules were given."""
+        return bool(self.include_rules or self.exclude_rules)
+
+    def unmatched_rules(self, end_points):
+        """Return the include and exclude rules matching none of end_points."""
+        unmatched = []
+        for rule in self.include_rules + self.exclude_rules:
+            trie = EndPointTrie()
+            trie.add(self.family_rule(rule))
+            if not any(trie.matches(end_point) for end_point in end_points):
+                unmatched.append(rule)
+        return unmatched
+
+
+def add_selection_arguments(argparser):
+    """Add the end point selection options to an argument parser."""
+    argparser.add_argument(
+        '--include', dest='include_rules',
+        help='Only use end points matching this rule: a path such as '
+             '/3/protocols/nfs/exports, a glob such as /*/sra/**, a version '
+             'range such as /3-5/quota/** or an API family such as quota. '
+             'Can be given more than once',
+        action='append', default=[])
+    argparser.add_argument(
+        '--exclude', dest='exclude_rules',
+        help='Skip end points matching this rule, see --include. Can be '
+             'given more than once',
+        action='append', default=[])
+    argparser.add_argument(
+        '--rules', dest='rules_file',
+        help='Path to a JSON file with "include" and "exclude" lists of '
+             'rules, used along with --include and --exclude',
+        action='store', default=None)
+
+
+def end_point_selector(args, exclude_end_points):
+    """
+    Return the EndPointSelector of the add_selection_arguments options,
+    excluding exclude_end_points as well.
+    """
+    include_rules = list(args.include_rules)
+    exclude_rules = list(args.exclude_rules)
+    if args.rules_file:
+        with open(args.rules_file, 'r') as rules_file:
+            rules = json.loads(rules_file.read())
+        include_rules.extend(rules.get('include', []))
+        exclude_rules.extend(rules.get('exclude', []))
+    return EndPointSelector(
+        include_rules, exclude_rules, exclude_paths=exclude_end_points)
+
+
+def log_unmatched_rules(selector, end_point_list):
+    """
+    Warn about the rules of selector that match none of the end points of
+    end_point_list in use, only the latest version of an end point is used.
+    """
+    for rule in selector.unmatched_rules(
+            select_end_point_versions(end_point_list)):
+        log.warning('Selection rule %s matches no end point in use', rule)
+
+
+def selected_directory(end_point_list, end_point_paths, selector):
+    """
+    Return the directory of a snapshot holding the end points of
+    end_point_paths, which selector selected from end_point_list.
+    Without include or exclude rules this is end_point_list itself, the
+    generator leaves the end points of get_exclude_endpoints out again. With
+    rules, end points the snapshot does not hold are left out, or the
+    generator would look for them in it.
+    """
+    if not isinstance(selector, EndPointSelector) or not selector.has_rules:
+        return end_point_list
+    selected_end_points = set(
+        end_point_path
+        for end_point_tuple in end_point_paths
+        for end_point_path in end_point_tuple
+        if end_point_path is not None)
+    return [end_point for end_point in end_point_list
+            if end_point in selected_end_points]
+
+
+def add_baseline_arguments(argparser):
+    """Add the delta crawl options to an argument parser."""
+    argparser.add_argument(
+        '--baseline', dest='baseline',
+        help='OneFS version, or path, of a papi_schemas snapshot to copy the '
+             '?describe documents of the end points it has under the same '
+             'path from, only the other end points are fetched',
+        action='store', default=None)
+    argparser.add_argument(
+        '--baseline-sample', dest='baseline_sample',
+        help='Number of end points copied from --baseline that are fetched '
+             'anyway to verify them, all are fetched if one differs',
+        action='store', type=int, default=10)
+    argparser.add_argument(
+        '--baseline-seed', dest='baseline_seed',
+        help='Seed of the --baseline-sample, to fetch the same end points '
+             'again',
+        action='store', type=int, default=None)
+
+
+def load_baseline(schemas_dir, baseline):
+    """Load the --baseline snapshot, given as a path or OneFS version."""
+    if not os.path.exists(baseline):
+        baseline = papi_schema_snapshots.snapshot_file(schemas_dir, baseline)
+    return papi_schema_snapshots.load_snapshot(baseline)
+
+
+def plan_delta_crawl(end_point_paths, baseline, sample_size, seed=None):
+    """
+    Split the end points of end_point_paths into those whose ?describe
+    documents have to be fetched, because they are new or re-versioned, and
+    those that can be copied from the baseline snapshot. sample_size of the
+    latter, picked at random from seed, are fetched as well to verify the
+    baseline.
+    Returns the end points to fetch, the sampled end points among them and
+    the end points to copy.
+    """
+    fetched = []
+    copied = []
+    for end_point_tuple in end_point_paths:
+        for end_point_path in end_point_tuple:
+            if end_point_path is None:
+                continue
+            if end_point_path in baseline:
+                copied.append(end_point_path)
+            else:
+                fetched.append(end_point_path)
+    sampled = random.Random(seed).sample(
+        copied, min(sample_size, len(copied)))
+    sampled_set = set(sampled)
+    copied = [end_point_path for end_point_path in copied
+              if end_point_path not in sampled_set]
+    log.info('Fetching %s new and %s sampled end points, copying %s from '
+             'the baseline.', len(fetched), len(sampled), len(copied))
+    if sampled:
+        log.info('Sampled end points: %s', ', '.join(sampled))
+    return fetched + sampled, sampled, copied
+
+
+def copy_from_baseline(baseline, schemas, sampled, copied):
+    """
+    Copy the documents of the copied end points from the baseline snapshot
+    into schemas, unless the fetched document of a sampled end point differs
+    from that of the baseline.
+    Returns the end points that have to be fetched after all.
+    """
+    mismatches = [end_point_path for end_point_path in sampled
+                  if end_point_path in schemas and
+                  schemas[end_point_path] != baseline[end_point_path]]
+    if mismatches:
+        log.warning('%s of %s sampled end points differ from the baseline, '
+                    'e.g. %s, fetching all end points.',
+                    len(mismatches), len(sampled), mismatches[0])
+        return copied
+    for end_point_path in copied:
+        schemas[end_point_path] = baseline[end_point_path]
+    return []
+
+
+# sorts after every character of an end point, see end_point_sort_key
+END_POINT_SORT_SENTINEL = chr(0x10FFFF)
+
+
+def select_end_point_versions(end_point_list):
+    """
+    Selects the end point to use from every run of consecutive entries of
+    end_point_list that only differ in their version: the one with the
+    highest integer version, entries with floating point versions are
+    never used. Entries of the same path that are not next to each other
+    are used separately, 7.2.1.6 lists its NFS end points under both /1
+    and /2 that way.
+    Returns the selected end points in list order.
+    """
+    selected_end_points = []
+    run_path = None
+    run_end_point = run_version = None
+    for end_point in end_point_list:
+        # '/<version>/<path>' is split into ['', version, path]
+        end_point_parts = end_point.split('/', 2)
+        path = end_point_parts[-1]
+        version = end_point_parts[1]
+        if path != run_path:
+            if run_end_point is not None:
+                selected_end_points.append(run_end_point)
+            run_path = path
+            run_end_point = run_version = None
+        if '.' in version:
+            # skip floating point version numbers
+            continue
+        if run_end_point is None or int(version) >= int(run_version):
+            run_end_point = end_point
+            run_version = version
+    if run_end_point is not None:
+        selected_end_points.append(run_end_point)
+    return selected_end_points
+
+
+def end_point_sort_key(end_point_tuple):
+    """
+    Sort key of an end point tuple: its base end point, or item end point
+    if it has none, in string order except that an end point comes after
+    every longer end point it is a prefix of, e.g. /3/a/b, /3/ab, /3/a.
+    """
+    return (end_point_tuple[0] or end_point_tuple[1]) + END_POINT_SORT_SENTINEL
+
+
 def get_endpoint_paths(end_point_list, exclude_end_points):
     """
     Gets the full list of PAPI URIs reported by source_node_or_cluster using
     the ?describe&list&json query arguments at the root level.
+    exclude_end_points is a list of end points to leave out or an
+    EndPointSelector.
     Returns the URIs as a list of tuples where collection resources appear as
     (<collection-uri>, <single-item-uri>) and non-collection/static resources
     appear as (<uri>,None).
     """
-    
-    end_point_list_json = end_point_list
-        
+    if isinstance(exclude_end_points, EndPointSelector):
+        selector = exclude_end_points
+    else:
+        selector = EndPointSelector(exclude_paths=exclude_end_points)
     base_end_points = {}
     end_point_paths = []
-    ep_index = 0
-    num_endpoints = len(end_point_list_json)
-    while ep_index < num_endpoints:
-        current_endpoint = end_point_list_json[ep_index]
-        current_endpoint_version = current_endpoint.split('/', 2)[1]
-        if current_endpoint_version.find('.') != -1:
-            # skip floating point version numbers
-            ep_index += 1
+    for end_point in select_end_point_versions(end_point_list):
+        if not selector.selects(end_point):
             continue
 
-        next_ep_index = ep_index + 1
-        while next_ep_index < num_endpoints:
-            current_endpoint = end_point_list_json[ep_index]
-            current_endpoint_version = current_endpoint.split('/', 2)[1]
-            next_endpoint = end_point_list_json[next_ep_index]
-            # strip off the version and compare to see if they are
-            # the same.
-            if (next_endpoint.split('/', 2)[-1] !=
-                    current_endpoint.split('/', 2)[-1]):
-                # using current_endpoint
-                break
-            # skipping current_endpoint
-            next_endpoint_version = next_endpoint.split('/', 2)[1]
-            if next_endpoint_version.find('.') == -1:
-
-                if (int(current_endpoint_version) > int(next_endpoint_version)):
-                    # swap the values, put the higher version down in the list
-                    end_point_list_json[ep_index] = next_endpoint
-                    end_point_list_json[ep_index + 1] = current_endpoint
+        path = end_point.split('/', 2)[2]
+        if end_point[-1] != '>':
+            base_end_points[path] = (end_point, None)
+        else:
+            base_path = path[0:path.rfind('/')]
+            if base_path in base_end_points:
+                end_point_paths.append(
+                    (base_end_points.pop(base_path)[0], end_point))
             else:
-                # leave the x.x values
-                end_point_list_json[ep_index] = next_endpoint
-                end_point_list_json[ep_index + 1] = current_endpoint
-
-            ep_index = next_ep_index
-            next_ep_index += 1
-            ##This is the last endpoint so utilize the max version
-            if next_ep_index == num_endpoints:
-                current_endpoint = end_point_list_json[ep_index]
-
-        if current_endpoint in exclude_end_points:
-            ep_index += 1
-            continue
+                # no base for this item end point
+                end_point_paths.append((None, end_point))
 
-        if current_endpoint[-1] != '>':
-            base_uri = current_endpoint.split('/', 2)[2]
-            base_end_points[base_uri] = (current_endpoint, None)
-        else:
+    # remaining base end points have no item end point
+    end_point_paths.extend(base_end_points.values())
+
+    return sorted(end_point_paths, key=end_point_sort_key)
+
+
+# HTTP status codes telling that the cluster is overloaded
+OVERLOAD_STATUS_CODES = (429, 503)
+
+# seconds a node that failed to answer is left out before it is tried again
+NODE_RETRY_DELAY = 30.0
+# seconds to wait for a node to answer a request
+NODE_REQUEST_TIMEOUT = 60.0
+
+
+class AdaptiveConcurrency(object):
+    """
+    AIMD window of requests in flight, shared by the threads of a crawl so
+    that it backs off when the cluster is busy serving its clients. The
+    window grows by one request per round of window completed requests
+    whose p95 latency stays under target_latency, and is halved when a
+    request is answered with an OVERLOAD_STATUS_CODES status, fails to
+    connect, takes over spike_factor * target_latency or a round ends with
+    its p95 latency over target_latency. It is halved at most once per
+    round. The percentiles logged are those of the last sample_size
+    requests.
+    """
+
+    def __init__(self, max_window, target_latency, spike_factor=2.0,
+                 sample_size=100, log_interval=5.0):
+        self.max_window = max_window
+        self.target_latency = target_latency
+        self.spike_factor = spike_factor
+        self.log_interval = log_interval
+        self.window = 1
+        self.in_flight = 0
+        self.completed = 0
+        self.round_start = 0
+        # no decrease before the requests in flight at the last one are done
+        self.next_decrease = 0
+        self.latencies = deque(maxlen=sample_size)
+        self.round_latencies = []
+        self.condition = threading.Condition()
+        self.last_log = time.time()
+
+    def acquire(self):
+        """Wait until the window has room for another request."""
+        with self.condition:
+            while self.in_flight >= self.window:
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self, latency, overloaded=False):
+        """Account for a completed request and adjust the window."""
+        with self.condition:
+            self.in_flight -= 1
+            self.completed += 1
+            self.latencies.append(latency)
+            self.round_latencies.append(latency)
+            if overloaded or latency > self.spike_factor * self.target_latency:
+                self.decrease()
+            elif self.completed - self.round_start >= self.window:
+                round_p95 = percentile(self.round_latencies, 95)
+                self.round_start = self.completed
+                self.round_latencies = []
+                if round_p95 <= self.target_latency:
+                    self.window = min(self.window + 1, self.max_window)
+                else:
+                    self.decrease()
+            self.condition.notify_all()
+            if time.time() - self.last_log >= self.log_interval:
+                self.last_log = time.time()
+                self.log_state()
+
+    def decrease(self):
+        """Halve the window, once per round."""
+        if self.completed < self.next_decrease:
+            return
+        self.window = max(self.window // 2, 1)
+        self.round_start = self.completed
+        self.round_latencies = []
+        self.next_decrease = self.completed + self.in_flight + 1
+        log.debug('Concurrency window decreased to %s', self.window)
+
+    def log_state(self):
+        """Log the window and the recent latencies."""
+        log.info('Concurrency window %s, %s in flight, %s done, latency '
+                 'p50 %.3fs p95 %.3fs', self.window, self.in_flight,
+                 self.completed, percentile(self.latencies, 50),
+                 percentile(self.latencies, 95))
+
+
+def percentile(values, percent):
+    """Return a percentile of some values, 0.0 if there are none."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, len(values) * percent // 100)]
+
+
+def add_concurrency_arguments(argparser):
+    """Add the adaptive concurrency options to an argument parser."""
+    argparser.add_argument(
+        '--target-latency', dest='target_latency',
+        help='Adapt the number of ?describe requests in flight, up to '
+             '--concurrency, to keep their p95 latency under this many '
+             'seconds',
+        action='store', type=float, default=None)
+
+
+def adaptive_concurrency(args, max_window):
+    """
+    Return the AdaptiveConcurrency of the add_concurrency_arguments
+    options, or None for a fixed concurrency.
+    """
+    if args.target_latency is None:
+        return None
+    return AdaptiveConcurrency(max_window, args.target_latency)
+
+
+def create_web_session(host, username, password):
+    ''' Return a requests.session object with a isi session. '''
+
+    session = requests.Session()
+
+    session.headers['Origin'] = 'https://{}:8080/'.format(host)
+    session.headers['Content-Type'] = 'application/json'
+
+    data = {
+        'username': username,
+        'password': password,
+        'services': ['platform', 'namespace']}
+
+    uri = 'https://{}:8080/session/1/session'.format(host)
+    response = session.post(uri, json=data, verify=False)
+
+    if response.status_code != requests.codes.CREATED:
+        msg = 'Failed to create web session: {}, {}, {}'.format(
+            username, response.headers, response.text)
+        raise Exception(msg)
+
+    session.headers['X-CSRF-Token'] = session.cookies['isicsrf']
+
+    return session
+
+
+def get_with_session(session, url, params=None, adaptive=None):
+    """
+    Return the response of a GET request. With an AdaptiveConcurrency, the
+    request waits for room in its window and reports its latency and
+    whether the cluster was overloaded.
+    """
+    if adaptive is None:
+        return session.get(url, params=params, verify=False)
+    adaptive.acquire()
+    start_time = time.time()
+    overloaded = True
+    try:
+        response = session.get(url, params=params, verify=False)
+        overloaded = response.status_code in OVERLOAD_STATUS_CODES
+        return response
+    finally:
+        adaptive.release(time.time() - start_time, overloaded)
+
+
+def requests_with_session(session, url, params=None, adaptive=None):
+    """Return the parsed JSON response of a GET request."""
+    return get_with_session(session, url, params, adaptive).json()
+
+
+def onefs_release_version(host, port, session):
+    """Query a cluster and return the 4 major version digits"""
+    url = 'https://{0}:{1}/platform/1/cluster/config'.format(host, port)
+    config = requests_with_session(session, url)
+    return config['onefs_version']['release'].strip('v')
+
+
+def onefs_papi_version(host, port, session):
+    """Query cluster for latest PAPI version."""
+    url = 'https://{0}:{1}/platform/latest'.format(host, port)
+    try:
+        return requests_with_session(session, url)['latest']
+    except KeyError:
+        # latest handler did not exist before API version 3
+        return '2'
+
+
+class ClusterNodes(object):
+    """
+    Stands in for the requests session of a crawl to spread its requests
+    over several nodes of a cluster, each with a session of its own. A
+    request goes to the node with the fewest requests in flight that is
+    below node_concurrency of them, so slow nodes get fewer requests. A node
+    that fails to connect or times out is left out for NODE_RETRY_DELAY
+    seconds and the request is sent to another node.
+    """
+
+    def __init__(self, sessions, node_concurrency):
+        self.sessions = sessions
+        self.node_concurrency = node_concurrency
+        self.in_flight = dict((host, 0) for host in sessions)
+        self.request_counts = dict((host, 0) for host in sessions)
+        self.down_until = dict((host, 0.0) for host in sessions)
+        self.condition = threading.Condition()
+
+    def mount(self, prefix, adapter):
+        """
+        Mount a copy of a transport adapter on the session of every node.
+        The copies have connection pools of their own: an adapter made for
+        a single host keeps one pool, so sharing it would drop the
+        connections to one node whenever a request goes to another.
+        """
+        for session in self.sessions.values():
+            session.mount(prefix, copy.copy(adapter))
+
+    def acquire(self, excluded):
+        """
+        Wait for a node that is up and below its limit, leaving out the
+        excluded nodes.
+        Returns the node, or None if all other nodes are down.
+        """
+        with self.condition:
+            while True:
+                now = time.time()
+                hosts = [host for host in self.sessions
+                         if host not in excluded and
+                         self.down_until[host] <= now]
+                if not hosts:
+                    return None
+                hosts = [host for host in hosts
+                         if self.in_flight[host] < self.node_concurrency]
+                if hosts:
+                    # ties go round robin
+                    host = min(hosts, key=lambda host: (
+                        self.in_flight[host], self.request_counts[host]))
+                    self.in_flight[host] += 1
+                    self.request_counts[host] += 1
+                    return host
+                # a node that is down may come back in the meantime
+                self.condition.wait(NODE_RETRY_DELAY)
+
+    def release(self, host, failed):
+        """Account for a completed request to a node."""
+        with self.condition:
+            self.in_flight[host] -= 1
+            if failed:
+                log.warning('Leaving out node %s for %s seconds',
+                            host, NODE_RETRY_DELAY)
+                self.down_until[host] = time.time() + NODE_RETRY_DELAY
+            self.condition.notify_all()
+
+    def get(self, url, params=None, verify=False,
+            timeout=NODE_REQUEST_TIMEOUT):
+        """GET url from one of the nodes, failing over to the others."""
+        url_parts = urlsplit(url)
+        excluded = set()
+        error = None
+        while True:
+            host = self.acquire(excluded)
+            if host is None:
+                raise error or requests.exceptions.ConnectionError(
+                    'No node is up to request {}'.format(url))
             try:
-                item_endpoint = current_endpoint.split('/', 2)[2]
-                last_slash = item_endpoint.rfind('/')
-                base_end_point_tuple = \
-                    base_end_points[item_endpoint[0:last_slash]]
-                base_end_point_tuple = (base_end_point_tuple[0], current_endpoint)
-                end_point_paths.append(base_end_point_tuple)
-                del base_end_points[item_endpoint[0:last_slash]]
-            except KeyError:
-                # no base for this item_endpoint
-                end_point_paths.append((None, current_endpoint))
-
-        ep_index += 1
+                response = self.sessions[host].get(
+                    node_url(url_parts, host), params=params, verify=verify,
+                    timeout=timeout)
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout) as err:
+                self.release(host, True)
+                excluded.add(host)
+                error = err
+                continue
+            self.release(host, False)
+            return response
 
-    # remaining base end points have no item end point
-    for base_end_point_tuple in list(base_end_points.values()):
-        end_point_paths.append(base_end_point_tuple)
-    def cmp_to_key(mycmp):
-       class K(object):
-         def __init__(self, obj, *args):
-            self.obj = obj
-         def __lt__(self, other):
-            return mycmp(self.obj, other.obj) < 0
-         def __gt__(self, other):
-            return mycmp(self.obj, other.obj) > 0
-         def __eq__(self, other):
-            return mycmp(self.obj, other.obj) == 0
-         def __le__(self, other):
-            return mycmp(self.obj, other.obj) <= 0
-         def __ge__(self, other):
-            return mycmp(self.obj, other.obj) >= 0
-         def __ne__(self, other):
-            return mycmp(self.obj, other.obj) != 0
-       return K
-    def cmp(a, b):
-        return (a > b) - (a < b)
-    def end_point_path_compare(a, b):
-        """Compare two endpoints.
-        Return value is negative if a < b,
-        Return value is zero if a == b
-        Return value is positive if a > b.
+    def check_consistency(self, url, params, value, name):
+        """
+        Request url from every node and log a warning for each node whose
+        answer differs from value, e.g. one that is not upgraded yet.
         """
-        lhs = a[0]
-        if lhs is None:
-            lhs = a[1]
-        rhs = b[0]
-        if rhs is None:
-            rhs = b[1]
-        if lhs.find(rhs) == 0 or rhs.find(lhs) == 0:
-            return len(rhs) - len(lhs)
-
-        return cmp(lhs, rhs)
-
-    return sorted(end_point_paths ,key=cmp_to_key(end_point_path_compare))
+        url_parts = urlsplit(url)
+        for host, session in self.sessions.items():
+            try:
+                node_value = session.get(
+                    node_url(url_parts, host), params=params, verify=False,
+                    timeout=NODE_REQUEST_TIMEOUT).json()
+            except (requests.exceptions.RequestException, ValueError) as err:
+                log.warning('Failed to check the %s of node %s: %s',
+                            name, host, err)
+                continue
+            if node_value != value:
+                log.warning('Node %s reports a different %s than %s',
+                            host, name, next(iter(self.sessions)))
+
+    def log_state(self):
+        """Log the number of requests sent to every node."""
+        log.info('Requests per node: %s', ', '.join(
+            '{} {}'.format(host, self.request_counts[host])
+            for host in self.sessions))
+
+
+def node_url(url_parts, host):
+    """Return the URL of url_parts, as split by urlsplit, on another host."""
+    netloc = host
+    if url_parts.port:
+        netloc = '{}:{}'.format(host, url_parts.port)
+    return urlunsplit(url_parts._replace(netloc=netloc))
+
+
+def discover_cluster_nodes(host, port, session):
+    """
+    Return an address of every node of the cluster at host that is in the
+    cluster and not down, the first address of its first interface that is
+    up and in an IP address pool.
+    """
+    nodes = requests_with_session(
+        session, 'https://{}:{}/platform/3/cluster/nodes'.format(
+            host, port))['nodes']
+    lnns = set()
+    for node in nodes:
+        smartfail = node.get('state', {}).get('smartfail', {})
+        if smartfail.get('in_cluster', True) and not (
+                smartfail.get('down') or smartfail.get('dead')):
+            lnns.add(node['lnn'])
+    interfaces = requests_with_session(
+        session, 'https://{}:{}/platform/3/network/interfaces'.format(
+            host, port))['interfaces']
+    addresses = OrderedDict()
+    for interface in sorted(interfaces, key=lambda interface: (
+            interface['lnn'], interface['name'])):
+        if (interface['lnn'] in lnns and interface['lnn'] not in addresses and
+                interface.get('owners') and interface.get('ip_addrs') and
+                interface.get('status') in ('up', 'active')):
+            addresses[interface['lnn']] = interface['ip_addrs'][0]
+    log.info('Discovered %s of %s nodes with an address.',
+             len(addresses), len(nodes))
+    return list(addresses.values())
+
+
+def add_node_arguments(argparser):
+    """Add the options of crawls over several nodes to an argument parser."""
+    argparser.add_argument(
+        '--discover-nodes', dest='discover_nodes',
+        help='Spread the requests over the nodes of the cluster at -i, as '
+             'listed by /platform/3/cluster/nodes',
+        action='store_true', default=False)
+    argparser.add_argument(
+        '--node-concurrency', dest='node_concurrency',
+        help='Most requests in flight per node when the requests are spread '
+             'over several nodes',
+        action='store', type=int, default=4)
+
+
+def create_cluster_session(args, username, password, port='8080'):
+    """
+    Authenticate with the cluster at args.host, which may be a comma
+    separated list of its nodes, see add_node_arguments.
+    Returns the node to address requests to and a requests session, or a
+    ClusterNodes session when the requests are spread over several nodes.
+    """
+    hosts = args.host.split(',')
+    session = create_web_session(hosts[0], username, password)
+    if args.discover_nodes:
+        hosts = discover_cluster_nodes(hosts[0], port, session) or hosts[:1]
+    elif len(hosts) == 1:
+        return hosts[0], session
+    sessions = OrderedDict()
+    for host in hosts:
+        try:
+            sessions[host] = create_web_session(host, username, password)
+        except Exception as err:
+            log.warning('Leaving out node %s: %s', host, err)
+    if not sessions:
+        raise Exception('Failed to create a web session with any of the '
+                        'nodes {}'.format(', '.join(hosts)))
+    log.info('Spreading requests over %s nodes: %s',
+             len(sessions), ', '.join(sessions))
+    return next(iter(sessions)), ClusterNodes(
+        sessions, args.node_concurrency)
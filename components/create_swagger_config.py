@@ -7,23 +7,32 @@ this config to create language bindings and documentation.
 """
 from json import JSONEncoder
 import argparse
+import atexit
 try:
     import builtins
 except ImportError:
     import __builtin__ as builtins
 import codecs
+import cProfile
 from collections import OrderedDict
+from concurrent import futures
 from copy import deepcopy
 import getpass
+import hashlib
+import itertools
 import json
 import logging as log
+import multiprocessing
 import os
 import re
 import sys
+import time
 import traceback
 import requests
 from requests.auth import HTTPBasicAuth
 import common_resources
+import papi_schema_snapshots
+import schema_fixups
 
 requests.packages.urllib3.disable_warnings()
 
@@ -59,58 +68,54 @@ X_SENSITIVE = 'x-sensitive'
 # tracks swagger operations generated from URLs to ensure uniqueness
 GENERATED_OPS = {}
 SWAGGER_DEFS = {}
+# index of SWAGGER_DEFS by the structural fingerprint of each definition's
+# flattened 'properties', maps fingerprint -> definition names in the order
+# they were added to SWAGGER_DEFS.
+SWAGGER_DEFS_INDEX = {}
+# names of the SWAGGER_DEFS entries that have been added to the index
+SWAGGER_DEFS_INDEXED = []
+# flattened definitions of the 'allOf' entries in SWAGGER_DEFS, maps
+# definition name -> merged 'properties' and 'required' of the subclass chain
+FLATTENED_DEFS = {}
+# names of the definitions flattened since the cache was last invalidated, a
+# later flattening of one of these after invalidation counts as a rebuild
+FLATTENED_DEFS_BUILT = set()
+FLATTENED_DEFS_STATS = {'hits': 0, 'misses': 0, 'rebuilds': 0}
+# find_or_add_obj_def calls made while converting the current end point, as
+# [input definition, name, class_ext_post_fix, returned ref] lists; None when
+# conversions are not being recorded
+OBJ_DEF_CALLS = None
+
+# suffix of the conversion record written next to a spec for --incremental
+CONVERSION_RECORD_SUFFIX = '.record.json'
+
+# functions timed by --profile
+PROFILED_FUNCTIONS = [
+    'get_endpoint_paths', 'fetch_end_point_descriptions',
+    'convert_end_point_shards', 'reuse_conversion', 'convert_end_point',
+    'isi_schema_to_swagger_object', 'find_or_add_obj_def',
+    'resolve_schema_issues', 'fix_multiple_data_types_in_schema',
+    'write_conversion_record', 'write_json']
+
+# SWAGGER_DEFS every end point group starts from in a --processes worker
+SHARD_INITIAL_DEFS = None
+
+# characters of encoded JSON collected by write_json before each write
+JSON_WRITE_CHUNK_SIZE = 65536
+
+# fixup rules of invalid PAPI schemas by stage, see schema_fixups.json
+SCHEMA_FIXUPS = schema_fixups.load_fixups()
+
+# handlers of the property fixups applied to every schema while converting
+SCHEMA_VISITOR = schema_fixups.SchemaVisitor()
+
+# handlers of the fixups applied to the definitions of the finished spec
+DEFINITIONS_VISITOR = schema_fixups.SchemaVisitor()
 
 MAX_ARRAY_SIZE = 2147483642
 MAX_STRING_SIZE = 2147483647
 MAX_INTEGER_SIZE = 9223372036854775807
 
-def create_web_session(host, username, password):
-    ''' Return a requests.session object with a isi session. '''
-
-    session = requests.Session()
-
-    session.headers['Origin'] = 'https://{}:8080/'.format(host)
-    session.headers['Content-Type'] = 'application/json'
-
-    data = {
-        'username': username,
-        'password': password,
-        'services': ['platform', 'namespace']}
-
-    uri = 'https://{}:8080/session/1/session'.format(host)
-    response = session.post(uri, json=data, verify=False)
-
-    if response.status_code != requests.codes.CREATED:
-        msg = 'Failed to create web session: {}, {}, {}'.format(
-            username, response.headers, response.text)
-        raise Exception(msg)
-
-    session.headers['X-CSRF-Token'] = session.cookies['isicsrf']
-
-    return session
-
-def requests_with_session(session, url, params = None):
-    return session.get(
-            url,params=params,
-            verify=False).json()
-
-def onefs_release_version(host, port, session):
-    """Query a cluster and return the 4 major version digits"""
-    url = 'https://{0}:{1}/platform/1/cluster/config'.format(host, port)
-    config = requests_with_session(session, url)
-    return config['onefs_version']['release'].strip('v')
-
-
-def onefs_papi_version(host, port, session):
-    """Query cluster for latest PAPI version."""
-    url = 'https://{0}:{1}/platform/latest'.format(host, port)
-    try:
-        return requests_with_session(session,url)['latest']
-    except KeyError:
-        # latest handler did not exist before API version 3
-        return '2'
-
-
 def isi_props_to_swagger_params(isi_props, param_type):
     """Convert isi properties to Swagger parameters."""
     if not isi_props:
@@ -516,43 +521,147 @@ def get_object_def(obj_name):
     """Lookup object definition."""
     cur_obj = SWAGGER_DEFS[obj_name]
     if 'allOf' in cur_obj:
-        ref_obj_name = os.path.basename(cur_obj['allOf'][0]['$ref'])
-        ref_obj = get_object_def(ref_obj_name)
-
-        full_obj_def = {}
-        full_obj_def['properties'] = cur_obj['allOf'][-1]['properties'].copy()
-        full_obj_def['properties'].update(ref_obj['properties'])
-        if 'required' in cur_obj['allOf'][-1]:
-            full_obj_def['required'] = list(cur_obj['allOf'][-1]['required'])
-        if 'required' in ref_obj:
-            try:
-                full_obj_def['required'].extend(ref_obj['required'])
-                # eliminate dups
-                full_obj_def['required'] = list(set(full_obj_def['required']))
-            except KeyError:
-                full_obj_def['required'] = list(ref_obj['required'])
-        return full_obj_def
+        if obj_name in FLATTENED_DEFS:
+            FLATTENED_DEFS_STATS['hits'] += 1
+            return FLATTENED_DEFS[obj_name]
+        if obj_name in FLATTENED_DEFS_BUILT:
+            FLATTENED_DEFS_STATS['rebuilds'] += 1
+        else:
+            FLATTENED_DEFS_STATS['misses'] += 1
+            FLATTENED_DEFS_BUILT.add(obj_name)
+        FLATTENED_DEFS[obj_name] = flatten_object_def(cur_obj)
+        return FLATTENED_DEFS[obj_name]
     return cur_obj
 
 
+def flatten_object_def(cur_obj):
+    """Merge the properties and required lists of an 'allOf' definition."""
+    ref_obj_name = os.path.basename(cur_obj['allOf'][0]['$ref'])
+    ref_obj = get_object_def(ref_obj_name)
+
+    full_obj_def = {}
+    full_obj_def['properties'] = cur_obj['allOf'][-1]['properties'].copy()
+    full_obj_def['properties'].update(ref_obj['properties'])
+    if 'required' in cur_obj['allOf'][-1]:
+        full_obj_def['required'] = list(cur_obj['allOf'][-1]['required'])
+    if 'required' in ref_obj:
+        try:
+            full_obj_def['required'].extend(ref_obj['required'])
+            # eliminate dups
+            full_obj_def['required'] = list(set(full_obj_def['required']))
+        except KeyError:
+            full_obj_def['required'] = list(ref_obj['required'])
+    return full_obj_def
+
+
+def set_object_def(obj_name, obj_def):
+    """Add or replace an object definition in SWAGGER_DEFS."""
+    if obj_name in SWAGGER_DEFS:
+        # a changed entry may be the base of any flattened or indexed
+        # definition, so start both over
+        invalidate_object_defs()
+    SWAGGER_DEFS[obj_name] = obj_def
+
+
+def invalidate_object_defs():
+    """Drop the flattened definitions cache and the fingerprint index."""
+    FLATTENED_DEFS.clear()
+    SWAGGER_DEFS_INDEX.clear()
+    del SWAGGER_DEFS_INDEXED[:]
+
+
+def remove_added_object_defs(num_defs):
+    """
+    Remove the definitions added to SWAGGER_DEFS after the first num_defs,
+    along with their fingerprint index and flattened cache entries. The
+    definitions before them can not be based on them, so their entries
+    stay valid.
+    """
+    added_obj_names = list(itertools.islice(SWAGGER_DEFS, num_defs, None))
+    for obj_name in SWAGGER_DEFS_INDEXED[num_defs:]:
+        fingerprint = schema_fingerprint(
+            get_object_def(obj_name)['properties'])
+        obj_names = SWAGGER_DEFS_INDEX.get(fingerprint, [])
+        if obj_name not in obj_names:
+            # modified after it was indexed
+            invalidate_object_defs()
+            break
+        obj_names.remove(obj_name)
+        if not obj_names:
+            del SWAGGER_DEFS_INDEX[fingerprint]
+    else:
+        del SWAGGER_DEFS_INDEXED[num_defs:]
+    for obj_name in added_obj_names:
+        del SWAGGER_DEFS[obj_name]
+        FLATTENED_DEFS.pop(obj_name, None)
+        FLATTENED_DEFS_BUILT.discard(obj_name)
+
+
+def schema_fingerprint(value):
+    """Return a hashable copy of a JSON value that compares like the value.
+
+    Dicts become frozensets of (key, value) pairs and lists become tuples, so
+    two fingerprints are equal exactly when the values are equal.
+    """
+    if isinstance(value, dict):
+        return frozenset(
+            (key, schema_fingerprint(val)) for key, val in value.items())
+    if isinstance(value, list):
+        return tuple(schema_fingerprint(val) for val in value)
+    return value
+
+
+def index_obj_defs():
+    """Add SWAGGER_DEFS entries that are not yet indexed to the index."""
+    # SWAGGER_DEFS only ever grows, so the entries that are missing from the
+    # index are the ones added after the last indexed name.
+    if len(SWAGGER_DEFS) == len(SWAGGER_DEFS_INDEXED):
+        return
+    for obj_name in itertools.islice(
+            SWAGGER_DEFS, len(SWAGGER_DEFS_INDEXED), None):
+        fingerprint = schema_fingerprint(get_object_def(obj_name)['properties'])
+        SWAGGER_DEFS_INDEX.setdefault(fingerprint, []).append(obj_name)
+        SWAGGER_DEFS_INDEXED.append(obj_name)
+
+
+def find_obj_def_by_props(obj_props):
+    """Return name of the first definition with matching properties or None."""
+    index_obj_defs()
+    for obj_name in SWAGGER_DEFS_INDEX.get(schema_fingerprint(obj_props), []):
+        # guard against definitions that were modified after being indexed
+        if get_object_def(obj_name)['properties'] == obj_props:
+            return obj_name
+    return None
+
+
 def find_or_add_obj_def(new_obj_def, new_obj_name,
                         class_ext_post_fix):
     """Reuse existing object def if there's a match or add a new one.
 
     Return the 'definitions' path.
     """
+    if OBJ_DEF_CALLS is None:
+        return match_or_add_obj_def(
+            new_obj_def, new_obj_name, class_ext_post_fix)
+    obj_def_call = [deepcopy(new_obj_def), new_obj_name, class_ext_post_fix]
+    obj_def_call.append(match_or_add_obj_def(
+        new_obj_def, new_obj_name, class_ext_post_fix))
+    OBJ_DEF_CALLS.append(obj_def_call)
+    return obj_def_call[-1]
+
+
+def match_or_add_obj_def(new_obj_def, new_obj_name, class_ext_post_fix):
+    """Return the 'definitions' path of a matching or a new object def."""
     extended_obj_name = new_obj_name
-    for obj_name in SWAGGER_DEFS:
+    obj_name = find_obj_def_by_props(new_obj_def['properties'])
+    if obj_name is not None:
         existing_obj_def = get_object_def(obj_name)
-        if new_obj_def['properties'] == existing_obj_def['properties']:
-            if sorted(new_obj_def.get('required', [])) == \
-                    sorted(existing_obj_def.get('required', [])):
-                return '#/definitions/' + obj_name
-            else:
-                # the only difference is the list of required props, so use
-                # the existing_obj_def as the basis for an extended object.
-                extended_obj_name = obj_name
-                break
+        if sorted(new_obj_def.get('required', [])) == \
+                sorted(existing_obj_def.get('required', [])):
+            return '#/definitions/' + obj_name
+        # the only difference is the list of required props, so use
+        # the existing_obj_def as the basis for an extended object.
+        extended_obj_name = obj_name
 
     if extended_obj_name in SWAGGER_DEFS:
         # TODO at this point the subclass mechanism depends on the data models
@@ -601,9 +710,9 @@ def find_or_add_obj_def(new_obj_def, new_obj_name,
 
         while new_obj_name in SWAGGER_DEFS:
             new_obj_name += class_ext_post_fix
-        SWAGGER_DEFS[new_obj_name] = extended_obj_def
+        set_object_def(new_obj_name, extended_obj_def)
     else:
-        SWAGGER_DEFS[new_obj_name] = new_obj_def
+        set_object_def(new_obj_name, new_obj_def)
     return '#/definitions/' + new_obj_name
 
 
@@ -1034,6 +1143,125 @@ def parse_path_params(end_point_path):
     return params
 
 
+
+def end_point_names(base_url, base_end_point_path, item_end_point_path):
+    """
+    Return the API name, object namespace, object name and Swagger path of a
+    (<collection-uri>, <single-item-uri>) end point pair.
+    """
+    if base_end_point_path is None:
+        tmp_base_endpoint_path = to_swagger_end_point(
+            os.path.dirname(item_end_point_path))
+        swagger_path = base_url + tmp_base_endpoint_path
+        api_name, obj_namespace, obj_name = end_point_path_to_api_obj_name(
+            tmp_base_endpoint_path)
+    else:
+        api_name, obj_namespace, obj_name = end_point_path_to_api_obj_name(
+            base_end_point_path)
+        swagger_path = base_url + to_swagger_end_point(base_end_point_path)
+    return api_name, obj_namespace, obj_name, swagger_path
+
+
+def item_end_point_to_swagger_path(api_name, obj_namespace, obj_name,
+                                   swagger_path, item_end_point_path,
+                                   item_resp_json):
+    """
+    Convert an item end point ?describe document.
+    Return the Swagger path key and the Swagger path object.
+    """
+    # next do the item PUT (i.e. update), DELETE, and GET because the
+    # GET seems to be a limited version of the base path GET so the
+    # subclassing works correct when done in this order
+    singular_obj_postfix, item_input_type = parse_path_params(
+        os.path.basename(item_end_point_path))[0]
+    extra_path_params = parse_path_params(
+        os.path.dirname(item_end_point_path))
+    item_path_url, item_path = isi_item_to_swagger_path(
+        api_name, obj_namespace, obj_name, item_resp_json,
+        singular_obj_postfix, item_input_type,
+        extra_path_params)
+
+    if 'HEAD_args' in item_resp_json:
+        log.warning('HEAD_args in: %s', item_end_point_path)
+
+    return swagger_path + item_path_url, item_path
+
+
+def base_end_point_to_swagger_path(api_name, obj_namespace, obj_name,
+                                   swagger_path, base_end_point_path,
+                                   base_resp_json):
+    """
+    Convert a base end point ?describe document.
+    Return the Swagger path key and the Swagger path object, the key is None
+    if the end point has no operations.
+    """
+    base_path_params = parse_path_params(base_end_point_path)
+    base_path = {}
+    # start with base path POST because it defines the base
+    # creation object model
+    if 'POST_args' in base_resp_json:
+        if base_end_point_path in MISSING_POST_RESPONSE:
+            base_resp_json['POST_output_schema'] = {}
+            log.warning("Removed invalid POST response schema")
+
+        base_path = isi_post_to_swagger_path(
+            api_name, obj_namespace, obj_name, base_resp_json,
+            base_path_params)
+
+    if 'GET_args' in base_resp_json:
+        get_base_path = isi_get_to_swagger_path(
+            api_name, obj_namespace, obj_name, base_resp_json,
+            base_path_params)
+        base_path.update(get_base_path)
+
+    if 'PUT_args' in base_resp_json:
+        put_base_path = isi_put_to_swagger_path(
+            api_name, obj_namespace, obj_name, base_resp_json,
+            base_path_params)
+        base_path.update(put_base_path)
+
+    if 'DELETE_args' in base_resp_json:
+        del_base_path = isi_delete_to_swagger_path(
+            api_name, obj_namespace, obj_name, base_resp_json,
+            base_path_params)
+        base_path.update(del_base_path)
+
+    if 'HEAD_args' in base_resp_json:
+        log.warning('HEAD_args in: %s', base_end_point_path)
+
+    if not base_path:
+        return None, base_path
+    return swagger_path, base_path
+
+
+def convert_end_point(conversion_record, conversion_cache, end_point_path,
+                      end_point_pair, digest, swagger_paths, print_traceback,
+                      to_swagger_path, *args):
+    """
+    Convert one end point with to_swagger_path(*args) into swagger_paths,
+    recording the conversion if conversion_record is not None.
+    Return None on success or the error message on failure.
+    """
+    begin_conversion(conversion_record)
+    path_key = None
+    error = None
+    try:
+        path_key, path_obj = to_swagger_path(*args)
+        if path_key is not None:
+            swagger_paths[path_key] = path_obj
+    except (KeyError, TypeError, RuntimeError) as err:
+        path_key = None
+        error = '{}: {}'.format(type(err).__name__, err)
+        log.error('Caught exception processing: %s', end_point_path)
+        log.error(error)
+        if print_traceback:
+            traceback.print_exc(file=sys.stderr)
+    end_conversion(
+        conversion_record, conversion_cache, end_point_path, end_point_pair,
+        digest, path_key, error, swagger_paths)
+    return error
+
+
 def get_endpoint_paths(source_node_or_cluster, port, base_url, session,
                        exclude_end_points, cached_schemas):
     """
@@ -1046,458 +1274,955 @@ def get_endpoint_paths(source_node_or_cluster, port, base_url, session,
     if 'directory' not in cached_schemas:
         desc_list_parms = {'describe': '', 'json': '', 'list': ''}
         url = 'https://' + source_node_or_cluster + ':' + port + base_url
-        resp = requests_with_session(
+        resp = common_resources.requests_with_session(
             session, url, params=desc_list_parms)
+        if isinstance(session, common_resources.ClusterNodes):
+            session.check_consistency(
+                url, desc_list_parms, resp, 'directory')
         end_point_list_json = resp['directory']
-        cached_schemas['directory'] = end_point_list_json
+        end_point_paths = common_resources.get_endpoint_paths(
+            end_point_list_json, exclude_end_points)
+        # the snapshot only lists the end points it holds
+        cached_schemas['directory'] = common_resources.selected_directory(
+            end_point_list_json, end_point_paths, exclude_end_points)
     else:
         end_point_list_json = cached_schemas['directory']
-    # calls get_endpoint_paths from common_resources
-    return common_resources.get_endpoint_paths(end_point_list_json, exclude_end_points)
+        # calls get_endpoint_paths from common_resources
+        end_point_paths = common_resources.get_endpoint_paths(
+            end_point_list_json, exclude_end_points)
+    if isinstance(exclude_end_points, common_resources.EndPointSelector):
+        common_resources.log_unmatched_rules(
+            exclude_end_points, end_point_list_json)
+    return end_point_paths
+
+
+def fetch_end_point_descriptions(source_node_or_cluster, port, base_url,
+                                 session, end_point_paths, concurrency,
+                                 adaptive=None):
+    """
+    Fetches the ?describe&json documents of every base and item end point in
+    end_point_paths using a pool of concurrency worker threads that share the
+    authenticated session, of which as many as the AdaptiveConcurrency
+    adaptive allows have a request in flight.
+    Returns a dict of end point path -> parsed ?describe response.
+    """
+    desc_parms = {'describe': '', 'json': ''}
+    # let every worker keep its own connection to the cluster
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=1, pool_maxsize=concurrency)
+    session.mount('https://', adapter)
 
+    def fetch(end_point_path):
+        url = 'https://{}:{}{}{}'.format(
+            source_node_or_cluster, port, base_url, end_point_path)
+        return common_resources.requests_with_session(
+            session, url, desc_parms, adaptive)
 
-def resolve_schema_issues(definition_name, isi_schema,
-                          required_props, is_response_object):
-    """Correct invalid PAPI schemas."""
-    props = isi_schema['properties']
-    # issue pf - 117082 [list_sync_jobs throwing exception when SyncIQ jobs other than copy or sync are present]
-    if definition_name.startswith('SyncJobs'):
-        if props['jobs']['items']['properties']['policy']['properties']['action']['enum'] == ['copy', 'sync']:
-            props['jobs']['items']['properties']['policy']['properties']['action']['enum'] = ["none", "copy", "move",
-                                                                                              "remove", "sync",
-                                                                                              "allow_write",
-                                                                                              "allow_write_revert",
-                                                                                              "resync_prep",
-                                                                                              "resync_prep_domain_mark",
-                                                                                              "resync_prep_restore",
-                                                                                              "resync_prep_finalize",
-                                                                                              "resync_prep_commit",
-                                                                                              "snap_revert_domain_mark",
-                                                                                              "synciq_domain_mark",
-                                                                                              "worm_domain_mark"]
-    # Issue #12: Correct misspellings
-    if definition_name == 'DebugStatsUnknown':
-        if 'descriprion' in isi_schema:
-            isi_schema['description'] = isi_schema['descriprion']
-            del isi_schema['descriprion']
-            log.warning("Found 'description' misspelled as 'descriprion'")
-    # Issue #13: Correct properties schema
-    elif definition_name == 'StatisticsOperation':
-        if 'operations' in props:
-            operations = props['operations'][0]['operation']
-            if operations['required']:
-                isi_schema['required'] = True
-            props['operation'] = operations
-            del props['operations']
-            log.warning("Replace 'operations' property with 'operation'")
-    elif (definition_name.startswith('StoragepoolNodepool') or
-          definition_name.startswith('StoragepoolStoragepool')):
-        if 'health_flags' in isi_schema:
-            props['health_flags'] = isi_schema['health_flags']
-            del isi_schema['health_flags']
-            log.warning("Move 'health_flags' property under 'properties'")
-    elif definition_name == 'EventEventgroupOccurrences':
-        if 'eventgroup-occurrences' in props:
-            props['eventgroups'] = props['eventgroup-occurrences']
-            del props['eventgroup-occurrences']
-            log.warning("Found 'eventgroups' as 'eventgroup-occurrences'")
-    # Issue #22: Correct naming of interface as interfaces
-    elif (definition_name == 'NetworkInterfaces' or
-          definition_name == 'PoolsPoolInterfaces'):
-        if 'interface' in props:
-            props['interfaces'] = props['interface']
-            del props['interface']
-            log.warning("Found 'interfaces' misspelled as 'interface'")
-    elif definition_name == 'HardeningStatusStatus':
-        if 'status_text' in props:
-            props['message'] = props['status_text']
-            del props['status_text']
-            log.warning("Found 'message' labeled as 'status_text'")
-    elif definition_name == 'NdmpLogsNode':
-        if 'logs:' in props:
-            props['logs'] = props['logs:']
-            del props['logs:']
-            log.warning("Found 'logs' misspelled as 'logs:'")
-    elif definition_name == 'StatisticsHistoryStat':
-        if 'resolution' not in props:
-            props['resolution'] = {'type': 'integer'}
-            log.warning("Added missing 'resolution' property")
-    elif definition_name == 'EventCategory':
-        if 'category_name' in props and 'category_description' in props:
-            props['id_name'] = props['category_name']
-            del props['category_name']
-            props['name'] = props['category_description']
-            del props['category_description']
-            props['id']['type'] = 'string'
-            log.warning("Found event category properties mislabeled")
-    elif definition_name.startswith('EventEventlist'):
-        if 'eventlist' in props:
-            props['eventlists'] = props['eventlist']
-            del props['eventlist']
-            log.warning("Found 'eventlists' mislabeled as 'eventlist'")
-        if 'event_id' in props:
-            props['event'] = props['event_id']
-            del props['event_id']
-            log.warning("Found 'event' mislabeled as 'event_id'")
-        if (definition_name == 'EventEventlistsEventlistItemEvent' or
-                definition_name == 'EventEventlistEvent'):
-            if 'lnn' not in props and 'resolve_time' not in props:
-                props['lnn'] = {'type': 'integer'}
-                props['resolve_time'] = {'type': 'integer'}
-                log.warning("Found 'lnn' and 'resolve_time' props missing")
-    elif definition_name == 'EventChannels':
-        if 'alert-conditions' in props:
-            props['channels'] = props['alert-conditions']
-            del props['alert-conditions']
-            log.warning("Found 'channels' mislabeled as 'alert-conditions'")
-    elif definition_name == 'EventSettings':
-        if 'settings' not in props and 'maintenance' in props:
-            isi_schema['properties'] = {'settings': isi_schema.copy()}
-            log.warning("Found missing event 'settings' property")
-    elif definition_name == 'SmbShares' and 'settings' in props:
-        props['shares'] = {
-            'items': props['settings'], 'minItems': 0, 'type': 'array'}
-        del props['settings']
-        log.warning("Found 'shares' mislabeled as 'settings'")
-    elif (definition_name.startswith('SmbShares') or
-          definition_name.startswith('NfsExports')):
-        if 'resume' in props and 'total' in props and 'digest' not in props:
-            props['digest'] = {'type': 'string'}
-            log.warning("Found missing 'digest' property")
-    elif definition_name == 'NfsCheck':
-        if 'messages' in props:
-            props['message'] = props['messages']
-            del props['messages']
-            log.warning("Found 'mesage' mislabeled as 'messages'")
-    elif definition_name.startswith('SmbLogLevelFilters'):
-        if 'resume' in props and 'total' in props:
-            del props['resume']
-            del props['total']
-            log.warning("Removing invalid 'resume' and 'total' properties")
-    elif definition_name == 'NdmpUsers':
-        if 'id' in props and 'name' in props:
-            props['users'] = {
-                'items': {'properties': props.copy()},
-                'type': 'array'
+    end_points = [end_point_path
+                  for end_point_tuple in end_point_paths
+                  for end_point_path in end_point_tuple
+                  if end_point_path is not None]
+    start_time = time.time()
+    with futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        describe_docs = dict(
+            zip(end_points, executor.map(fetch, end_points)))
+    log.info('Fetched %s end point descriptions in %.2f seconds.',
+             len(describe_docs), time.time() - start_time)
+    return describe_docs
+
+
+class ConversionRecordEncoder(JSONEncoder):
+    """Encode the byte string patterns found in converted schemas."""
+
+    def default(self, value):
+        if isinstance(value, bytes):
+            return {'$bytes': value.decode('latin-1')}
+        return super(ConversionRecordEncoder, self).default(value)
+
+
+def decode_conversion_record_obj(obj):
+    """Decode the byte strings encoded by ConversionRecordEncoder."""
+    if len(obj) == 1 and '$bytes' in obj:
+        return obj['$bytes'].encode('latin-1')
+    return obj
+
+
+def describe_digest(isi_desc_json):
+    """Return the content hash of an end point ?describe document."""
+    return hashlib.sha1(json.dumps(
+        isi_desc_json, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def generator_digest(defs_file, fixups_file=schema_fixups.FIXUPS_FILE):
+    """
+    Return the hash of everything besides the ?describe documents that
+    affects the conversion of an end point: the generator code, its schema
+    fixup rules and the pre-built definitions.
+    """
+    # other differences between runs, e.g. the PAPI version trimming
+    # CreateResponse, only show up in SWAGGER_DEFS and are caught when a
+    # recorded conversion is replayed
+    digest = hashlib.sha1()
+    for file_name in (__file__, common_resources.__file__,
+                      schema_fixups.__file__, fixups_file, defs_file):
+        with open(file_name, 'rb') as source:
+            digest.update(source.read())
+    return digest.hexdigest()
+
+
+def load_conversion_record(spec_file, generator):
+    """
+    Loads a spec written by a previous run along with its conversion record.
+    Returns the recorded end point conversions and the spec paths, or
+    (None, None) if there is no usable record.
+    """
+    record_file = spec_file + CONVERSION_RECORD_SUFFIX
+    if not os.path.exists(record_file):
+        log.warning('No conversion record %s, converting all end points',
+                    record_file)
+        return None, None
+    with open(record_file, 'r') as record:
+        conversion_record = json.loads(
+            record.read(), object_hook=decode_conversion_record_obj)
+    if conversion_record['generator'] != generator:
+        log.warning(('Conversion record %s was built by a different '
+                     'generator, converting all end points'), record_file)
+        return None, None
+    with open(spec_file, 'r') as spec:
+        previous_paths = json.loads(spec.read())['paths']
+    return conversion_record['end_points'], previous_paths
+
+
+def write_conversion_record(spec_file, generator, end_points):
+    """Write the conversion record of a spec for later --incremental runs."""
+    with open(spec_file + CONVERSION_RECORD_SUFFIX, 'w') as record:
+        record.write(json.dumps(
+            {'generator': generator, 'end_points': end_points},
+            cls=ConversionRecordEncoder, sort_keys=True))
+
+
+def begin_conversion(conversion_record):
+    """Start recording the definitions added by an end point conversion."""
+    global OBJ_DEF_CALLS
+    if conversion_record is not None:
+        OBJ_DEF_CALLS = []
+
+
+def end_conversion(conversion_record, conversion_cache, end_point_path,
+                   end_point_pair, digest, path, error, swagger_paths):
+    """
+    Add the recorded end point conversion to the conversion record and to
+    the conversion cache.
+    """
+    global OBJ_DEF_CALLS
+    if conversion_record is None:
+        return
+    end_point_record = {
+        'pair': end_point_pair, 'hash': digest, 'calls': OBJ_DEF_CALLS,
+        'path': path, 'error': error}
+    conversion_record[end_point_path] = end_point_record
+    OBJ_DEF_CALLS = None
+    if conversion_cache is not None:
+        conversion_cache.put(
+            end_point_path, end_point_record,
+            swagger_paths[path] if path is not None else None)
+
+
+def replay_conversion(end_point_record):
+    """
+    Repeats the find_or_add_obj_def calls of a recorded conversion without
+    converting the ?describe document again. The conversion only holds if
+    every call still resolves to the recorded definition; otherwise the
+    definitions added by the replay are removed again and False is returned.
+    """
+    global OBJ_DEF_CALLS
+    obj_def_calls, OBJ_DEF_CALLS = OBJ_DEF_CALLS, None
+    num_defs = len(SWAGGER_DEFS)
+    try:
+        for obj_def, obj_name, class_ext_post_fix, obj_ref in \
+                end_point_record['calls']:
+            # find_or_add_obj_def modifies the top level of its input
+            obj_def = dict(obj_def)
+            if 'required' in obj_def:
+                obj_def['required'] = list(obj_def['required'])
+            if find_or_add_obj_def(
+                    obj_def, obj_name, class_ext_post_fix) != obj_ref:
+                remove_added_object_defs(num_defs)
+                return False
+        return True
+    finally:
+        OBJ_DEF_CALLS = obj_def_calls
+
+
+def reuse_conversion(previous_record, previous_paths, conversion_cache,
+                     conversion_record, end_point_path, end_point_pair, digest,
+                     swagger_paths):
+    """
+    Carries over the previous conversion of an end point whose ?describe
+    document and definition dependencies are unchanged, taken from the
+    --incremental record or from the conversion cache.
+    Returns the reused end point record, or None if the end point has to be
+    converted.
+    """
+    end_point_record = path_obj = None
+    if previous_record is not None and end_point_path in previous_record:
+        end_point_record = previous_record[end_point_path]
+        path = end_point_record['path']
+        if (end_point_record['hash'] != digest or
+                end_point_record['pair'] != end_point_pair or
+                (path is not None and path not in previous_paths)):
+            end_point_record = None
+        elif path is not None:
+            path_obj = previous_paths[path]
+    from_cache = end_point_record is None and conversion_cache is not None
+    if from_cache:
+        end_point_record, path_obj = conversion_cache.get(
+            end_point_path, end_point_pair, digest)
+    if end_point_record is None or not replay_conversion(end_point_record):
+        return None
+    if end_point_record['path'] is not None:
+        swagger_paths[end_point_record['path']] = path_obj
+    conversion_record[end_point_path] = end_point_record
+    if conversion_cache is not None and not from_cache:
+        conversion_cache.put(end_point_path, end_point_record, path_obj)
+    return end_point_record
+
+
+class ConversionCache(object):
+    """
+    On-disk cache of end point conversions, keyed by the hash of the
+    generator, the end point and its ?describe document. Entries are files
+    under cache_dir; once they add up to more than max_size bytes the least
+    recently used ones are removed.
+    """
+
+    def __init__(self, cache_dir, generator, max_size):
+        self.cache_dir = cache_dir
+        self.generator = generator
+        self.max_size = max_size
+        self.stats = {'hits': 0, 'misses': 0, 'stored': 0, 'evicted': 0}
+
+    def entry_file(self, end_point_path, end_point_pair, digest):
+        """Return the path of the cache entry of an end point conversion."""
+        key = hashlib.sha1(json.dumps(
+            [self.generator, end_point_path, end_point_pair, digest]
+        ).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], key + '.json')
+
+    def get(self, end_point_path, end_point_pair, digest):
+        """Return the cached end point record and path object, if any."""
+        entry_file = self.entry_file(end_point_path, end_point_pair, digest)
+        try:
+            with open(entry_file, 'r') as entry:
+                cache_entry = json.loads(
+                    entry.read(), object_hook=decode_conversion_record_obj)
+            # mark the entry as recently used
+            os.utime(entry_file, None)
+        except (IOError, OSError, ValueError):
+            self.stats['misses'] += 1
+            return None, None
+        self.stats['hits'] += 1
+        return cache_entry['record'], cache_entry['path']
+
+    def put(self, end_point_path, end_point_record, path_obj):
+        """Store an end point conversion."""
+        entry_file = self.entry_file(
+            end_point_path, end_point_record['pair'], end_point_record['hash'])
+        entry_dir = os.path.dirname(entry_file)
+        if not os.path.isdir(entry_dir):
+            os.makedirs(entry_dir)
+        # write to a temporary file first so that concurrent runs never
+        # read a partial entry
+        tmp_file = '{}.{}.tmp'.format(entry_file, os.getpid())
+        with open(tmp_file, 'w') as entry:
+            entry.write(json.dumps(
+                {'record': end_point_record, 'path': path_obj},
+                cls=ConversionRecordEncoder, sort_keys=True))
+        os.replace(tmp_file, entry_file)
+        self.stats['stored'] += 1
+
+    def evict(self):
+        """Remove least recently used entries until under max_size."""
+        entries = []
+        total_size = 0
+        for dir_path, _, file_names in os.walk(self.cache_dir):
+            for file_name in file_names:
+                if not file_name.endswith('.json'):
+                    continue
+                entry_file = os.path.join(dir_path, file_name)
+                entry_stat = os.stat(entry_file)
+                entries.append((entry_stat.st_mtime, entry_stat.st_size,
+                                entry_file))
+                total_size += entry_stat.st_size
+        for _, entry_size, entry_file in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            os.remove(entry_file)
+            total_size -= entry_size
+            self.stats['evicted'] += 1
+
+
+
+def end_point_family(base_end_point_path, item_end_point_path):
+    """Return the API family of an end point pair, e.g. 'protocols'."""
+    return (base_end_point_path or item_end_point_path).split('/')[2]
+
+
+def init_shard_worker(initial_defs, fixups):
+    """
+    Set up a --processes worker with the definitions to start from and the
+    schema fixup rules of the main process.
+    """
+    global SHARD_INITIAL_DEFS, SCHEMA_FIXUPS
+    SHARD_INITIAL_DEFS = initial_defs
+    SCHEMA_FIXUPS = fixups
+    # errors are logged by the main process when it merges the results
+    log.getLogger().setLevel(log.CRITICAL)
+
+
+def convert_end_point_group(end_point_group):
+    """
+    Converts a group of end points in a --processes worker, starting from
+    the definitions the main process had before conversion started.
+    Returns the conversion record and the Swagger paths of the group.
+    """
+    base_url, end_points = end_point_group
+    SWAGGER_DEFS.clear()
+    SWAGGER_DEFS.update(deepcopy(SHARD_INITIAL_DEFS))
+    invalidate_object_defs()
+    conversion_record = {}
+    swagger_paths = {}
+    for (base_end_point_path, item_end_point_path,
+         base_resp_json, item_resp_json) in end_points:
+        api_name, obj_namespace, obj_name, swagger_path = end_point_names(
+            base_url, base_end_point_path, item_end_point_path)
+        end_point_pair = [base_end_point_path, item_end_point_path]
+        if item_end_point_path is not None:
+            convert_end_point(
+                conversion_record, None, item_end_point_path, end_point_pair,
+                describe_digest(item_resp_json), swagger_paths, False,
+                item_end_point_to_swagger_path, api_name, obj_namespace,
+                obj_name, swagger_path, item_end_point_path, item_resp_json)
+        if base_end_point_path is not None:
+            convert_end_point(
+                conversion_record, None, base_end_point_path, end_point_pair,
+                describe_digest(base_resp_json), swagger_paths, False,
+                base_end_point_to_swagger_path, api_name, obj_namespace,
+                obj_name, swagger_path, base_end_point_path, base_resp_json)
+    return conversion_record, swagger_paths
+
+
+def convert_end_point_shards(base_url, end_point_paths, describe_docs,
+                             processes):
+    """
+    Converts the end points grouped by API family in a pool of worker
+    processes. The result is used like an --incremental record: the main
+    loop replays each conversion in the usual end point order and converts
+    the end point again wherever a definition resolves differently than in
+    its group, so the spec is the same as that of a sequential run.
+    Returns the conversion record and the Swagger paths of all groups.
+    """
+    end_point_groups = OrderedDict()
+    for base_end_point_path, item_end_point_path in end_point_paths:
+        family = end_point_family(base_end_point_path, item_end_point_path)
+        end_point_groups.setdefault(family, []).append((
+            base_end_point_path, item_end_point_path,
+            describe_docs.get(base_end_point_path),
+            describe_docs.get(item_end_point_path)))
+    # start the largest groups first
+    end_point_groups = sorted(
+        end_point_groups.values(), key=len, reverse=True)
+    pool = multiprocessing.Pool(
+        processes, init_shard_worker, (SWAGGER_DEFS, SCHEMA_FIXUPS))
+    try:
+        results = pool.map(
+            convert_end_point_group,
+            [(base_url, end_points) for end_points in end_point_groups],
+            chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+    shard_record = {}
+    shard_paths = {}
+    for group_record, group_paths in results:
+        shard_record.update(group_record)
+        shard_paths.update(group_paths)
+    log.info('Converted %s end points in %s groups with %s processes.',
+             len(shard_record), len(end_point_groups), processes)
+    return shard_record, shard_paths
+
+
+def definition_refs(value):
+    """Return the names of the definitions that value refers to."""
+    names = set()
+    stack = [value]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            ref = node.get('$ref')
+            if isinstance(ref, str) and ref.startswith('#/definitions/'):
+                names.add(ref[len('#/definitions/'):])
+            stack.extend(node.values())
+        elif isinstance(node, list):
+            stack.extend(node)
+    return names
+
+
+def slim_spec(swagger_json, api_families, operation_ids):
+    """
+    Reduce a spec to the operations of api_families, e.g. ['quota'], which
+    are matched against the operation tags regardless of case, and the
+    operations named in operation_ids. Paths without operations left are
+    dropped, and so is every definition the kept operations do not refer
+    to, directly or through other definitions. The kept definitions keep
+    the names they have in the full spec.
+    """
+    api_families = set(family.lower() for family in api_families)
+    operation_ids = set(operation_ids)
+    found = set()
+    slim_paths = {}
+    for path_name, path in swagger_json['paths'].items():
+        slim_path = {}
+        for key, operation in path.items():
+            if key == 'parameters' or key.startswith('x-'):
+                slim_path[key] = operation
+                continue
+            tags = set(tag.lower() for tag in operation.get('tags', []))
+            selected = (tags & api_families) | (
+                {operation.get('operationId')} & operation_ids)
+            if selected:
+                slim_path[key] = operation
+                found.update(selected)
+        if any(key != 'parameters' and not key.startswith('x-')
+               for key in slim_path):
+            slim_paths[path_name] = slim_path
+    missing = (api_families | operation_ids) - found
+    if missing:
+        log.warning('No operations found for %s', ', '.join(sorted(missing)))
+
+    definitions = swagger_json['definitions']
+    kept = set()
+    pending = definition_refs(slim_paths)
+    while pending:
+        name = pending.pop()
+        if name in kept or name not in definitions:
+            continue
+        kept.add(name)
+        pending.update(definition_refs(definitions[name]))
+    log.info('Slim spec keeps %s of %s paths and %s of %s definitions.',
+             len(slim_paths), len(swagger_json['paths']), len(kept),
+             len(definitions))
+    swagger_json['paths'] = slim_paths
+    swagger_json['definitions'] = dict(
+        (name, definitions[name]) for name in kept)
+
+
+def write_json(output_file, value, cls=JSONEncoder, schema_pool=None):
+    """
+    Write value to output_file as sorted, indented JSON, the same text as
+    json.dumps(value, cls=cls, sort_keys=True, indent=4,
+    separators=(',', ': ')) but encoded piece by piece so that the text of
+    the whole spec or snapshot never has to be held in memory.
+    schema_pool is a dict shared by the writes of several specs, see
+    write_pooled_json.
+    """
+    encoder = cls(sort_keys=True, indent=4, separators=(',', ': '))
+    if schema_pool is not None and isinstance(value, dict):
+        write_pooled_json(output_file, value, cls, encoder, schema_pool)
+        return
+    chunks = []
+    chunks_size = 0
+    for chunk in encoder.iterencode(value):
+        chunks.append(chunk)
+        chunks_size += len(chunk)
+        if chunks_size >= JSON_WRITE_CHUNK_SIZE:
+            output_file.write(''.join(chunks))
+            chunks = []
+            chunks_size = 0
+    output_file.write(''.join(chunks))
+
+
+def write_pooled_json(output_file, value, cls, encoder, schema_pool):
+    """
+    Write a dict like write_json, interning the indented text of every value
+    two levels down, e.g. each path and definition of a spec, in
+    schema_pool under the value's compact encoding. The compact encoding is
+    done by the C encoder, so a schema that is the same in several specs is
+    only encoded with indentation, in pure Python, once.
+    """
+    compact_encoder = cls(sort_keys=True)
+    separator = '{\n    '
+    for key in sorted(value):
+        output_file.write(separator + json.dumps(key) + ': ')
+        separator = ',\n    '
+        if not isinstance(value[key], dict) or not value[key]:
+            output_file.write(
+                encoder.encode(value[key]).replace('\n', '\n    '))
+            continue
+        item_separator = '{\n        '
+        for item_key in sorted(value[key]):
+            item = value[key][item_key]
+            compact_text = compact_encoder.encode(item)
+            text = schema_pool.get(compact_text)
+            if text is None:
+                text = schema_pool[compact_text] = encoder.encode(item)
+            # newlines only occur between the tokens of encoded JSON, so
+            # they can be indented by another two levels
+            output_file.write(item_separator + json.dumps(item_key) + ': ' +
+                              text.replace('\n', '\n        '))
+            item_separator = ',\n        '
+        output_file.write('\n    }')
+    output_file.write('\n}' if value else '{}')
+
+
+class ConversionProfile(object):
+    """
+    Timing of a generator run for --profile: the time spent fetching and
+    converting each end point and the calls of the PROFILED_FUNCTIONS,
+    which are only wrapped with timers while profiling so that a normal
+    run is not slowed down. Nested calls of a function, e.g. recursive
+    isi_schema_to_swagger_object calls, count towards its calls but not
+    again towards its time.
+    """
+
+    def __init__(self, top, stats_file):
+        self.top = top
+        self.stats_file = stats_file
+        self.end_point_times = {}
+        self.function_times = {}
+        self.profiler = None
+
+    def start(self):
+        """Wrap the PROFILED_FUNCTIONS and start cProfile if requested."""
+        module_globals = globals()
+        for func_name in PROFILED_FUNCTIONS:
+            module_globals[func_name] = self.timed(
+                func_name, module_globals[func_name])
+        if self.stats_file:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def timed(self, func_name, func):
+        """Return func recording its calls in function_times."""
+        func_times = self.function_times[func_name] = {
+            'calls': 0, 'seconds': 0.0, 'depth': 0}
+
+        def timed_func(*args, **kwargs):
+            func_times['calls'] += 1
+            func_times['depth'] += 1
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                func_times['depth'] -= 1
+                if not func_times['depth']:
+                    func_times['seconds'] += time.perf_counter() - start
+        return timed_func
+
+    def add_end_point(self, end_point_path, fetch_start, convert_start,
+                      convert_end):
+        """Record the fetch and conversion time of an end point."""
+        self.end_point_times[end_point_path] = (
+            convert_start - fetch_start, convert_end - convert_start)
+
+    def report(self):
+        """Print the slowest end points and functions."""
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.stats_file)
+        print('\n{:<64} {:>10} {:>10}'.format(
+            'End point', 'fetch ms', 'convert ms'))
+        for end_point_path, (fetch_time, convert_time) in sorted(
+                self.end_point_times.items(),
+                key=lambda item: sum(item[1]), reverse=True)[:self.top]:
+            print('{:<64} {:>10.2f} {:>10.2f}'.format(
+                end_point_path, fetch_time * 1000, convert_time * 1000))
+        print('\n{:<64} {:>10} {:>10}'.format('Function', 'calls', 'ms'))
+        for func_name, func_times in sorted(
+                self.function_times.items(),
+                key=lambda item: item[1]['seconds'], reverse=True)[:self.top]:
+            print('{:<64} {:>10} {:>10.2f}'.format(
+                func_name, func_times['calls'], func_times['seconds'] * 1000))
+        if self.stats_file:
+            print('\ncProfile statistics written to {}'.format(
+                self.stats_file))
+
+
+def misspelled_description(misspelling):
+    """Return a property handler correcting a misspelled 'description'."""
+    def fix_description(definition_name, prop_name, prop, props):
+        if misspelling in prop:
+            prop['description'] = prop[misspelling]
+            del prop[misspelling]
+            log.warning("Found 'description' misspelled as '%s'",
+                        misspelling)
+    return fix_description
+
+
+def fix_items_to_object(definition_name, prop_name, prop, props):
+    """Turn an array property whose items are an object into the object."""
+    if 'items' in prop:
+        prop['type'] = prop['items']['type']
+        prop['properties'] = prop['items']['properties']
+        del prop['items']
+        log.warning("Property '%s' is an object, not an array", prop_name)
+
+
+def fix_control_chars_pattern(definition_name, prop_name, prop, props):
+    """Replace the unsupported [:cntrl:] class in a path pattern."""
+    if 'pattern' in prop:
+        prop['pattern'] = prop["pattern"].replace(
+            "^((\\/[^\\/[:cntrl:]]+)(\\/?))*$", "^((\\/[^\\/]+)(\\/?))*$")
+        log.warning("Modified regex pattern")
+
+
+def fix_infinite_maximum(definition_name, prop_name, prop, props):
+    """Swagger-parser complains about 'Infinity', use the max float value."""
+    prop['maximum'] = 1.79769e+308
+    log.warning("Removing Infinity maximum: {}, {}".format(
+        definition_name, prop_name))
+
+
+# Issue #8: Remove invalid placement of required field
+@SCHEMA_VISITOR.handles(
+    ['StoragepoolStatusUnhealthyItem'], '/properties/health_flags')
+def fix_health_flags_required(definition_name, prop_name, prop, props):
+    if 'required' in prop['items']:
+        del prop['items']['required']
+        log.warning("Remove 'required' from array items")
+
+
+# Issue #9: Remove duplicate `delete_child`
+@SCHEMA_VISITOR.handles(
+    ['SmbSettingsGlobalSettingsAuditGlobalSaclItem',
+     'SmbSettingsGlobalAuditGlobalSaclItem'], '/properties/permission')
+def fix_duplicate_permission(definition_name, prop_name, prop, props):
+    if 'items' in prop and 'enum' in prop['items']:
+        prop['items']['enum'] = (
+            list(OrderedDict.fromkeys(prop['items']['enum'])))
+        log.warning("Remove duplicate 'delete_child' from enum")
+
+
+# Issue #10: Remove invalid required field
+@SCHEMA_VISITOR.handles(['Job*'], '/properties/*')
+def fix_job_items_required(definition_name, prop_name, prop, props):
+    if 'items' in prop and 'required' in prop['items']:
+        del prop['items']['required']
+        log.warning("Remove invalid 'required' field")
+
+
+# Issue #12: Correct misspellings
+SCHEMA_VISITOR.register(
+    ['AuthAccessAccessItem'], '/properties/id',
+    misspelled_description('descriptoin'))
+SCHEMA_VISITOR.register(
+    ['DebugStats*'], '/properties/*', misspelled_description('descriprion'))
+SCHEMA_VISITOR.register(
+    ['HealthcheckEvaluation*'], '/properties/run_status',
+    misspelled_description('desciption'))
+SCHEMA_VISITOR.register(
+    ['HealthcheckEvaluation*', '*HealthcheckChecklist'],
+    '/properties/delivery', misspelled_description('description:'))
+SCHEMA_VISITOR.register(
+    ['*Subnet*'], '/properties/sc_service_name',
+    misspelled_description('description:'))
+
+
+# Issue #14: Include hardware `devices` fields
+@SCHEMA_VISITOR.handles(['HardwareTapes'], '/properties/devices')
+def fix_tape_devices(definition_name, prop_name, prop, props):
+    if 'media_changers' in prop and 'tapes' in prop:
+        prop['type'] = 'object'
+        prop['description'] = 'Information of Tape/MC device'
+        prop['properties'] = {
+            'media_changers': {'items': prop['media_changers']},
+            'tapes': {'items': prop['tapes']}
+        }
+        del prop['media_changers']
+        del prop['tapes']
+        log.warning(("Move 'media_changers' and 'tapes' in 'devices'"
+                     "property to nested 'properties' object"))
+
+
+# Issue #15: Correct nested array schema
+@SCHEMA_VISITOR.handles(
+    ['EventEventgroupOccurrencesEventgroup'], '/properties/causes')
+def fix_causes_array(definition_name, prop_name, prop, props):
+    if 'items' not in prop['items']:
+        prop['items'] = prop['items']['type']
+        prop['type'] = 'array'
+        log.warning("Correct nested array schema in 'causes' property")
+
+
+# Remove custom `ignore_case` field
+@SCHEMA_VISITOR.handles(['EventAlertCondition*'], '/properties/*')
+def fix_ignore_case(definition_name, prop_name, prop, props):
+    if 'ignore_case' in prop:
+        del prop['ignore_case']
+    if 'items' in prop and 'ignore_case' in prop['items']:
+        del prop['items']['ignore_case']
+    log.warning("Remove custom 'ignore_case' field")
+
+
+@SCHEMA_VISITOR.handles(['HistogramStatByBreakout'], '/properties/data')
+def fix_histogram_data(definition_name, prop_name, prop, props):
+    if prop['type'] == 'array':
+        if 'properties' in prop:
+            del prop['properties']
+            prop['items'] = {
+                'type': 'array',
+                'items': {'type': 'integer'}
             }
-            del props['id']
-            del props['name']
-            log.warning("Move NDMP user properties into an array")
-    elif definition_name == 'SettingsMapping' and 'id' not in props:
-        if 'domain' in props and 'mapping' in props and 'type' in props:
-            props['id'] = {'type': 'string'}
-            log.warning("Added missing 'id' property")
-    elif definition_name == 'JobEvent' or definition_name == 'JobReport':
-        if ('fmt_type' not in props and 'raw_type' not in props
-                and 'value' in props):
-            props['fmt_type'] = {'type': 'string'}
-            props['raw_type'] = {'type': 'string'}
-            log.warning("Added missing 'fmt_type' and 'raw_type' properties")
-    elif definition_name == 'JobPolicies' and 'types' in props:
-        props['policies'] = props['types']
-        del props['types']
-        log.warning("Renamed 'types' property to 'policies'")
-
-    for prop_name, prop in list(props.items()):
-
-        # Issue #8: Remove invalid placement of required field
-        if (definition_name == 'StoragepoolStatusUnhealthyItem' and
-                prop_name == 'health_flags'):
-            if 'required' in prop['items']:
-                del prop['items']['required']
-                log.warning("Remove 'required' from array items")
-        # Issue #9: Remove duplicate `delete_child`
-        elif ((definition_name == (
-                'SmbSettingsGlobalSettingsAuditGlobalSaclItem')
-               or definition_name == 'SmbSettingsGlobalAuditGlobalSaclItem')
-              and prop_name == 'permission'):
-            if 'items' in prop and 'enum' in prop['items']:
-                prop['items']['enum'] = (
-                    list(OrderedDict.fromkeys(prop['items']['enum'])))
-                log.warning("Remove duplicate 'delete_child' from enum")
-        # Issue #10: Remove invalid required field
-        elif (definition_name.startswith('Job') and 'items' in prop and
-              'required' in prop['items']):
-            del prop['items']['required']
-            log.warning("Remove invalid 'required' field")
-        # Issue #12: Correct misspellings
-        elif definition_name == 'AuthAccessAccessItem' and prop_name == 'id':
-            if 'descriptoin' in prop:
-                prop['description'] = prop['descriptoin']
-                del prop['descriptoin']
-                log.warning("Found 'description' misspelled as 'descriptoin'")
-        elif definition_name.startswith('DebugStats'):
-            if 'descriprion' in prop:
-                prop['description'] = prop['descriprion']
-                del prop['descriprion']
-                log.warning("Found 'description' misspelled as 'descriprion'")
-        elif definition_name.startswith('HealthcheckEvaluation'):
-            if prop_name == 'run_status' and 'desciption' in prop:
-                prop['description'] = prop['desciption']
-                del prop['desciption']
-                log.warning("Found 'description' misspelled as 'desciption'")
-            if prop_name == 'delivery' and 'description:' in prop:
-                prop['description'] = prop['description:']
-                del prop['description:']
-                log.warning("Found 'description' misspelled as 'description:'")
-        elif definition_name.endswith('HealthcheckChecklist'):
-            if prop_name == 'delivery' and 'description:' in prop:
-                prop['description'] = prop['description:']
-                del prop['description:']
-                log.warning("Found 'description' misspelled as 'description:'")
-        elif 'Subnet' in definition_name:
-            if prop_name == 'sc_service_name' and 'description:' in prop:
-                prop['description'] = prop['description:']
-                del prop['description:']
-                log.warning("Found 'description' misspelled as 'description:'")
-        # Issue #14: Include hardware `devices` fields
-        elif definition_name == 'HardwareTapes' and prop_name == 'devices':
-            if 'media_changers' in prop and 'tapes' in prop:
-                prop['type'] = 'object'
-                prop['description'] = 'Information of Tape/MC device'
-                prop['properties'] = {
-                    'media_changers': {'items': prop['media_changers']},
-                    'tapes': {'items': prop['tapes']}
-                }
-                del prop['media_changers']
-                del prop['tapes']
-                log.warning(("Move 'media_changers' and 'tapes' in 'devices'"
-                             "property to nested 'properties' object"))
-        # Issue #15: Correct nested array schema
-        elif definition_name == 'EventEventgroupOccurrencesEventgroup':
-            if prop_name == 'causes' and 'items' not in prop['items']:
-                prop['items'] = prop['items']['type']
-                prop['type'] = 'array'
-                log.warning("Correct nested array schema in 'causes' property")
-        # Remove custom `ignore_case` field
-        elif definition_name.startswith('EventAlertCondition'):
-            if 'ignore_case' in prop:
-                del prop['ignore_case']
-            if 'items' in prop and 'ignore_case' in prop['items']:
-                del prop['items']['ignore_case']
-            log.warning("Remove custom 'ignore_case' field")
-        elif definition_name == 'HistogramStatByBreakout':
-            if prop_name == 'data' and prop['type'] == 'array':
-                if 'properties' in prop:
-                    del prop['properties']
-                    prop['items'] = {
-                        'type': 'array',
-                        'items': {'type': 'integer'}
-                    }
-                    log.warning("Correct 'data' properties array object")
-        elif definition_name.startswith('Ndmp'):
-            if prop['type'] == 'array' and 'properties' in prop:
-                prop['items'] = {
+            log.warning("Correct 'data' properties array object")
+
+
+@SCHEMA_VISITOR.handles(['Ndmp*'], '/properties/*')
+def fix_ndmp_array_properties(definition_name, prop_name, prop, props):
+    if prop['type'] == 'array' and 'properties' in prop:
+        prop['items'] = {
+            'type': 'object',
+            'properties': prop['properties']
+        }
+        del prop['properties']
+        log.warning("Move 'properties' into the 'items' object")
+
+
+@SCHEMA_VISITOR.handles(['SummaryProtocolStatsProtocol*'], '/properties/*')
+def fix_protocol_stats_protocol(definition_name, prop_name, prop, props):
+    if 'type' not in prop:
+        prop['properties'] = prop.copy()
+        for key in prop.keys():
+            if key not in ['properties']:
+                del prop[key]
+        prop['type'] = 'object'
+        log.warning("Move properties into the 'properties' object")
+    elif prop_name == 'protocol' and prop['type'] == 'array':
+        prop['type'] = 'object'
+        prop['properties'] = {
+            'name': {'type': 'string'},
+            'data': {
+                'type': 'array',
+                'items': {
                     'type': 'object',
-                    'properties': prop['properties']
-                }
-                del prop['properties']
-                log.warning("Move 'properties' into the 'items' object")
-        elif definition_name.startswith('SummaryProtocolStatsProtocol'):
-            if 'type' not in prop:
-                prop['properties'] = prop.copy()
-                for key in prop.keys():
-                    if key not in ['properties']:
-                        del prop[key]
-                prop['type'] = 'object'
-                log.warning("Move properties into the 'properties' object")
-            elif prop_name == 'protocol' and prop['type'] == 'array':
-                prop['type'] = 'object'
-                prop['properties'] = {
-                    'name': {'type': 'string'},
-                    'data': {
-                        'type': 'array',
-                        'items': {
-                            'type': 'object',
-                            'properties': prop['data'][0]
-                        }
-                    }
+                    'properties': prop['data'][0]
                 }
-                del prop['data']
-                log.warning("Restructure the 'protocol' property object")
-        elif definition_name == 'SummaryProtocolStats':
-            if prop_name == 'protocol-stats' and 'items' in prop:
-                prop['type'] = prop['items']['type']
-                prop['properties'] = prop['items']['properties']
-                del prop['items']
-                log.warning("'protocol-stats' is an object, not an array")
-        elif definition_name == 'HardwareFcportsNode':
-            if (prop_name == 'fcports' and prop['type'] == 'array' and
-                    'properties' in prop):
-                prop['items'] = prop['properties']
-                del prop['properties']
-                log.warning("Move 'fcports' array properties into 'items'")
-        # Issue #22: Remove invalid status enum
-        elif (definition_name == 'NetworkInterface' or
-              definition_name == 'PoolsPoolInterfacesInterface'):
-            if prop_name == 'status' and 'enum' in prop:
-                del prop['enum']
-                log.warning("Remove invalid 'status' enum")
-        elif (definition_name == 'NetworkDnscache' or
-              definition_name == 'NetworkExternal'):
-            if prop_name == 'settings' and 'items' in prop:
-                prop['type'] = prop['items']['type']
-                prop['properties'] = prop['items']['properties']
-                del prop['items']
-                log.warning("Property 'settings' is an object, not an array")
-        elif definition_name == 'HardeningStateState':
-            if prop_name == 'state' and 'Other' not in prop['enum']:
-                prop['enum'].append('Other')
-                log.warning("Hardening state missing 'Other' in enum")
-        elif definition_name.startswith('EventChannel'):
-            if prop_name == 'type' and 'heartbeat' not in prop['enum']:
-                prop['enum'].append('heartbeat')
-                log.warning("Include missing 'heartbeat' in enum")
-        elif definition_name == 'SmbLogLevelFiltersFilter':
-            if prop_name == 'level' and 'enum' in prop:
-                del prop['enum']
-                log.warning("Removing enum with duplicate values")
-        elif 'FileMatchingPattern' in definition_name:
-            if prop_name == 'operator' and 'enum' in prop:
-                del prop['enum']
-                log.warning("Removing enum with special characters")
-        elif definition_name.startswith('SnmpSettings'):
-            if prop_name == 'system_contact' and 'pattern' in prop:
-                prop['pattern'] = prop['pattern'].replace('{2,4}', '{2,7}')
-                log.warning("Modified restrictive regex pattern")
-        elif (definition_name.startswith('NodeDriveconfig') or
-              definition_name.startswith('ClusterNodeDrive')):
-            if 'default' in prop and prop['default'] == 'true':
-                prop['default'] = True
-                log.warning("Default 'true' value is a string, not a boolean")
-            if 'default' in prop and prop['default'] == '30':
-                prop['default'] = 30
-                log.warning("Default '30' value is a string, not a integer")
-        # protect against array out of bounds exception
-        # elif definition_name.startswith('UpgradeClusterCommittedFeatures'):
-        #    if 'bits' in prop_name:
-        #        del prop['maxItems']
-        # Swagger-parser complains about 'Infinity', replace with max float value
-        if (definition_name.find('QuotaQuota') != -1):
-            if prop_name == 'efficiency_ratio':
-                props['efficiency_ratio']['maximum'] = 1.79769e+308
-                log.warning("Removing Infinity maximum: {}".format(definition_name))
-            elif prop_name == 'reduction_ratio':
-                props['reduction_ratio']['maximum'] = 1.79769e+308
-                log.warning("Removing Infinity maximum: {}".format(definition_name))
-        if (definition_name.find('PerformanceSettings') != -1):
-            if ((prop_name == 'target_protocol_read_latency_usec') or
-                (prop_name == 'target_protocol_write_latency_usec')):
-                props[prop_name]['maximum'] = 1.79769e+308
-                log.warning("Removing Infinity maximum: {}, {}".format(definition_name, prop_name))
-            elif prop_name == 'target_protocol_write_latency_usec':
-                props['target_protocol_write_latency_usec']['maximum'] = 1.79769e+308
-                log.warning("Removing Infinity maximum: {}".format(definition_name))
-            elif prop_name == 'impact_multiplier':
-                props["impact_multiplier"]["properties"]["impact_high"]['maximum'] = 1.79769e+308
-                props["impact_multiplier"]["properties"]["impact_low"]['maximum'] = 1.79769e+308
-                props["impact_multiplier"]["properties"]["impact_unset"]['maximum'] = 1.79769e+308
-                props["impact_multiplier"]["properties"]["impact_medium"]['maximum'] = 1.79769e+308
-                log.warning("Removing Infinity maximum: {}".format(definition_name))
-        if (definition_name.find('PerformanceSettingsSettings') != -1):
-            if ((prop_name == 'target_protocol_read_latency_usec') or
-                (prop_name == 'target_protocol_write_latency_usec')):
-                props[prop_name]['maximum'] = 1.79769e+308
-                log.warning("Removing Infinity maximum: {}, {}".format(definition_name, prop_name))
-        # Issue 67: Regex fail on supportassist settings on primary contact while getting 
-        # details of Support Assist
-        if definition_name.startswith('SupportassistSettings') or definition_name.startswith('ConnectivitySettings'):
-            if prop_name == 'first_name' and 'pattern' in prop:
-                prop['pattern'] = prop['pattern'].replace( "[\\p{L}\\p{M}*\\-\\.\\' ]*", "[a-zA-Z]*[\\-\\.\\']*")
-                log.warning("Modified regex pattern")
-            elif prop_name == 'last_name' and 'pattern' in prop:
-                prop['pattern'] = prop['pattern'].replace("[\\p{L}\\p{M}*\\-\\.\\' ]*","[a-zA-Z]*[\\-\\.\\']*")
-                log.warning("Modified regex pattern")
-            elif prop_name == 'email':
-                if 'default' in prop:
-                    if prop['pattern'] == "^[a-zA-Z0-9._%-]+@([a-zA-Z0-9-]+\\.)+[a-zA-Z0-9]+$":
-                        del prop['default']
-                        log.warning("Deleted default value for email")
-            elif prop_name == 'phone':
-                if 'default' in prop:
-                    if prop['pattern'] == "([\\.\\-\\+\\/\\sxX]*([0-9]+|[\\(\\d+\\)])+)+":
-                        del prop['default']
-                        log.warning("Deleted default value for phone")
-            elif prop_name.__eq__("language"):
-                    props["language"] = "En"
-                    log.info("Modified language value")
-        # Issue 35 : Getting changelist entries fails if physical or size of file is > 4GB
-        if definition_name.startswith('ChangelistEntry'):
-            if prop_name == 'physical_size' and 'maximum' in prop:
-                del prop['maximum']
-                log.warning("Deleted maximum value for physical_size")
-            if prop_name == 'size' and 'maximum' in prop:
-                del prop['maximum']
-                log.warning("Deleted maximum value for size")
-        # Modifing/removing invalid regex patterns
-        if definition_name.startswith('EventChannel'):
-            if prop_name == 'custom_template' and 'pattern' in prop:
-                prop['pattern'] = prop["pattern"].replace("^((\\/[^\\/[:cntrl:]]+)(\\/?))*$", "^((\\/[^\\/]+)(\\/?))*$")
-                log.warning("Modified regex pattern")
-        if definition_name.startswith('Provider'):
-            if prop_name == 'home_directory_template' and 'pattern' in prop:
-                prop['pattern'] = prop["pattern"].replace("^((\\/[^\\/[:cntrl:]]+)(\\/?))*$", "^((\\/[^\\/]+)(\\/?))*$")
-                log.warning("Modified regex pattern")
-        if definition_name.startswith("SshSettings"):
-            if prop_name == "subsystem" and "pattern" in prop:
-                del prop["pattern"]
-                log.warning("Removed regex pattern")
-        # modify type from integer to object to as there is property 'date' in 'retention'
-        if (definition_name.find('S3Objects') != -1):
-            if prop_name == "retention":
-                if "type" in prop and prop['type'] == "integer":
-                    prop['type'] = "object"
-                    if "properties" in prop and "date" in prop['properties']:
-                        if "type" in prop['properties']['date'] and prop['properties']['date']['type'] == "uint64":
-                            prop['properties']['date']['type'] = "number"
-                            log.warning("modified unit64 type to number")
-                    log.warning("Modified incorrect type number to object")
-        # Fixing multiple types in 'switches' property from ClusterInventory
-        if definition_name.startswith("ClusterInventory"):
-            if prop_name == "switches":
-                if "type" in prop and isinstance(prop['type'], list):
-                    switch_list_type = prop['type'][0]
-                    props[prop_name] = switch_list_type
-                if "items" in props[prop_name] and "type" in props[prop_name]['items'] and isinstance(props[prop_name]['items']['type'], list):
-                    item_type = props[prop_name]['items']['type'][0]
-                    props[prop_name]['items'].pop('type')
-                    props[prop_name]['items'].update(item_type)
+            }
+        }
+        del prop['data']
+        log.warning("Restructure the 'protocol' property object")
+
+
+SCHEMA_VISITOR.register(
+    ['SummaryProtocolStats'], '/properties/protocol-stats',
+    fix_items_to_object)
+
+
+@SCHEMA_VISITOR.handles(['HardwareFcportsNode'], '/properties/fcports')
+def fix_fcports_items(definition_name, prop_name, prop, props):
+    if prop['type'] == 'array' and 'properties' in prop:
+        prop['items'] = prop['properties']
+        del prop['properties']
+        log.warning("Move 'fcports' array properties into 'items'")
+
+
+# Issue #22: Remove invalid status enum
+@SCHEMA_VISITOR.handles(
+    ['NetworkInterface', 'PoolsPoolInterfacesInterface'],
+    '/properties/status')
+def fix_interface_status(definition_name, prop_name, prop, props):
+    if 'enum' in prop:
+        del prop['enum']
+        log.warning("Remove invalid 'status' enum")
+
+
+SCHEMA_VISITOR.register(
+    ['NetworkDnscache', 'NetworkExternal'], '/properties/settings',
+    fix_items_to_object)
+
+
+@SCHEMA_VISITOR.handles(['HardeningStateState'], '/properties/state')
+def fix_hardening_state(definition_name, prop_name, prop, props):
+    if 'Other' not in prop['enum']:
+        prop['enum'].append('Other')
+        log.warning("Hardening state missing 'Other' in enum")
+
+
+@SCHEMA_VISITOR.handles(['EventChannel*'], '/properties/type')
+def fix_channel_type(definition_name, prop_name, prop, props):
+    if 'heartbeat' not in prop['enum']:
+        prop['enum'].append('heartbeat')
+        log.warning("Include missing 'heartbeat' in enum")
+
+
+@SCHEMA_VISITOR.handles(['SmbLogLevelFiltersFilter'], '/properties/level')
+def fix_log_level_enum(definition_name, prop_name, prop, props):
+    if 'enum' in prop:
+        del prop['enum']
+        log.warning("Removing enum with duplicate values")
+
+
+@SCHEMA_VISITOR.handles(['*FileMatchingPattern*'], '/properties/operator')
+def fix_operator_enum(definition_name, prop_name, prop, props):
+    if 'enum' in prop:
+        del prop['enum']
+        log.warning("Removing enum with special characters")
+
+
+@SCHEMA_VISITOR.handles(['SnmpSettings*'], '/properties/system_contact')
+def fix_system_contact_pattern(definition_name, prop_name, prop, props):
+    if 'pattern' in prop:
+        prop['pattern'] = prop['pattern'].replace('{2,4}', '{2,7}')
+        log.warning("Modified restrictive regex pattern")
+
+
+@SCHEMA_VISITOR.handles(
+    ['NodeDriveconfig*', 'ClusterNodeDrive*'], '/properties/*')
+def fix_drive_defaults(definition_name, prop_name, prop, props):
+    if 'default' in prop and prop['default'] == 'true':
+        prop['default'] = True
+        log.warning("Default 'true' value is a string, not a boolean")
+    if 'default' in prop and prop['default'] == '30':
+        prop['default'] = 30
+        log.warning("Default '30' value is a string, not a integer")
+
+
+SCHEMA_VISITOR.register(
+    ['*QuotaQuota*'], '/properties/efficiency_ratio', fix_infinite_maximum)
+SCHEMA_VISITOR.register(
+    ['*QuotaQuota*'], '/properties/reduction_ratio', fix_infinite_maximum)
+SCHEMA_VISITOR.register(
+    ['*PerformanceSettings*'], '/properties/target_protocol_read_latency_usec',
+    fix_infinite_maximum)
+SCHEMA_VISITOR.register(
+    ['*PerformanceSettings*'],
+    '/properties/target_protocol_write_latency_usec', fix_infinite_maximum)
+
+
+@SCHEMA_VISITOR.handles(
+    ['*PerformanceSettings*'], '/properties/impact_multiplier')
+def fix_impact_multiplier_maximum(definition_name, prop_name, prop, props):
+    impacts = prop['properties']
+    for impact in ('impact_high', 'impact_low', 'impact_unset',
+                   'impact_medium'):
+        impacts[impact]['maximum'] = 1.79769e+308
+    log.warning("Removing Infinity maximum: {}".format(definition_name))
+
+
+# Issue 67: Regex fail on supportassist settings on primary contact while
+# getting details of Support Assist
+@SCHEMA_VISITOR.handles(
+    ['SupportassistSettings*', 'ConnectivitySettings*'],
+    '/properties/first_name')
+@SCHEMA_VISITOR.handles(
+    ['SupportassistSettings*', 'ConnectivitySettings*'],
+    '/properties/last_name')
+def fix_contact_name_pattern(definition_name, prop_name, prop, props):
+    if 'pattern' in prop:
+        prop['pattern'] = prop['pattern'].replace(
+            "[\\p{L}\\p{M}*\\-\\.\\' ]*", "[a-zA-Z]*[\\-\\.\\']*")
+        log.warning("Modified regex pattern")
+
+
+@SCHEMA_VISITOR.handles(
+    ['SupportassistSettings*', 'ConnectivitySettings*'], '/properties/email')
+def fix_contact_email_default(definition_name, prop_name, prop, props):
+    if 'default' in prop:
+        if prop['pattern'] == (
+                "^[a-zA-Z0-9._%-]+@([a-zA-Z0-9-]+\\.)+[a-zA-Z0-9]+$"):
+            del prop['default']
+            log.warning("Deleted default value for email")
+
+
+@SCHEMA_VISITOR.handles(
+    ['SupportassistSettings*', 'ConnectivitySettings*'], '/properties/phone')
+def fix_contact_phone_default(definition_name, prop_name, prop, props):
+    if 'default' in prop:
+        if prop['pattern'] == (
+                "([\\.\\-\\+\\/\\sxX]*([0-9]+|[\\(\\d+\\)])+)+"):
+            del prop['default']
+            log.warning("Deleted default value for phone")
+
+
+@SCHEMA_VISITOR.handles(
+    ['SupportassistSettings*', 'ConnectivitySettings*'],
+    '/properties/language')
+def fix_contact_language(definition_name, prop_name, prop, props):
+    props["language"] = "En"
+    log.info("Modified language value")
+
+
+# Issue 35 : Getting changelist entries fails if physical or size of file
+# is > 4GB
+@SCHEMA_VISITOR.handles(['ChangelistEntry*'], '/properties/physical_size')
+@SCHEMA_VISITOR.handles(['ChangelistEntry*'], '/properties/size')
+def fix_changelist_size_maximum(definition_name, prop_name, prop, props):
+    if 'maximum' in prop:
+        del prop['maximum']
+        log.warning("Deleted maximum value for %s", prop_name)
+
+
+# Modifing/removing invalid regex patterns
+SCHEMA_VISITOR.register(
+    ['EventChannel*'], '/properties/custom_template',
+    fix_control_chars_pattern)
+SCHEMA_VISITOR.register(
+    ['Provider*'], '/properties/home_directory_template',
+    fix_control_chars_pattern)
+
+
+@SCHEMA_VISITOR.handles(['SshSettings*'], '/properties/subsystem')
+def fix_subsystem_pattern(definition_name, prop_name, prop, props):
+    if "pattern" in prop:
+        del prop["pattern"]
+        log.warning("Removed regex pattern")
+
+
+# modify type from integer to object to as there is property 'date' in
+# 'retention'
+@SCHEMA_VISITOR.handles(
+    ['*S3Objects*'], '/properties/retention', node_type='integer')
+def fix_retention_type(definition_name, prop_name, prop, props):
+    prop['type'] = "object"
+    if "properties" in prop and "date" in prop['properties']:
+        date = prop['properties']['date']
+        if "type" in date and date['type'] == "uint64":
+            date['type'] = "number"
+            log.warning("modified unit64 type to number")
+    log.warning("Modified incorrect type number to object")
+
+
+# Fixing multiple types in 'switches' property from ClusterInventory
+@SCHEMA_VISITOR.handles(['ClusterInventory*'], '/properties/switches')
+def fix_switches_type(definition_name, prop_name, prop, props):
+    if "type" in prop and isinstance(prop['type'], list):
+        switch_list_type = prop['type'][0]
+        props[prop_name] = switch_list_type
+    prop = props[prop_name]
+    if ("items" in prop and "type" in prop['items'] and
+            isinstance(prop['items']['type'], list)):
+        item_type = prop['items']['type'][0]
+        prop['items'].pop('type')
+        prop['items'].update(item_type)
+
+
+def resolve_schema_issues(definition_name, isi_schema,
+                          required_props, is_response_object):
+    """Correct invalid PAPI schemas."""
+    SCHEMA_FIXUPS['schema'].apply(definition_name, isi_schema)
+    SCHEMA_VISITOR.visit(definition_name, isi_schema)
+
+
+@DEFINITIONS_VISITOR.handles(['*'], '')
+def apply_definition_fixups(definition_name, key, definition, parent):
+    """Apply the 'definitions' stage rules of schema_fixups.json."""
+    SCHEMA_FIXUPS['definitions'].apply(definition_name, definition)
+
+
 def fix_multiple_data_types_in_schema(swagger_defs):
-    for definition_name,definition_body in swagger_defs.items():
-        if 'properties' in definition_body:
-            for prop_name,prop in definition_body['properties'].items():
-
-                if definition_name.startswith("HardeningReports") or definition_name.startswith("CreateHardeningApply"):
-                    if prop_name =="current" or prop_name == "prescribed":
-                        if "type" in prop and prop['type'] == "array":
-                            prop['type'] = "object"
-                            if "items" in prop:
-                                del prop['items']
-                            prop['description'] = "Specifies the current or prescribed hardening checklist or item, in the cluster timezone."
-                            log.warning("Modified type to object to support multiple types")
-                if definition_name.startswith('HealthcheckEvaluation'):
-                    if prop_name == 'start_time':
-                        if "type" in prop and prop["type"] == "number":
-                            prop['type'] = "object"
-                            prop.pop("minimum", None)
-                            prop.pop("maximum", None)
-                            prop['description'] = "Specifies the start time for a checklist or item, in the cluster timezone."
-                            log.warning("Modified type to object to support multiple types")
-                if definition_name.startswith("ClusterInventory"):
-                    if prop_name == "member_id":
-                        if "type" in prop and prop["type"] == "integer":
-                            prop['type'] = "object"
-                            prop.pop("minimum", None)
-                            prop.pop("maximum", None)
-                            prop['description'] = "Member ID."
-                            log.warning("Modified type to object to support multiple types")
-                    if prop_name == "reading_celsius":
-                        if "type" in prop and prop["type"] == "integer":
-                            prop['type'] = "object"
-                            prop.pop("minimum", None)
-                            prop.pop("maximum", None)
-                            prop['description'] = "Temperature in Celsius."
-                            log.warning("Modified type to object to support multiple types")                         
+    """Correct invalid types in the definitions of the finished spec."""
+    DEFINITIONS_VISITOR.visit_definitions(swagger_defs)
+
+
 def main():
     """Main method for create_swagger_config executable."""
 
@@ -1505,7 +2230,8 @@ def main():
         description='Builds Swagger config from PAPI end point descriptions.')
     argparser.add_argument(
         '-i', '--input', dest='host',
-        help='IP-address or hostname of OneFS cluster for input',
+        help='IP-address or hostname of OneFS cluster for input, or a comma '
+             'separated list of its nodes to spread the requests over',
         action='store', default='localhost')
     argparser.add_argument(
         '-o', '--output', dest='output_file',
@@ -1532,10 +2258,95 @@ def main():
         '-v', '--version', dest='onefs_version',
         help='OneFS version with 3 dots (e.g. 8.1.0.2)',
         action='store', default=None)
+    argparser.add_argument(
+        '--versions', dest='onefs_versions',
+        help='Comma separated OneFS versions to build one after the other '
+             'from their papi_schemas snapshots, each one reusing the end '
+             'point conversions of the one before; -o is then the '
+             'directory to write the <version>.json specs to',
+        action='store', default=None)
     argparser.add_argument(
         '-a', '--automation', dest='automation',
         help='Non interactive way of creating OAS from json.',
         action='store_true', default=False)
+    argparser.add_argument(
+        '-c', '--concurrency', dest='concurrency',
+        help='Number of ?describe requests to run in parallel against the '
+             'cluster before conversion starts, the most run in parallel '
+             'with --target-latency',
+        action='store', type=int, default=None)
+    argparser.add_argument(
+        '--record', dest='record',
+        help='Write a conversion record next to the output spec for later '
+             '--incremental runs',
+        action='store_true', default=False)
+    argparser.add_argument(
+        '--incremental', dest='previous_spec',
+        help='Path to a spec written with --record, end points whose '
+             '?describe output is unchanged are carried over from it',
+        action='store', default=None)
+    argparser.add_argument(
+        '--cache-dir', dest='cache_dir',
+        help='Directory of a conversion cache shared between runs, end '
+             'points converted before are taken from it',
+        action='store', default=None)
+    argparser.add_argument(
+        '--cache-size', dest='cache_size',
+        help='Maximum size of the conversion cache in MB',
+        action='store', type=int, default=512)
+    argparser.add_argument(
+        '--processes', dest='processes',
+        help='Convert the end points grouped by API family in this many '
+             'worker processes, then merge the results in end point order',
+        action='store', type=int, default=None)
+    argparser.add_argument(
+        '--snapshot-format', dest='snapshot_format',
+        help='Format of the papi_schemas snapshot to read or write, by '
+             'default that of the newest snapshot of the version, or json',
+        choices=list(papi_schema_snapshots.SNAPSHOT_FORMATS), default=None)
+    argparser.add_argument(
+        '--compress', dest='compress',
+        help='Compress the values written to a stored snapshot',
+        action='store_true', default=False)
+    argparser.add_argument(
+        '--profile', dest='profile',
+        help='Print the slowest end points and conversion functions at exit',
+        action='store_true', default=False)
+    argparser.add_argument(
+        '--profile-top', dest='profile_top',
+        help='Number of end points and functions printed by --profile',
+        action='store', type=int, default=20)
+    argparser.add_argument(
+        '--profile-output', dest='profile_output',
+        help='Path to write cProfile statistics of the run to, implies '
+             '--profile',
+        action='store', default=None)
+    argparser.add_argument(
+        '--fixups', dest='fixups_file',
+        help='Path to a file of schema fixup rules to use instead of '
+             'schema_fixups.json',
+        action='store', default=None)
+    argparser.add_argument(
+        '--fixup-report', dest='fixup_report',
+        help='Print how often every schema fixup rule was applied, end '
+             'points reused from --incremental, --cache-dir or --processes '
+             'are not counted',
+        action='store_true', default=False)
+    argparser.add_argument(
+        '--apis', dest='api_families',
+        help='Comma separated API families, e.g. quota,snapshot, to keep in '
+             'the spec together with the definitions they refer to, not '
+             'with --record or --incremental',
+        action='store', default=None)
+    argparser.add_argument(
+        '--operations', dest='operation_ids',
+        help='Comma separated operation IDs to keep in the spec, in '
+             'addition to those of --apis',
+        action='store', default=None)
+    common_resources.add_selection_arguments(argparser)
+    common_resources.add_baseline_arguments(argparser)
+    common_resources.add_concurrency_arguments(argparser)
+    common_resources.add_node_arguments(argparser)
     args = argparser.parse_args()
     if args.automation:
         if (not(args.host and args.output_file)):
@@ -1547,15 +2358,131 @@ def main():
     log.basicConfig(
         format='%(asctime)s %(levelname)s - %(message)s',
         datefmt='%I:%M:%S', level=getattr(log, args.log_level.upper()))
+    if args.processes and args.previous_spec:
+        log.error('--processes can not be combined with --incremental')
+        sys.exit(1)
+    if args.onefs_versions and (args.onefs_version or args.previous_spec):
+        log.error('--versions can not be combined with -v or --incremental')
+        sys.exit(1)
+    if args.baseline and (args.onefs_version or args.onefs_versions):
+        log.error('--baseline only applies to end points fetched with -i')
+        sys.exit(1)
+    if args.target_latency is not None and (
+            not args.concurrency or args.onefs_version or
+            args.onefs_versions):
+        # without -c every end point is fetched in turn as it is converted
+        log.error('--target-latency only applies to end points fetched '
+                  'with -i and -c')
+        sys.exit(1)
+    if (args.record or args.previous_spec) and (
+            args.api_families or args.operation_ids):
+        # the conversion record would describe paths the spec next to it
+        # no longer holds, an --incremental run would reuse them as they are
+        log.error('--record and --incremental can not be combined with '
+                  '--apis or --operations')
+        sys.exit(1)
+    if args.fixups_file:
+        global SCHEMA_FIXUPS
+        SCHEMA_FIXUPS = schema_fixups.load_fixups(args.fixups_file)
+    profile = None
+    if args.profile or args.profile_output:
+        profile = ConversionProfile(args.profile_top, args.profile_output)
+        profile.start()
+        # main() has several exits
+        atexit.register(profile.report)
+
+    if args.onefs_versions:
+        generate_versions(args, profile)
+    else:
+        if not args.onefs_version:
+            if args.username is None:
+                args.username = input(
+                    'Please provide username used for API access to '
+                    '{}: '.format(args.host))
+            if args.password is None:
+                args.password = getpass.getpass('Password: ')
+        generate_spec(args, profile)
+    if args.fixup_report:
+        schema_fixups.print_fixup_report(SCHEMA_FIXUPS)
+
+
+def generate_versions(args, profile):
+    """
+    Build the specs of all --versions in order. The conversion record of
+    every version is carried over to the next one like an --incremental
+    record, so the end points whose ?describe output and definitions are
+    unchanged are replayed instead of converted again, and every spec is
+    the same as that of a standalone build.
+    """
+    if not os.path.isdir(args.output_file):
+        os.makedirs(args.output_file)
+    previous_conversion = None
+    # indented text of the schemas written so far, by compact encoding
+    schema_pool = {}
+    # every version starts from a copy of the same parsed files
+    base_documents = load_base_documents(args)
+    for onefs_version in args.onefs_versions.split(','):
+        start_time = time.time()
+        version_args = argparse.Namespace(**vars(args))
+        version_args.onefs_version = onefs_version
+        version_args.output_file = os.path.join(
+            args.output_file, onefs_version + '.json')
+        version_args.automation = True
+        previous_conversion = generate_spec(
+            version_args, profile, previous_conversion, schema_pool,
+            deepcopy(base_documents))
+        log.info('Built %s in %.2f seconds, %s distinct schemas written.',
+                 version_args.output_file, time.time() - start_time,
+                 len(schema_pool))
+
+
+def base_document_files(args):
+    """Return the paths of the definitions and namespace paths files."""
+    schemas_dir = os.path.abspath(os.path.join(
+        os.path.dirname(os.path.dirname(__file__)), 'papi_schemas'))
+    defs_file = os.path.join(schemas_dir, 'definitions.json')
+    namespace_file = os.path.join(schemas_dir, 'namespace.json')
+
+    if args.defs_file:
+        defs_file = args.defs_file
+    return defs_file, namespace_file
+
+
+def load_base_documents(args):
+    """
+    Return the parsed definitions and namespace paths every spec starts
+    from.
+    """
+    defs_file, namespace_file = base_document_files(args)
+    with open(defs_file, 'r') as def_file:
+        swagger_defs = json.loads(def_file.read())
+    with open(namespace_file, 'r') as namespace_paths:
+        return swagger_defs, json.loads(namespace_paths.read())
 
-    if not args.onefs_version:
-        if args.username is None:
-            args.username = input(
-                'Please provide username used for API access to {}: '.format(
-                    args.host))
-        if args.password is None:
-            args.password = getpass.getpass('Password: ')
 
+def reset_generator_state():
+    """Start over with empty definitions for the next spec."""
+    GENERATED_OPS.clear()
+    SWAGGER_DEFS.clear()
+    invalidate_object_defs()
+    FLATTENED_DEFS_BUILT.clear()
+    for stat in FLATTENED_DEFS_STATS:
+        FLATTENED_DEFS_STATS[stat] = 0
+
+
+def generate_spec(args, profile, previous_conversion=None, schema_pool=None,
+                  base_documents=None):
+    """
+    Build and write the spec of args.onefs_version, or of the cluster at
+    args.host if that is not set. previous_conversion is the encoded
+    conversion record of another spec to reuse conversions from,
+    schema_pool the pool of encoded schemas shared with write_json and
+    base_documents the load_base_documents result to start from, which is
+    changed in place.
+    Returns the encoded conversion record and paths of this spec with
+    --versions, or None.
+    """
+    reset_generator_state()
     swagger_json = {
         'swagger': '2.0',
         'host': 'YOUR_CLUSTER_HOSTNAME_OR_NODE_IP:8080',
@@ -1598,16 +2525,12 @@ def main():
 
     schemas_dir = os.path.abspath(os.path.join(
         os.path.dirname(os.path.dirname(__file__)), 'papi_schemas'))
-    defs_file = os.path.join(schemas_dir, 'definitions.json')
-    namespace_file = os.path.join(schemas_dir, 'namespace.json')
-
-    if args.defs_file:
-        defs_file = args.defs_file
-
-    with open(defs_file, 'r') as def_file:
-        SWAGGER_DEFS.update(json.loads(def_file.read()))
-    with open(namespace_file, 'r') as namespace_paths:
-        swagger_json['paths'] = json.loads(namespace_paths.read())
+    defs_file = base_document_files(args)[0]
+    if base_documents is None:
+        base_documents = load_base_documents(args)
+    SWAGGER_DEFS.update(base_documents[0])
+    invalidate_object_defs()
+    swagger_json['paths'] = base_documents[1]
 
     swagger_json['definitions'] = SWAGGER_DEFS
 
@@ -1618,26 +2541,32 @@ def main():
     desc_parms = {'describe': '', 'json': ''}
     # Initialize session object and create session if onefs_version is not provided in argumnets
     session = None
+    host = args.host
 
     if not args.onefs_version:
         # Creation of session object for accessing APIs
-        session = create_web_session(args.host, auth['username'],  auth['pwd']) 
-        onefs_version = onefs_release_version(args.host, port, session)
+        host, session = common_resources.create_cluster_session(
+            args, auth['username'], auth['pwd'], port)
+        onefs_version = common_resources.onefs_release_version(
+            host, port, session)
     else:
         onefs_version = args.onefs_version
 
-    cached_schemas = {}
-    schemas_file = os.path.join(schemas_dir, '{}.json'.format(onefs_version))
+    schemas_file = papi_schema_snapshots.snapshot_file(
+        schemas_dir, onefs_version, args.snapshot_format)
 
     if args.onefs_version:
-        with open(schemas_file, 'r') as schemas:
-            cached_schemas = json.loads(schemas.read())
+        cached_schemas = papi_schema_snapshots.load_snapshot(schemas_file)
         papi_version = int(cached_schemas['version'])
     else:
-        papi_version = int(onefs_papi_version(args.host, port, session))
+        papi_version = int(common_resources.onefs_papi_version(
+            host, port, session))
         # invalid backport of handlers caused versioning break
         if papi_version == 5 and onefs_version[:5] == '8.0.1':
             papi_version = 4
+        # the snapshot keeps the ?describe documents as they arrived, the
+        # conversion changes the documents it is given in place
+        cached_schemas = papi_schema_snapshots.EncodedSnapshot()
         cached_schemas['version'] = papi_version
     swagger_json['info']['version'] = str(papi_version)
 
@@ -1646,11 +2575,13 @@ def main():
         id_prop = SWAGGER_DEFS['CreateResponse']['properties']['id']
         del id_prop['maxLength']
         del id_prop['minLength']
+        invalidate_object_defs()
 
     if not args.test:
         exclude_end_points = common_resources.get_exclude_endpoints(papi_version)
         end_point_paths = get_endpoint_paths(
-            args.host, port, base_url, session, exclude_end_points,
+            host, port, base_url, session,
+            common_resources.end_point_selector(args, exclude_end_points),
             cached_schemas)
     else:
         exclude_end_points = []
@@ -1659,156 +2590,235 @@ def main():
             ('/1/auth/providers/local', None)
         ]
 
+    describe_docs = {}
+    adaptive = common_resources.adaptive_concurrency(
+        args, args.concurrency or 1)
+    if args.baseline:
+        baseline = common_resources.load_baseline(schemas_dir, args.baseline)
+        fetched, sampled, copied = common_resources.plan_delta_crawl(
+            end_point_paths, baseline, args.baseline_sample,
+            args.baseline_seed)
+        describe_docs = fetch_end_point_descriptions(
+            host, port, base_url, session,
+            [(end_point_path, None) for end_point_path in fetched],
+            args.concurrency or 1, adaptive)
+        remaining = common_resources.copy_from_baseline(
+            baseline, describe_docs, sampled, copied)
+        papi_schema_snapshots.close_snapshot(baseline)
+        if remaining:
+            describe_docs.update(fetch_end_point_descriptions(
+                host, port, base_url, session,
+                [(end_point_path, None) for end_point_path in remaining],
+                args.concurrency or 1, adaptive))
+    elif (args.concurrency or args.processes) and not args.onefs_version:
+        describe_docs = fetch_end_point_descriptions(
+            host, port, base_url, session, end_point_paths,
+            args.concurrency or 1, adaptive)
+    if adaptive is not None and adaptive.completed:
+        adaptive.log_state()
+
+    # conversions of this run, recorded for later --incremental runs
+    conversion_record = None
+    previous_record = previous_paths = None
+    conversion_cache = None
+    if (args.record or args.previous_spec or args.cache_dir or
+            args.processes or args.onefs_versions):
+        conversion_record = {}
+        generator = generator_digest(
+            defs_file, args.fixups_file or schema_fixups.FIXUPS_FILE)
+    if args.previous_spec:
+        previous_record, previous_paths = load_conversion_record(
+            args.previous_spec, generator)
+    if previous_conversion is not None:
+        previous_record, previous_paths = json.loads(
+            previous_conversion, object_hook=decode_conversion_record_obj)
+    if args.cache_dir:
+        conversion_cache = ConversionCache(
+            args.cache_dir, generator, args.cache_size * 1024 * 1024)
+    if args.processes and previous_record is None:
+        # the workers' conversions are merged by the main loop like an
+        # --incremental record, everything else is converted again there
+        previous_record, previous_paths = convert_end_point_shards(
+            base_url, end_point_paths,
+            cached_schemas if args.onefs_version else describe_docs,
+            args.processes)
+
     success_count = 0
     fail_count = 0
+    reused_count = 0
     for base_end_point_path, item_end_point_path in end_point_paths:
-        if base_end_point_path is None:
-            tmp_base_endpoint_path = to_swagger_end_point(
-                os.path.dirname(item_end_point_path))
-            swagger_path = base_url + tmp_base_endpoint_path
-            api_name, obj_namespace, obj_name = end_point_path_to_api_obj_name(
-                tmp_base_endpoint_path)
-        else:
-            api_name, obj_namespace, obj_name = end_point_path_to_api_obj_name(
-                base_end_point_path)
-            swagger_path = base_url + to_swagger_end_point(base_end_point_path)
+        if args.onefs_version:
+            missing_end_points = [
+                end_point_path
+                for end_point_path in (base_end_point_path,
+                                       item_end_point_path)
+                if end_point_path is not None and
+                end_point_path not in cached_schemas]
+            if missing_end_points:
+                # e.g. a snapshot collected with --include
+                log.error('Skipping %s, missing from the %s snapshot',
+                          ', '.join(missing_end_points), onefs_version)
+                fail_count += len(missing_end_points)
+                continue
+
+        api_name, obj_namespace, obj_name, swagger_path = end_point_names(
+            base_url, base_end_point_path, item_end_point_path)
 
         check_swagger_op_is_unique(
             api_name, obj_namespace, obj_name, swagger_path)
 
         if item_end_point_path is not None:
             log.info('Processing %s', item_end_point_path)
+            fetch_start = time.perf_counter()
             # next do the item PUT (i.e. update), DELETE, and GET because the
             # GET seems to be a limited version of the base path GET so the
             # subclassing works correct when done in this order
 
             if not args.onefs_version:
-                url = 'https://{}:{}{}{}'.format(
-                    args.host, port, base_url, item_end_point_path)
-                resp = requests_with_session(
-                    session, url, params=desc_parms)
+                if item_end_point_path in describe_docs:
+                    resp = describe_docs[item_end_point_path]
+                else:
+                    url = 'https://{}:{}{}{}'.format(
+                        host, port, base_url, item_end_point_path)
+                    resp = common_resources.requests_with_session(
+                        session, url, desc_parms, adaptive)
                 item_resp_json = resp
                 if item_resp_json == None:
                     log.warning("Missing ?describe for API %s", item_end_point_path)
                     continue
-                cached_schemas[item_end_point_path] = deepcopy(item_resp_json)
+                cached_schemas[item_end_point_path] = item_resp_json
 
             else:
                 item_resp_json = cached_schemas[item_end_point_path]
 
-            singular_obj_postfix, item_input_type = parse_path_params(
-                os.path.basename(item_end_point_path))[0]
-            extra_path_params = parse_path_params(
-                os.path.dirname(item_end_point_path))
-            try:
-                item_path_url, item_path = isi_item_to_swagger_path(
-                    api_name, obj_namespace, obj_name, item_resp_json,
-                    singular_obj_postfix, item_input_type,
-                    extra_path_params)
-                swagger_json['paths'][swagger_path + item_path_url] = item_path
-
-                if 'HEAD_args' in item_resp_json:
-                    log.warning('HEAD_args in: %s', item_end_point_path)
-
+            convert_start = time.perf_counter()
+            end_point_pair = [base_end_point_path, item_end_point_path]
+            digest = None
+            if conversion_record is not None:
+                digest = describe_digest(item_resp_json)
+            reused = reuse_conversion(
+                previous_record, previous_paths, conversion_cache,
+                conversion_record, item_end_point_path, end_point_pair, digest,
+                swagger_json['paths'])
+            if reused is not None:
+                reused_count += 1
+                error = reused['error']
+                if error is not None:
+                    log.error('Caught exception processing: %s',
+                              item_end_point_path)
+                    log.error(error)
+            else:
+                error = convert_end_point(
+                    conversion_record, conversion_cache, item_end_point_path,
+                    end_point_pair, digest, swagger_json['paths'], args.test,
+                    item_end_point_to_swagger_path, api_name, obj_namespace,
+                    obj_name, swagger_path, item_end_point_path,
+                    item_resp_json)
+            if profile is not None:
+                profile.add_end_point(
+                    item_end_point_path, fetch_start, convert_start,
+                    time.perf_counter())
+            if error is None:
                 success_count += 1
-            except (KeyError, TypeError, RuntimeError) as err:
-                log.error('Caught exception processing: %s',
-                          item_end_point_path)
-                log.error('%s: %s', type(err).__name__, err)
-                if args.test:
-                    traceback.print_exc(file=sys.stderr)
+            else:
                 fail_count += 1
 
         if base_end_point_path is not None:
             log.info('Processing %s', base_end_point_path)
+            fetch_start = time.perf_counter()
 
             if not args.onefs_version:
-                url = 'https://{}:{}{}{}'.format(
-                    args.host, port, base_url, base_end_point_path)
-                resp = requests_with_session(
-                    session, url, params=desc_parms)
+                if base_end_point_path in describe_docs:
+                    resp = describe_docs[base_end_point_path]
+                else:
+                    url = 'https://{}:{}{}{}'.format(
+                        host, port, base_url, base_end_point_path)
+                    resp = common_resources.requests_with_session(
+                        session, url, desc_parms, adaptive)
                 base_resp_json = resp
                 if base_resp_json == None:
                     log.warning('Missing ?describe for API %s', base_end_point_path)
                     continue
-                cached_schemas[base_end_point_path] = deepcopy(base_resp_json)
+                cached_schemas[base_end_point_path] = base_resp_json
 
             else:
                 base_resp_json = cached_schemas[base_end_point_path]
 
-            base_path_params = parse_path_params(base_end_point_path)
-            base_path = {}
-            # start with base path POST because it defines the base
-            # creation object model
-            try:
-                if 'POST_args' in base_resp_json:
-                    if base_end_point_path in MISSING_POST_RESPONSE:
-                        base_resp_json['POST_output_schema'] = {}
-                        log.warning("Removed invalid POST response schema")
-
-                    base_path = isi_post_to_swagger_path(
-                        api_name, obj_namespace, obj_name, base_resp_json,
-                        base_path_params)
-
-                if 'GET_args' in base_resp_json:
-                    get_base_path = isi_get_to_swagger_path(
-                        api_name, obj_namespace, obj_name, base_resp_json,
-                        base_path_params)
-                    base_path.update(get_base_path)
-
-                if 'PUT_args' in base_resp_json:
-                    put_base_path = isi_put_to_swagger_path(
-                        api_name, obj_namespace, obj_name, base_resp_json,
-                        base_path_params)
-                    base_path.update(put_base_path)
-
-                if 'DELETE_args' in base_resp_json:
-                    del_base_path = isi_delete_to_swagger_path(
-                        api_name, obj_namespace, obj_name, base_resp_json,
-                        base_path_params)
-                    base_path.update(del_base_path)
-
-                if base_path:
-                    swagger_json['paths'][swagger_path] = base_path
-
-                if 'HEAD_args' in base_resp_json:
-                    log.warning('HEAD_args in: %s', base_end_point_path)
+            convert_start = time.perf_counter()
+            end_point_pair = [base_end_point_path, item_end_point_path]
+            digest = None
+            if conversion_record is not None:
+                digest = describe_digest(base_resp_json)
+            reused = reuse_conversion(
+                previous_record, previous_paths, conversion_cache,
+                conversion_record, base_end_point_path, end_point_pair, digest,
+                swagger_json['paths'])
+            if reused is not None:
+                reused_count += 1
+                error = reused['error']
+                if error is not None:
+                    log.error('Caught exception processing: %s',
+                              base_end_point_path)
+                    log.error(error)
+            else:
+                error = convert_end_point(
+                    conversion_record, conversion_cache, base_end_point_path,
+                    end_point_pair, digest, swagger_json['paths'], args.test,
+                    base_end_point_to_swagger_path, api_name, obj_namespace,
+                    obj_name, swagger_path, base_end_point_path,
+                    base_resp_json)
+            if profile is not None:
+                profile.add_end_point(
+                    base_end_point_path, fetch_start, convert_start,
+                    time.perf_counter())
+            if error is None:
                 success_count += 1
-            except (KeyError, TypeError, RuntimeError) as err:
-                log.error('Caught exception processing: %s',
-                          base_end_point_path)
-                log.error('%s: %s', type(err).__name__, err)
-                if args.test:
-                    traceback.print_exc(file=sys.stderr)
+            else:
                 fail_count += 1
+    if args.onefs_version:
+        # the converted documents are all read
+        papi_schema_snapshots.close_snapshot(cached_schemas)
 
+    if isinstance(session, common_resources.ClusterNodes):
+        session.log_state()
     log.info(('End points successfully processed: %s, failed to process: %s, '
               'excluded: %s.'),
              success_count, fail_count, len(exclude_end_points))
+    log.info('Flattened definitions cache: %s hits, %s misses, %s rebuilds.',
+             FLATTENED_DEFS_STATS['hits'], FLATTENED_DEFS_STATS['misses'],
+             FLATTENED_DEFS_STATS['rebuilds'])
+    if conversion_record is not None:
+        log.info('Reused %s of %s end point conversions.',
+                 reused_count, len(conversion_record))
+    if args.record or args.previous_spec:
+        write_conversion_record(
+            args.output_file or '{}.json'.format(onefs_version), generator,
+            conversion_record)
+    if conversion_cache is not None:
+        conversion_cache.evict()
+        log.info(('Conversion cache: %s hits, %s misses, %s stored, '
+                  '%s evicted.'), conversion_cache.stats['hits'],
+                 conversion_cache.stats['misses'],
+                 conversion_cache.stats['stored'],
+                 conversion_cache.stats['evicted'])
     if args.automation :
             if cached_schemas and not args.onefs_version:
-               with open(schemas_file, 'w+') as schemas:
-                   schemas.write(json.dumps(
-                cached_schemas, sort_keys=True, indent=4,
-                separators=(',', ': ')))
+               papi_schema_snapshots.write_snapshot(
+                   schemas_file, cached_schemas, args.compress)
     else:
-      if cached_schemas and not args.onefs_version and os.path.exists(os.getcwd()+'/papi_schemas/'+str(onefs_version)+'.json'):
-        print('\nDo you want to overwrite existing schema - '+os.getcwd()+'/papi_schemas/'+str(onefs_version)+'.json'+' [Y/N] or [y/n] ')
+      if cached_schemas and not args.onefs_version and os.path.exists(schemas_file):
+        print('\nDo you want to overwrite existing schema - '+schemas_file+' [Y/N] or [y/n] ')
         ch=input()[0]
         if(ch=='y' or ch=='Y'):
-             with open(schemas_file, 'w+') as schemas:
-                  schemas.write(json.dumps(
-                cached_schemas, sort_keys=True, indent=4,
-                separators=(',', ': ')))
+             papi_schema_snapshots.write_snapshot(
+                 schemas_file, cached_schemas, args.compress)
         elif(ch=='n' or ch=='N'):
                 print('\nPlease Enter the new file name : ')
                 new_name=input()
                 if new_name[-5:]!='.json' and new_name!=onefs_version:
                    new_name=new_name+'.json'
-                   with open('papi_schemas/'+new_name, 'w+') as schemas:
-                       schemas.write(json.dumps(
-                cached_schemas, sort_keys=True, indent=4,
-                separators=(',', ': ')))
+                   papi_schema_snapshots.write_snapshot(
+                       os.path.join(schemas_dir, new_name), cached_schemas)
                 elif new_name == onefs_version or new_name==onefs_version+'.json': 
                     print('\nSchema file of this name alrady exists , Please restart the execution.')
                     exit()
@@ -1818,11 +2828,9 @@ def main():
         else:
             print('\nInvalid input!!!')
             exit()
-      elif cached_schemas and not args.onefs_version and (os.path.exists(os.getcwd()+'/papi_schemas/'+str(onefs_version)+'.json')==False):
-         with open(schemas_file, 'w+') as schemas:
-                  schemas.write(json.dumps(
-                cached_schemas, sort_keys=True, indent=4,
-                separators=(',', ': ')))
+      elif cached_schemas and not args.onefs_version and (os.path.exists(schemas_file)==False):
+         papi_schema_snapshots.write_snapshot(
+             schemas_file, cached_schemas, args.compress)
     class TMCSerializer(JSONEncoder):
 
           def default(self, value):
@@ -1831,17 +2839,28 @@ def main():
               return str(value)
             return super(TMCSerializer, self).default(value)
 
+    # encoded before the fixups below change definitions that the recorded
+    # conversions may share
+    next_conversion = None
+    if args.onefs_versions:
+        next_conversion = json.dumps(
+            [conversion_record, swagger_json['paths']],
+            cls=ConversionRecordEncoder)
+
     fix_multiple_data_types_in_schema(swagger_defs = swagger_json['definitions'])
+    if args.api_families or args.operation_ids:
+        slim_spec(
+            swagger_json,
+            args.api_families.split(',') if args.api_families else [],
+            args.operation_ids.split(',') if args.operation_ids else [])
 
     if args.automation:
         with open(args.output_file, 'w') as output_file:
-         output_file.write(json.dumps(
-           swagger_json,cls=TMCSerializer, sort_keys=True, indent=4, separators=(',', ': ')))
+         write_json(output_file, swagger_json, TMCSerializer, schema_pool)
     else:
      if(args.output_file is not None):
         with open(args.output_file, 'w') as output_file:
-               output_file.write(json.dumps(
-           swagger_json,cls=TMCSerializer, sort_keys=True, indent=4, separators=(',', ': ')))
+               write_json(output_file, swagger_json, TMCSerializer)
      else :
         new_file=str(onefs_version)+'.json'
         if(os.path.exists(new_file)):
@@ -1849,15 +2868,16 @@ def main():
             choice=input()[0]
             if(choice=='y' or choice=='Y'):
                  with open(new_file, 'w') as output_file:
-                    output_file.write(json.dumps(
-           swagger_json,cls=TMCSerializer, sort_keys=True, indent=4, separators=(',', ': ')))
+                    write_json(output_file, swagger_json, TMCSerializer)
             else:
                  print('Exiting!!!')
                  exit()
 
         else: 
               with open(new_file, 'w') as output_file:
-                   output_file.write(json.dumps(
-           swagger_json,cls=TMCSerializer, sort_keys=True, indent=4, separators=(',', ': ')))
+                   write_json(output_file, swagger_json, TMCSerializer)
+    return next_conversion
+
+
 if __name__ == '__main__':
     main()
\ No newline at end of file
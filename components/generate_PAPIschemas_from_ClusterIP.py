@@ -5,65 +5,40 @@ Output: PAPI_Schemas fetched from cluster.
 Schema file will be created inside /papi_schemas directory with name <OneFS_Relese>.json
 Exampple usage:
 python generate_PAPIschemas_from_ClusterIP.py -i <CLUSTERIP> -u <CLUSTER_USERNAME> -u <PASSWORD>
+Collected documents are journaled next to the schema file as they arrive, an
+interrupted run continues where it stopped when run again with --resume.
+With --baseline <OneFS_Release>, only the end points missing from that
+snapshot and a sample of the others are fetched, the rest is copied from it.
 '''
 from json import JSONEncoder
 import argparse
+import asyncio
 import codecs
 from collections import OrderedDict
-from copy import deepcopy
+from concurrent import futures
 import getpass
-import json
 import logging as log
 import os
+import time
 import requests
 import common_resources
+import papi_schema_snapshots
 
 requests.packages.urllib3.disable_warnings()
 
-def create_web_session(host, username, password):
-    ''' Return a requests.session object with a isi session. '''
+# HTTP status codes of describe requests that are worth retrying
+TRANSIENT_STATUS_CODES = (429, 500, 502, 503, 504)
+# seconds to wait before the first retry of a failed describe request, the
+# delay doubles with every further attempt
+RETRY_BACKOFF = 1.0
 
-    session = requests.Session()
 
-    session.headers['Origin'] = 'https://{}:8080/'.format(host)
-    session.headers['Content-Type'] = 'application/json'
+class TransientRequestError(Exception):
+    """Describe request failed in a way that may succeed when retried."""
 
-    data = {
-        'username': username,
-        'password': password,
-        'services': ['platform', 'namespace']}
 
-    uri = 'https://{}:8080/session/1/session'.format(host)
-    response = session.post(uri, json=data, verify=False)
-
-    if response.status_code != requests.codes.CREATED:
-        msg = 'Failed to create web session: {}, {}, {}'.format(
-            username, response.headers, response.text)
-        raise Exception(msg)
-
-    session.headers['X-CSRF-Token'] = session.cookies['isicsrf']
-
-    return session
-
-def requests_with_session(session, url, params = None):
-    return session.get(
-            url,params=params,
-            verify=False).json()
-
-def onefs_release_version(host, port, session):
-    """Query a cluster and return the 4 major version digits"""
-    url = 'https://{0}:{1}/platform/1/cluster/config'.format(host, port)
-    config = requests_with_session(session, url)
-    return config['onefs_version']['release'].strip('v')
-
-def onefs_papi_version(host, port, session):
-    """Query cluster for latest PAPI version."""
-    url = 'https://{0}:{1}/platform/latest'.format(host, port)
-    try:
-        return requests_with_session(session,url)['latest']
-    except KeyError:
-        # latest handler did not exist before API version 3
-        return '2'
+class RequestError(Exception):
+    """Describe request was answered with an HTTP error status."""
 
 def get_endpoint_paths(source_node_or_cluster, port, base_url, session,
                        exclude_end_points, cached_schemas):
@@ -76,12 +51,133 @@ def get_endpoint_paths(source_node_or_cluster, port, base_url, session,
     """
     desc_list_parms = {'describe': '', 'json': '', 'list': ''}
     url = 'https://' + source_node_or_cluster + ':' + port + base_url
-    resp = requests_with_session(
+    resp = common_resources.requests_with_session(
         session, url, params=desc_list_parms)
+    if isinstance(session, common_resources.ClusterNodes):
+        session.check_consistency(url, desc_list_parms, resp, 'directory')
     end_point_list_json = resp['directory']
-    cached_schemas['directory'] = end_point_list_json
         # calls get_endpoint_paths from common_resources
-    return common_resources.get_endpoint_paths(end_point_list_json, exclude_end_points)
+    end_point_paths = common_resources.get_endpoint_paths(end_point_list_json, exclude_end_points)
+    if isinstance(exclude_end_points, common_resources.EndPointSelector):
+        common_resources.log_unmatched_rules(
+            exclude_end_points, end_point_list_json)
+    # the snapshot only lists the end points it holds
+    cached_schemas['directory'] = common_resources.selected_directory(
+        end_point_list_json, end_point_paths, exclude_end_points)
+    return end_point_paths
+
+def fetch_end_point_schema(session, url, params, adaptive=None):
+    """
+    Fetch one ?describe document, flagging failures worth a retry. adaptive
+    is the AdaptiveConcurrency of the crawl, if any.
+    """
+    try:
+        response = common_resources.get_with_session(
+            session, url, params, adaptive)
+    except (requests.exceptions.ConnectionError,
+            requests.exceptions.Timeout) as err:
+        raise TransientRequestError(str(err))
+    if response.status_code in TRANSIENT_STATUS_CODES:
+        raise TransientRequestError('HTTP {}: {}'.format(
+            response.status_code, response.text))
+    if response.status_code == 401:
+        # the failed end points are kept in the journal for --resume
+        raise RequestError('HTTP 401, the session expired, run again with '
+                           '--resume: {}'.format(response.text))
+    if not 200 <= response.status_code < 300:
+        # an error body is no ?describe document
+        raise RequestError('HTTP {}: {}'.format(
+            response.status_code, response.text))
+    return response.json()
+
+async def collect_schemas_async(loop, host, port, base_url, session,
+                                end_points, cached_schemas, concurrency,
+                                retries, adaptive=None):
+    """
+    Fetches the ?describe&json document of every end point with concurrency
+    requests in flight, or as many as adaptive allows. Failed requests that
+    may be transient are put back at the end of the queue after a backoff
+    delay, so they never block the workers. Returns the number of end
+    points collected and failed.
+    """
+    desc_parms = {'describe': '', 'json': ''}
+    queue = asyncio.Queue()
+    for end_point_path in end_points:
+        queue.put_nowait((end_point_path, 1))
+    counts = {'success': 0, 'fail': 0}
+
+    def requeue(item):
+        queue.put_nowait(item)
+        # the retried item now holds the queue open, release the failed one
+        queue.task_done()
+
+    async def worker(executor):
+        while True:
+            end_point_path, attempt = await queue.get()
+            url = 'https://{}:{}{}{}'.format(
+                host, port, base_url, end_point_path)
+            start_time = time.time()
+            try:
+                resp_json = await loop.run_in_executor(
+                    executor, fetch_end_point_schema, session, url,
+                    desc_parms, adaptive)
+            except TransientRequestError as err:
+                log.info('Processing %s failed after %.3f seconds',
+                         end_point_path, time.time() - start_time)
+                if attempt <= retries:
+                    delay = RETRY_BACKOFF * 2 ** (attempt - 1)
+                    log.warning('Retrying %s in %.1f seconds (attempt %s): %s',
+                                end_point_path, delay, attempt + 1, err)
+                    loop.call_later(
+                        delay, requeue, (end_point_path, attempt + 1))
+                    continue
+                log.error('Caught exception while processing: %s. Skipping schema collection for this endpoint', end_point_path)
+                log.error('%s: %s', type(err).__name__, err)
+                counts['fail'] += 1
+            except Exception as err:
+                log.error('Caught exception while processing: %s. Skipping schema collection for this endpoint', end_point_path)
+                log.error('%s: %s', type(err).__name__, err)
+                counts['fail'] += 1
+            else:
+                log.info('Processed %s in %.3f seconds',
+                         end_point_path, time.time() - start_time)
+                if resp_json == None:
+                    log.warning('Missing ?describe for API %s', end_point_path)
+                cached_schemas[end_point_path] = resp_json
+                counts['success'] += 1
+            queue.task_done()
+
+    # let every worker keep its own connection to the cluster
+    session.mount('https://', requests.adapters.HTTPAdapter(
+        pool_connections=1, pool_maxsize=concurrency))
+    with futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        workers = [loop.create_task(worker(executor))
+                   for _ in range(concurrency)]
+        await queue.join()
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+    return counts['success'], counts['fail']
+
+def collect_schemas(host, port, base_url, session, end_point_paths,
+                    cached_schemas, concurrency, retries, adaptive=None):
+    """
+    Collects the ?describe&json documents of all base and item end points in
+    end_point_paths into cached_schemas, skipping those it holds already.
+    Returns the number of end points collected and failed.
+    """
+    end_points = [end_point_path
+                  for end_point_tuple in end_point_paths
+                  for end_point_path in end_point_tuple
+                  if end_point_path is not None and
+                  end_point_path not in cached_schemas]
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(collect_schemas_async(
+            loop, host, port, base_url, session, end_points, cached_schemas,
+            concurrency, retries, adaptive))
+    finally:
+        loop.close()
 
 def main():
     """Main method for create_swagger_config executable."""
@@ -90,7 +186,8 @@ def main():
         description='Builds Swagger config from PAPI end point descriptions.')
     argparser.add_argument(
         '-i', '--input', dest='host',
-        help='IP-address or hostname of OneFS cluster for input',
+        help='IP-address or hostname of OneFS cluster for input, or a comma '
+             'separated list of its nodes to spread the requests over',
         action='store', default='localhost')
     argparser.add_argument(
         '-u', '--username', dest='username',
@@ -106,6 +203,32 @@ def main():
     argparser.add_argument(
         '-l', '--logging', dest='log_level',
         help='Logging verbosity level', action='store', default='INFO')
+    argparser.add_argument(
+        '-c', '--concurrency', dest='concurrency',
+        help='Number of ?describe requests kept in flight, the most kept '
+             'in flight with --target-latency',
+        action='store', type=int, default=8)
+    argparser.add_argument(
+        '-r', '--retries', dest='retries',
+        help='Number of retries for transient ?describe request failures',
+        action='store', type=int, default=3)
+    argparser.add_argument(
+        '-f', '--format', dest='snapshot_format',
+        help='Format of the papi_schemas snapshot to write',
+        choices=list(papi_schema_snapshots.SNAPSHOT_FORMATS), default='json')
+    argparser.add_argument(
+        '-z', '--compress', dest='compress',
+        help='Compress the values written to a stored snapshot',
+        action='store_true', default=False)
+    argparser.add_argument(
+        '--resume', dest='resume',
+        help='Continue an interrupted run from its journal, only fetching '
+             'the end points it did not collect',
+        action='store_true', default=False)
+    common_resources.add_selection_arguments(argparser)
+    common_resources.add_baseline_arguments(argparser)
+    common_resources.add_concurrency_arguments(argparser)
+    common_resources.add_node_arguments(argparser)
     args = argparser.parse_args()
 
     log.basicConfig(
@@ -118,14 +241,19 @@ def main():
     auth = {'username':args.username, 'pwd':args.password}
     base_url = '/platform'
     port = '8080'
-    desc_parms = {'describe': '', 'json': ''}
 
     # Initialize session object and create session if onefs_version is not provided in argumnets
-    session = create_web_session(args.host, auth['username'],  auth['pwd']) 
-    onefs_version = onefs_release_version(args.host, port, session)
-    cached_schemas = {}
-    schemas_file = os.path.join(schemas_dir, '{}.json'.format(onefs_version))
-    papi_version = int(onefs_papi_version(args.host, port, session))
+    host, session = common_resources.create_cluster_session(
+        args, auth['username'], auth['pwd'])
+    onefs_version = common_resources.onefs_release_version(
+        host, port, session)
+    schemas_file = papi_schema_snapshots.snapshot_file(
+        schemas_dir, onefs_version, args.snapshot_format)
+    # every collected document is journaled as it arrives
+    cached_schemas = papi_schema_snapshots.JournaledSnapshot(
+        schemas_file + papi_schema_snapshots.JOURNAL_EXT, args.resume)
+    papi_version = int(common_resources.onefs_papi_version(
+        host, port, session))
     
     # invalid backport of handlers caused versioning break
     if papi_version == 5 and onefs_version[:5] == '8.0.1':
@@ -135,7 +263,8 @@ def main():
     if not args.test:
         exclude_end_points = common_resources.get_exclude_endpoints(papi_version)
         end_point_paths = get_endpoint_paths(
-            args.host, port, base_url, session, exclude_end_points,
+            host, port, base_url, session,
+            common_resources.end_point_selector(args, exclude_end_points),
             cached_schemas)
     else:
         exclude_end_points = []
@@ -144,52 +273,67 @@ def main():
             ('/1/auth/providers/local', None)
         ]
 
-    success_count = 0
-    fail_count = 0
+    # a resumed journal may hold end points that are no longer selected
+    selected_end_points = set(
+        end_point_path
+        for end_point_tuple in end_point_paths
+        for end_point_path in end_point_tuple)
+    resumed_count = 0
+    for key in list(cached_schemas):
+        if key in ('directory', 'version'):
+            continue
+        if key in selected_end_points:
+            resumed_count += 1
+        else:
+            del cached_schemas[key]
+    if resumed_count:
+        log.info('Resuming with %s end points from the journal',
+                 resumed_count)
 
-    for base_end_point_path, item_end_point_path in end_point_paths:
-        if base_end_point_path is not None:
-            log.info('Processing %s', base_end_point_path)
-            try:
-                url = 'https://{}:{}{}{}'.format(
-                    args.host, port, base_url, base_end_point_path)
-                base_resp_json = requests_with_session(
-                    session, url, params=desc_parms)
-                if base_resp_json == None:
-                    log.warning('Missing ?describe for API %s', base_end_point_path)
-                cached_schemas[base_end_point_path] = deepcopy(base_resp_json) 
-                success_count += 1
-            except Exception as err:
-                log.error('Caught exception while processing: %s. Skipping schema collection for this endpoint', base_end_point_path)
-                log.error('%s: %s', type(err).__name__, err)
-                fail_count += 1
+    adaptive = common_resources.adaptive_concurrency(args, args.concurrency)
+    if args.baseline:
+        baseline = common_resources.load_baseline(schemas_dir, args.baseline)
+        fetched, sampled, copied = common_resources.plan_delta_crawl(
+            end_point_paths, baseline, args.baseline_sample,
+            args.baseline_seed)
+        success_count, fail_count = collect_schemas(
+            host, port, base_url, session,
+            [(end_point_path, None) for end_point_path in fetched],
+            cached_schemas, args.concurrency, args.retries, adaptive)
+        remaining = common_resources.copy_from_baseline(
+            baseline, cached_schemas, sampled, copied)
+        papi_schema_snapshots.close_snapshot(baseline)
+        success_count += len(copied) - len(remaining)
+        if remaining:
+            remaining_counts = collect_schemas(
+                host, port, base_url, session,
+                [(end_point_path, None) for end_point_path in remaining],
+                cached_schemas, args.concurrency, args.retries, adaptive)
+            success_count += remaining_counts[0]
+            fail_count += remaining_counts[1]
+    else:
+        success_count, fail_count = collect_schemas(
+            host, port, base_url, session, end_point_paths,
+            cached_schemas, args.concurrency, args.retries, adaptive)
 
-        if item_end_point_path is not None:
-            log.info('Processing %s', item_end_point_path)
-            try:
-                url = 'https://{}:{}{}{}'.format(
-                    args.host, port, base_url, item_end_point_path)
-                item_resp_json = requests_with_session(
-                    session, url, params=desc_parms)
-                if item_resp_json == None:
-                    log.warning('Missing ?describe for API %s', item_end_point_path)
-                cached_schemas[item_end_point_path] = deepcopy(item_resp_json) 
-                success_count += 1
-            except Exception as err:
-                log.error('Caught exception while processing: %s. Skipping schema collection for this endpoint', item_end_point_path)
-                log.error('%s: %s', type(err).__name__, err)
-                fail_count += 1
-    
+    if adaptive is not None:
+        adaptive.log_state()
+    if isinstance(session, common_resources.ClusterNodes):
+        session.log_state()
     log.info(('Total End points successfully processed: %s, failed to process: %s, '
               'excluded: %s'),
              success_count, fail_count, len(exclude_end_points))
     
-    # Put cached_schemas into fle. And store the output file as <OUTPUT>.json inside isilon_sdk/papi_schemas/
+    # Put cached_schemas into fle. And store the output file as <OUTPUT>.json (or .jsonl/.manifest, see --format) inside isilon_sdk/papi_schemas/
     # This overwrites already existing file (if any) from isilon_sdk/papi_schemas/
-    with open(schemas_file, 'w+') as schemas:
-        schemas.write(json.dumps(
-    cached_schemas, sort_keys=True, indent=4,
-    separators=(',', ': ')))
+    papi_schema_snapshots.write_snapshot(
+        schemas_file, cached_schemas, args.compress)
+    if fail_count:
+        # a --resume run retries the end points that failed
+        cached_schemas.close()
+        log.info('Kept the journal of %s for --resume', schemas_file)
+    else:
+        cached_schemas.remove()
 
 if __name__ == '__main__':
     main()
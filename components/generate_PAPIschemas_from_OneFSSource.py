@@ -34,6 +34,7 @@ import json
 import logging as log
 import re
 import common_resources
+import papi_schema_snapshots
 
 lst_end_point_paths = []
 valid_arg_types = ['GET_args', 'POST_args', 'PUT_args', 'DELETE_args']
@@ -151,6 +152,15 @@ def main():
     argparser.add_argument(
         '--debug_build', dest='debug_build',
         help='This will cover g_debug endpoints', action='store_true', default=False)
+    argparser.add_argument(
+        '-f', '--format', dest='snapshot_format',
+        help='Format of the papi_schemas snapshot to write',
+        choices=list(papi_schema_snapshots.SNAPSHOT_FORMATS), default='json')
+    argparser.add_argument(
+        '-z', '--compress', dest='compress',
+        help='Compress the values written to a stored snapshot',
+        action='store_true', default=False)
+    common_resources.add_selection_arguments(argparser)
     args = argparser.parse_args()
 
     # Log Configuration
@@ -180,6 +190,8 @@ def main():
     exclude_count = 0
     cached_schemas = {}
     cached_schemas['directory'] = []
+    # end points of every source path, before the selection
+    listed_end_points = []
 
     # For multiple OneFS source paths
     for src_path in source_paths:    
@@ -210,9 +222,12 @@ def main():
             # If debugbuild is false then exclude debugbuild endpoints
             if not args.debug_build:
                 exclude_end_points.extend(common_resources.debug_build_exclusion_list)
-            end_point_paths = common_resources.get_endpoint_paths(lst_end_point_paths, exclude_end_points)
+            selector = common_resources.end_point_selector(
+                args, exclude_end_points)
+            end_point_paths = common_resources.get_endpoint_paths(lst_end_point_paths, selector)
         else:
             exclude_end_points = []
+            selector = common_resources.EndPointSelector()
 
             end_point_paths = [
                 ('/1/audit/topics', None)
@@ -254,27 +269,28 @@ def main():
         # Excluded end-point should always be removed from cached_schemas['directory']
         lst_filtered_end_point_paths = []
         for ep in lst_end_point_paths:
-            if ep not in exclude_end_points:
+            if selector.selects(ep):
                 lst_filtered_end_point_paths.append(ep)
             else:
                 exclude_count += 1
         cached_schemas['directory'].extend(lst_filtered_end_point_paths)
+        listed_end_points.extend(lst_end_point_paths)
         del lst_end_point_paths[:]
 
+    common_resources.log_unmatched_rules(selector, listed_end_points)
     cached_schemas['version'] = papi_version
     
     log.info(('Total End points successfully processed: %s, failed to process: %s, '
               'excluded: %s'),
              success_count, fail_count, exclude_count)
     
-    # Put cached_schemas into fle. And store the output file as <OUTPUT>.json inside isilon_sdk/papi_schemas/
+    # Put cached_schemas into fle. And store the output file as <OUTPUT>.json (or .jsonl/.manifest, see --format) inside isilon_sdk/papi_schemas/
     # This overwrites already existing file (if any) from isilon_sdk/papi_schemas/
     schemas_dir = os.path.abspath(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'papi_schemas'))
-    schemas_file = os.path.join(schemas_dir, '{}.json'.format(papi_schema_file))
-    with open(schemas_file, 'w+') as schemas:
-        schemas.write(json.dumps(
-    cached_schemas, sort_keys=True, indent=4,
-    separators=(',', ': ')))
+    schemas_file = papi_schema_snapshots.snapshot_file(
+        schemas_dir, papi_schema_file, args.snapshot_format)
+    papi_schema_snapshots.write_snapshot(
+        schemas_file, cached_schemas, args.compress)
 
 if __name__ == '__main__':
     main()
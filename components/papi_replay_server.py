@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+'''
+Local stand-in for the PAPI of a cluster, replaying a papi_schemas snapshot
+so that the live mode of generate_PAPIschemas_from_ClusterIP.py and
+create_swagger_config.py -i can be run and measured without a cluster.
+It serves /session/1/session, /platform/latest, /platform/1/cluster/config,
+/platform/3/cluster/nodes and /platform/3/network/interfaces with a single
+node, the ?describe&list&json directory and the ?describe&json document of
+every end point. Requests to /platform can be delayed and failed at random,
+see --latency, --error-rate and --drop-rate.
+The clients talk HTTPS to port 8080, --self-signed makes up a certificate
+with openssl. The collectors write papi_schemas/<release>.json, so --release
+keeps them from overwriting the replayed snapshot.
+Example usage:
+python papi_replay_server.py -v 8.0.1.2 --self-signed --release 0.8.0.1
+python generate_PAPIschemas_from_ClusterIP.py -i localhost -f indexed
+python papi_replay_server.py -v 8.0.1.2 --self-signed --latency 0.05 --load-latency 0.01 --max-in-flight 16 --error-rate 0.02
+'''
+import argparse
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from http.cookies import SimpleCookie
+import json
+import logging as log
+import os
+import random
+import shutil
+from socketserver import ThreadingMixIn
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+from urllib.parse import parse_qs, unquote, urlsplit
+import uuid
+
+import papi_schema_snapshots
+
+SESSION_COOKIE = 'isisessid'
+CSRF_COOKIE = 'isicsrf'
+
+
+class ReplayServer(ThreadingMixIn, HTTPServer):
+    """Serves a snapshot, holding the sessions and the fault injection."""
+
+    daemon_threads = True
+
+    def __init__(self, address, schemas, release, args):
+        HTTPServer.__init__(self, address, ReplayHandler)
+        self.schemas = schemas
+        self.release = release
+        self.args = args
+        self.random = random.Random(args.seed)
+        # session id -> creation time
+        self.sessions = {}
+        self.encoded = {}
+        self.in_flight = 0
+        self.status_counts = Counter()
+        self.lock = threading.Lock()
+
+    def encoded_document(self, key):
+        """Return the JSON text of a snapshot value, or None if missing."""
+        with self.lock:
+            if key not in self.encoded:
+                if key not in self.schemas:
+                    return None
+                self.encoded[key] = json.dumps(self.schemas[key]).encode(
+                    'utf-8')
+            return self.encoded[key]
+
+    def create_session(self):
+        """Return the id of a new session."""
+        session_id = uuid.uuid4().hex
+        with self.lock:
+            self.sessions[session_id] = time.time()
+        return session_id
+
+    def session_valid(self, session_id):
+        """Return whether a session exists and has not timed out."""
+        with self.lock:
+            created = self.sessions.get(session_id)
+        if created is None:
+            return False
+        return (self.args.session_timeout is None or
+                time.time() - created < self.args.session_timeout)
+
+    def fault(self):
+        """
+        Decide how a request to /platform fails, if at all.
+        Returns None, 'drop' or the HTTP status code to answer with.
+        """
+        args = self.args
+        with self.lock:
+            if args.max_in_flight and self.in_flight > args.max_in_flight:
+                return 503
+            draw = self.random.random()
+            if draw < args.drop_rate:
+                return 'drop'
+            if draw < args.drop_rate + args.error_rate:
+                return self.random.choice(args.error_codes)
+        return None
+
+    def delay(self):
+        """Return the seconds to hold a request to /platform back."""
+        args = self.args
+        with self.lock:
+            return (args.latency + args.jitter * self.random.random() +
+                    args.load_latency * (self.in_flight - 1))
+
+    def log_summary(self):
+        """Log how many responses of every status were sent."""
+        log.info('Responses by status: %s', ', '.join(
+            '{} {}'.format(status, count)
+            for status, count in sorted(self.status_counts.items())))
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    """Answers the requests the PAPI clients of this repository send."""
+
+    protocol_version = 'HTTP/1.1'
+    # buffer the headers and body of a response into a single write, or the
+    # delayed ACK of the headers holds every response back by 40 ms
+    wbufsize = -1
+
+    def log_message(self, format, *args):
+        log.debug('%s - %s', self.address_string(), format % args)
+
+    def send_json(self, status, value=None, encoded=None, cookies=None):
+        """Send a JSON response."""
+        if encoded is None:
+            encoded = json.dumps(value).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(encoded)))
+        for name, value in (cookies or {}).items():
+            self.send_header('Set-Cookie', '{}={}; Path=/'.format(name, value))
+        self.end_headers()
+        self.wfile.write(encoded)
+        with self.server.lock:
+            self.server.status_counts[status] += 1
+
+    def send_error_json(self, status, message):
+        """Send an error in the format of PAPI."""
+        self.send_json(status, {'errors': [{
+            'code': 'AEC_{}'.format(status), 'message': message}]})
+
+    def read_body(self):
+        """Read and parse the JSON body of a request."""
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length).decode('utf-8'))
+
+    def do_POST(self):
+        """Create a session, the only POST the clients send."""
+        if urlsplit(self.path).path != '/session/1/session':
+            self.send_error_json(404, 'Path not found: {}'.format(self.path))
+            return
+        body = self.read_body()
+        args = self.server.args
+        if args.username is not None and (
+                body.get('username') != args.username or
+                body.get('password') != args.password):
+            self.send_error_json(401, 'Authorization required')
+            return
+        self.send_json(
+            201, {'services': body.get('services', []),
+                  'timeout_absolute': args.session_timeout,
+                  'username': body.get('username')},
+            cookies={SESSION_COOKIE: self.server.create_session(),
+                     CSRF_COOKIE: uuid.uuid4().hex})
+
+    def do_GET(self):
+        """Answer a request to /platform, delayed or failed if configured."""
+        url = urlsplit(self.path)
+        path = unquote(url.path)
+        if path != '/platform' and not path.startswith('/platform/'):
+            self.send_error_json(404, 'Path not found: {}'.format(path))
+            return
+        cookies = SimpleCookie(self.headers.get('Cookie', ''))
+        if SESSION_COOKIE not in cookies or not self.server.session_valid(
+                cookies[SESSION_COOKIE].value):
+            self.send_error_json(401, 'Authorization required')
+            return
+
+        server = self.server
+        with server.lock:
+            server.in_flight += 1
+        try:
+            fault = server.fault()
+            if fault == 'drop':
+                # the client sees the connection closed without a response
+                self.close_connection = True
+                with server.lock:
+                    server.status_counts['dropped'] += 1
+                return
+            time.sleep(max(server.delay(), 0.0))
+            if fault is not None:
+                self.send_error_json(fault, 'Injected error')
+                return
+            self.send_platform(path[len('/platform'):], parse_qs(
+                url.query, keep_blank_values=True))
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def send_platform(self, end_point, query):
+        """Answer a request to the end point below /platform."""
+        server = self.server
+        host = (self.headers.get('Host') or 'localhost').rsplit(':', 1)[0]
+        if end_point == '' and 'describe' in query and 'list' in query:
+            self.send_json(200, {'directory': server.schemas['directory']})
+        elif end_point == '/latest':
+            self.send_json(200, {'latest': str(server.schemas['version'])})
+        elif end_point == '/1/cluster/config':
+            self.send_json(200, {
+                'name': 'replay', 'onefs_version': {
+                    'release': 'v' + server.release}})
+        elif end_point == '/3/cluster/nodes' and 'describe' not in query:
+            self.send_json(200, {'nodes': [{'id': 1, 'lnn': 1}], 'total': 1})
+        elif (end_point == '/3/network/interfaces' and
+              'describe' not in query):
+            self.send_json(200, {'interfaces': [{
+                'id': '1:ext-1', 'ip_addrs': [host], 'lnn': 1,
+                'name': 'ext-1', 'nic_name': 'em0',
+                'owners': [{'groupnet': 'groupnet0', 'pool': 'pool0',
+                            'subnet': 'subnet0'}],
+                'status': 'up', 'type': 'gige'}], 'total': 1})
+        elif 'describe' in query:
+            encoded = server.encoded_document(end_point)
+            if encoded is None:
+                self.send_error_json(
+                    404, 'Path not found: {}'.format(end_point))
+            else:
+                self.send_json(200, encoded=encoded)
+        else:
+            self.send_error_json(
+                404, 'Only ?describe is replayed: {}'.format(end_point))
+
+
+def self_signed_context():
+    """Return an SSL context with a certificate made up by openssl."""
+    cert_dir = tempfile.mkdtemp()
+    try:
+        cert_file = os.path.join(cert_dir, 'cert.pem')
+        key_file = os.path.join(cert_dir, 'key.pem')
+        subprocess.check_call(
+            ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes',
+             '-subj', '/CN=localhost', '-days', '1', '-keyout', key_file,
+             '-out', cert_file],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert_file, key_file)
+        return context
+    finally:
+        shutil.rmtree(cert_dir)
+
+
+def create_server(args):
+    """Return the ReplayServer of the parsed options."""
+    schemas_dir = os.path.abspath(os.path.join(
+        os.path.dirname(os.path.dirname(__file__)), 'papi_schemas'))
+    schemas = papi_schema_snapshots.load_snapshot(
+        papi_schema_snapshots.snapshot_file(schemas_dir, args.onefs_version))
+    server = ReplayServer((args.bind, args.port), schemas,
+                          args.release or args.onefs_version, args)
+    context = None
+    if args.certfile:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(args.certfile, args.keyfile)
+    elif args.self_signed:
+        context = self_signed_context()
+    if context is not None:
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+    return server
+
+
+def parse_arguments(argv=None):
+    """Parse the options of the replay server."""
+    argparser = argparse.ArgumentParser(
+        description='Serves a papi_schemas snapshot like the PAPI of a '
+                    'cluster.')
+    argparser.add_argument(
+        '-v', '--version', dest='onefs_version',
+        help='OneFS version of the papi_schemas snapshot to replay',
+        action='store', required=True)
+    argparser.add_argument(
+        '--release', dest='release',
+        help='OneFS release reported by /platform/1/cluster/config, '
+             'defaults to --version',
+        action='store', default=None)
+    argparser.add_argument(
+        '-b', '--bind', dest='bind',
+        help='Address to listen on', action='store', default='127.0.0.1')
+    argparser.add_argument(
+        '--port', dest='port',
+        help='Port to listen on, the clients use 8080',
+        action='store', type=int, default=8080)
+    argparser.add_argument(
+        '--certfile', dest='certfile',
+        help='Path to the PEM certificate to serve HTTPS with',
+        action='store', default=None)
+    argparser.add_argument(
+        '--keyfile', dest='keyfile',
+        help='Path to the private key of --certfile',
+        action='store', default=None)
+    argparser.add_argument(
+        '--self-signed', dest='self_signed',
+        help='Serve HTTPS with a certificate made up by openssl',
+        action='store_true', default=False)
+    argparser.add_argument(
+        '-u', '--username', dest='username',
+        help='Username sessions have to be created with, any by default',
+        action='store', default=None)
+    argparser.add_argument(
+        '-p', '--password', dest='password',
+        help='Password sessions have to be created with',
+        action='store', default=None)
+    argparser.add_argument(
+        '--session-timeout', dest='session_timeout',
+        help='Seconds after which sessions expire',
+        action='store', type=float, default=None)
+    argparser.add_argument(
+        '--latency', dest='latency',
+        help='Seconds every request to /platform is delayed by',
+        action='store', type=float, default=0.0)
+    argparser.add_argument(
+        '--jitter', dest='jitter',
+        help='Most seconds added at random to --latency',
+        action='store', type=float, default=0.0)
+    argparser.add_argument(
+        '--load-latency', dest='load_latency',
+        help='Seconds added to --latency for every other request in flight',
+        action='store', type=float, default=0.0)
+    argparser.add_argument(
+        '--max-in-flight', dest='max_in_flight',
+        help='Answer requests over this many in flight with 503',
+        action='store', type=int, default=None)
+    argparser.add_argument(
+        '--error-rate', dest='error_rate',
+        help='Fraction of requests answered with one of --error-codes',
+        action='store', type=float, default=0.0)
+    argparser.add_argument(
+        '--error-codes', dest='error_codes',
+        help='Comma separated HTTP status codes of injected errors',
+        action='store', default='500,503',
+        type=lambda codes: [int(code) for code in codes.split(',')])
+    argparser.add_argument(
+        '--drop-rate', dest='drop_rate',
+        help='Fraction of requests whose connection is closed without a '
+             'response',
+        action='store', type=float, default=0.0)
+    argparser.add_argument(
+        '--seed', dest='seed',
+        help='Seed of the injected errors and jitter',
+        action='store', type=int, default=None)
+    argparser.add_argument(
+        '-l', '--logging', dest='log_level',
+        help='Logging verbosity level', action='store', default='INFO')
+    return argparser.parse_args(argv)
+
+
+def main():
+    """Main method for the papi_replay_server executable."""
+    args = parse_arguments()
+    log.basicConfig(
+        format='%(asctime)s %(levelname)s - %(message)s',
+        datefmt='%I:%M:%S', level=getattr(log, args.log_level.upper()))
+    server = create_server(args)
+    log.info('Replaying %s on %s:%s', args.onefs_version, args.bind,
+             server.server_address[1])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        papi_schema_snapshots.close_snapshot(server.schemas)
+        server.log_summary()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+'''
+PAPI schema snapshot formats.
+A snapshot in papi_schemas/<OneFS_Release>.json is a single JSON object
+mapping every end point to its ?describe output, plus the 'directory' and
+'version' keys. Two other formats hold the same object:
+- indexed, <OneFS_Release>.jsonl with one [key, value] record per line next
+  to a <OneFS_Release>.jsonl.idx file holding the offset and length of every
+  record, so that single end points can be read without parsing the rest.
+- stored, <OneFS_Release>.manifest mapping every key to the hash of its
+  value, the values are kept once for all releases in papi_schemas/blobs,
+  optionally zlib compressed.
+While a snapshot is collected from a cluster, every value is also appended
+to a <snapshot file>.journal file with the same [key, value] records as an
+indexed snapshot, so that an interrupted crawl can be resumed.
+Example usage, converting the bundled snapshots:
+python papi_schema_snapshots.py ../papi_schemas/7.2.1.6.json ../papi_schemas/8.0.1.2.json
+python papi_schema_snapshots.py -f stored -z ../papi_schemas/8.0.0.*.json
+'''
+import argparse
+from collections import OrderedDict
+from collections.abc import Mapping, MutableMapping
+import hashlib
+import json
+import logging as log
+import mmap
+import os
+import time
+import zlib
+
+JSON_SNAPSHOT_EXT = '.json'
+INDEXED_SNAPSHOT_EXT = '.jsonl'
+INDEX_EXT = '.idx'
+MANIFEST_EXT = '.manifest'
+
+# snapshot format names and file extensions, in the order snapshot_file
+# prefers them when a release has snapshots in several formats written at
+# the same time
+SNAPSHOT_FORMATS = OrderedDict([
+    ('stored', MANIFEST_EXT),
+    ('indexed', INDEXED_SNAPSHOT_EXT),
+    ('json', JSON_SNAPSHOT_EXT)])
+
+# directory next to the manifests holding the stored values
+BLOBS_DIR = 'blobs'
+BLOB_EXT = '.json'
+COMPRESSED_BLOB_EXT = '.json.z'
+
+JOURNAL_EXT = '.journal'
+# records of a journal are flushed as they are stored but only synced to
+# disk at most this many seconds apart
+JOURNAL_SYNC_INTERVAL = 1.0
+
+
+class LazySnapshot(Mapping):
+    """
+    Read-only mapping over a snapshot whose records are parsed when they are
+    first looked up and kept afterwards, so a record that is modified by the
+    caller stays modified as it would in a loaded snapshot.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.records = {}
+
+    def load_record(self, key):
+        """Read and parse the record of key."""
+        raise NotImplementedError
+
+    def __getitem__(self, key):
+        if key not in self.records:
+            if key not in self.index:
+                raise KeyError(key)
+            self.records[key] = self.load_record(key)
+        return self.records[key]
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Release the files the records are read from."""
+
+
+class IndexedSnapshot(LazySnapshot):
+    """Snapshot read from a .jsonl file through its offset index."""
+
+    def __init__(self, schemas_file):
+        with open(schemas_file + INDEX_EXT, 'r') as index:
+            super(IndexedSnapshot, self).__init__(json.loads(index.read()))
+        with open(schemas_file, 'rb') as snapshot:
+            # mmap can not map an empty file
+            if os.fstat(snapshot.fileno()).st_size:
+                self.snapshot = mmap.mmap(
+                    snapshot.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.snapshot = b''
+
+    def load_record(self, key):
+        offset, length = self.index[key]
+        _, value = json.loads(
+            self.snapshot[offset:offset + length].decode('utf-8'))
+        return value
+
+    def close(self):
+        if isinstance(self.snapshot, mmap.mmap):
+            # closes the file descriptor the map holds as well
+            self.snapshot.close()
+
+
+class StoredSnapshot(LazySnapshot):
+    """Snapshot read from a manifest and the blobs it refers to."""
+
+    def __init__(self, manifest_file):
+        with open(manifest_file, 'r') as manifest:
+            super(StoredSnapshot, self).__init__(json.loads(manifest.read()))
+        self.blobs_dir = os.path.join(
+            os.path.dirname(manifest_file), BLOBS_DIR)
+
+    def load_record(self, key):
+        return json.loads(
+            read_blob(self.blobs_dir, self.index[key]).decode('utf-8'))
+
+
+class EncodedSnapshot(MutableMapping):
+    """
+    Snapshot being collected. Values are kept as the compact JSON text of
+    what was stored and parsed again on every lookup, so the caller owns
+    the values it stores or looks up and can change them without changing
+    the snapshot.
+    """
+
+    def __init__(self):
+        self.encoded = {}
+
+    def __getitem__(self, key):
+        return json.loads(self.encoded[key])
+
+    def __setitem__(self, key, value):
+        self.encoded[key] = json.dumps(value, sort_keys=True)
+
+    def __delitem__(self, key):
+        del self.encoded[key]
+
+    def __iter__(self):
+        return iter(self.encoded)
+
+    def __len__(self):
+        return len(self.encoded)
+
+
+class JournaledSnapshot(MutableMapping):
+    """
+    Snapshot being collected that appends every value stored to a journal
+    file, so that a crawl outliving its session can be resumed. A record
+    is [key, value], or [key] for a deleted key. With resume, the records of
+    an existing journal are loaded first, dropping a last record torn by a
+    crash, and new records are appended after them.
+    """
+
+    def __init__(self, journal_file, resume=False):
+        self.journal_file = journal_file
+        self.values = {}
+        if resume and os.path.exists(journal_file):
+            self.journal = open(journal_file, 'r+b')
+            self.journal.truncate(self.load_journal())
+            self.journal.seek(0, os.SEEK_END)
+        else:
+            if os.path.exists(journal_file):
+                log.warning('Discarding the journal %s of an earlier crawl',
+                            journal_file)
+            self.journal = open(journal_file, 'wb')
+        self.last_sync = time.time()
+
+    def load_journal(self):
+        """
+        Load the records of the journal.
+        Returns the length of the journal up to the end of its last
+        complete record.
+        """
+        length = 0
+        for line in self.journal:
+            try:
+                record = json.loads(line.decode('utf-8'))
+            except ValueError:
+                break
+            if not line.endswith(b'\n'):
+                break
+            if len(record) == 2:
+                self.values[record[0]] = record[1]
+            else:
+                self.values.pop(record[0], None)
+            length += len(line)
+        log.info('Loaded %s records from the journal %s',
+                 len(self.values), self.journal_file)
+        return length
+
+    def append(self, record):
+        """Append a record to the journal."""
+        self.journal.write(
+            json.dumps(record, sort_keys=True).encode('utf-8') + b'\n')
+        self.journal.flush()
+        if time.time() - self.last_sync >= JOURNAL_SYNC_INTERVAL:
+            os.fsync(self.journal.fileno())
+            self.last_sync = time.time()
+
+    def __getitem__(self, key):
+        return self.values[key]
+
+    def __setitem__(self, key, value):
+        self.append([key, value])
+        self.values[key] = value
+
+    def __delitem__(self, key):
+        del self.values[key]
+        self.append([key])
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def __len__(self):
+        return len(self.values)
+
+    def close(self):
+        """Sync and close the journal."""
+        if not self.journal.closed:
+            os.fsync(self.journal.fileno())
+            self.journal.close()
+
+    def remove(self):
+        """Close and delete the journal once the snapshot is written."""
+        self.close()
+        os.remove(self.journal_file)
+
+
+def blob_file(blobs_dir, digest, compressed):
+    """Return the path of a stored value."""
+    return os.path.join(
+        blobs_dir, digest[:2],
+        digest + (COMPRESSED_BLOB_EXT if compressed else BLOB_EXT))
+
+
+def read_blob(blobs_dir, digest):
+    """Return the JSON text of a stored value."""
+    try:
+        with open(blob_file(blobs_dir, digest, False), 'rb') as blob:
+            return blob.read()
+    except (IOError, OSError):
+        with open(blob_file(blobs_dir, digest, True), 'rb') as blob:
+            return zlib.decompress(blob.read())
+
+
+def write_blob(blobs_dir, value, compress):
+    """
+    Store a value unless it is stored already.
+    Returns the hash of the value and whether it was newly stored.
+    """
+    data = json.dumps(value, sort_keys=True).encode('utf-8')
+    digest = hashlib.sha1(data).hexdigest()
+    if (os.path.exists(blob_file(blobs_dir, digest, False)) or
+            os.path.exists(blob_file(blobs_dir, digest, True))):
+        return digest, False
+    file_name = blob_file(blobs_dir, digest, compress)
+    if not os.path.isdir(os.path.dirname(file_name)):
+        os.makedirs(os.path.dirname(file_name))
+    # write to a temporary file first so that a concurrent reader never
+    # sees a partial value
+    tmp_file = '{}.{}.tmp'.format(file_name, os.getpid())
+    with open(tmp_file, 'wb') as blob:
+        blob.write(zlib.compress(data) if compress else data)
+    os.replace(tmp_file, file_name)
+    return digest, True
+
+
+def snapshot_file(schemas_dir, onefs_version, snapshot_format=None):
+    """
+    Return the snapshot file of a OneFS version in snapshot_format, or if
+    that is None the most recently written snapshot of the version, in any
+    format. The collectors write a single format, a snapshot in another
+    format is left over from an earlier run.
+    """
+    if snapshot_format is not None:
+        return os.path.join(
+            schemas_dir, onefs_version + SNAPSHOT_FORMATS[snapshot_format])
+    schemas_files = [
+        os.path.join(schemas_dir, onefs_version + snapshot_ext)
+        for snapshot_ext in SNAPSHOT_FORMATS.values()]
+    schemas_files = [schemas_file for schemas_file in schemas_files
+                     if os.path.exists(schemas_file)]
+    if not schemas_files:
+        return os.path.join(schemas_dir, onefs_version + JSON_SNAPSHOT_EXT)
+    # the first of the newest files, mtimes of files written together may
+    # be equal
+    newest_file = max(schemas_files, key=os.path.getmtime)
+    if len(schemas_files) > 1:
+        log.warning('%s has snapshots in several formats, using the newest: '
+                    '%s', onefs_version, newest_file)
+    return newest_file
+
+
+def load_snapshot(schemas_file):
+    """Load a snapshot in any format."""
+    if schemas_file.endswith(MANIFEST_EXT):
+        return StoredSnapshot(schemas_file)
+    if schemas_file.endswith(INDEXED_SNAPSHOT_EXT):
+        return IndexedSnapshot(schemas_file)
+    with open(schemas_file, 'r') as schemas:
+        return json.loads(schemas.read())
+
+
+def close_snapshot(schemas):
+    """Close a snapshot returned by load_snapshot, if it holds files open."""
+    if isinstance(schemas, LazySnapshot):
+        schemas.close()
+
+
+def write_snapshot(schemas_file, schemas, compress=False):
+    """
+    Write a snapshot in the format of its file name, compress only applies
+    to stored snapshots.
+    """
+    if schemas_file.endswith(MANIFEST_EXT):
+        write_stored_snapshot(schemas_file, schemas, compress)
+    elif schemas_file.endswith(INDEXED_SNAPSHOT_EXT):
+        write_indexed_snapshot(schemas_file, schemas)
+    else:
+        write_json_snapshot(schemas_file, schemas)
+
+
+def write_json_snapshot(schemas_file, schemas):
+    """
+    Write schemas as a JSON snapshot, one value at a time so that lazy
+    snapshots never have all their values parsed at once. The text is the
+    same as json.dumps(schemas, sort_keys=True, indent=4,
+    separators=(',', ': ')).
+    """
+    with open(schemas_file, 'w+') as snapshot:
+        if not schemas:
+            snapshot.write('{}')
+            return
+        separator = '{\n    '
+        for key in sorted(schemas):
+            # newlines only occur between the tokens of encoded JSON, so
+            # they can be indented by another level
+            snapshot.write(separator + json.dumps(key) + ': ' + json.dumps(
+                schemas[key], sort_keys=True, indent=4,
+                separators=(',', ': ')).replace('\n', '\n    '))
+            separator = ',\n    '
+        snapshot.write('\n}')
+
+
+def write_indexed_snapshot(schemas_file, schemas):
+    """Write schemas as an indexed snapshot."""
+    index = {}
+    offset = 0
+    with open(schemas_file, 'wb') as snapshot:
+        for key in sorted(schemas):
+            record = json.dumps(
+                [key, schemas[key]], sort_keys=True).encode('utf-8') + b'\n'
+            snapshot.write(record)
+            index[key] = [offset, len(record)]
+            offset += len(record)
+    with open(schemas_file + INDEX_EXT, 'w') as index_file:
+        index_file.write(json.dumps(index, sort_keys=True))
+
+
+def write_stored_snapshot(manifest_file, schemas, compress=False):
+    """
+    Write schemas as a manifest, storing the values not stored for another
+    release yet.
+    """
+    blobs_dir = os.path.join(os.path.dirname(manifest_file), BLOBS_DIR)
+    manifest = {}
+    stored_count = 0
+    for key in schemas:
+        manifest[key], stored = write_blob(blobs_dir, schemas[key], compress)
+        stored_count += stored
+    with open(manifest_file, 'w') as manifest_out:
+        manifest_out.write(json.dumps(
+            manifest, sort_keys=True, indent=4, separators=(',', ': ')))
+    log.info('Stored %s new of %s values for %s',
+             stored_count, len(manifest), manifest_file)
+
+
+def main():
+    """Convert snapshots to another format."""
+    argparser = argparse.ArgumentParser(
+        description='Convert PAPI schema snapshots to another format.')
+    argparser.add_argument(
+        'schemas_files', metavar='SNAPSHOT', nargs='+',
+        help='Path to a papi_schemas/<OneFS_Release> snapshot in any format')
+    argparser.add_argument(
+        '-f', '--format', dest='snapshot_format',
+        help='Snapshot format to convert to',
+        choices=list(SNAPSHOT_FORMATS), default='indexed')
+    argparser.add_argument(
+        '-z', '--compress', dest='compress',
+        help='Compress the values of stored snapshots',
+        action='store_true', default=False)
+    argparser.add_argument(
+        '-o', '--output-dir', dest='output_dir',
+        help='Directory to write the snapshots to, defaults to the '
+             'directory of each snapshot',
+        action='store', default=None)
+    argparser.add_argument(
+        '-l', '--logging', dest='log_level',
+        help='Logging verbosity level', action='store', default='INFO')
+    args = argparser.parse_args()
+    log.basicConfig(
+        format='%(asctime)s %(levelname)s - %(message)s',
+        datefmt='%I:%M:%S', level=getattr(log, args.log_level.upper()))
+
+    for schemas_file in args.schemas_files:
+        schemas = load_snapshot(schemas_file)
+        base_name = os.path.splitext(os.path.basename(schemas_file))[0]
+        output_dir = args.output_dir or os.path.dirname(schemas_file)
+        output_file = snapshot_file(
+            output_dir, base_name, args.snapshot_format)
+        if os.path.abspath(output_file) == os.path.abspath(schemas_file):
+            log.error('%s is already in the %s format',
+                      schemas_file, args.snapshot_format)
+            close_snapshot(schemas)
+            continue
+        try:
+            write_snapshot(output_file, schemas, args.compress)
+        finally:
+            close_snapshot(schemas)
+        log.info('Wrote %s records of %s to %s',
+                 len(schemas), schemas_file, output_file)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+'''
+Structural diff of generated specs and PAPI schema snapshots.
+Every subtree of both documents is hashed bottom-up, Merkle style, and the
+comparison only descends into subtrees whose hashes differ, so an unchanged
+path, definition or end point costs a single comparison. Stored snapshots
+are compared by the hashes in their manifests first and only the values
+that differ are read.
+The report lists the added (+), removed (-) and changed (~) paths,
+operations and definitions of specs, or end points of snapshots, with the
+JSON pointers of the changes within every changed entry. The exit status
+is 1 if the documents differ, like that of diff.
+Example usage:
+python schema_diff.py ../example_output.json ../example_output_edited.json
+python schema_diff.py --json ../papi_schemas/8.0.0.5.json ../papi_schemas/8.0.0.6.json
+'''
+import argparse
+from collections import OrderedDict
+from collections.abc import Mapping
+import hashlib
+import json
+import sys
+
+import papi_schema_snapshots
+
+SWAGGER_OPERATIONS = ('get', 'put', 'post', 'delete', 'patch', 'head',
+                      'options')
+
+# keys of a snapshot that are not end points
+SNAPSHOT_KEYS = ('directory', 'version')
+
+
+def merkle_tree(value):
+    """
+    Return the Merkle tree of a JSON value as a (digest, children) pair,
+    children being a dict or list of the trees of the members or items,
+    or None for scalars. The tree is built bottom-up without recursion.
+    """
+    root = {}
+    stack = [(False, value, root, None, None)]
+    while stack:
+        expanded, node, parent, key, children = stack.pop()
+        if isinstance(node, Mapping):
+            if not expanded:
+                children = {}
+                stack.append((True, node, parent, key, children))
+                for child_key in node:
+                    stack.append(
+                        (False, node[child_key], children, child_key, None))
+                continue
+            digest = hashlib.sha1(b'{')
+            for child_key in sorted(children):
+                digest.update(json.dumps(child_key).encode('utf-8'))
+                digest.update(children[child_key][0])
+        elif isinstance(node, list):
+            if not expanded:
+                children = [None] * len(node)
+                stack.append((True, node, parent, key, children))
+                for index, child in enumerate(node):
+                    stack.append((False, child, children, index, None))
+                continue
+            digest = hashlib.sha1(b'[')
+            for child in children:
+                digest.update(child[0])
+        else:
+            digest = hashlib.sha1(
+                b'=' + json.dumps(node).encode('utf-8'))
+        parent[key] = (digest.digest(), children)
+    return root[None]
+
+
+def encode_pointer(tokens):
+    """Join reference tokens into a JSON pointer."""
+    return ''.join('/' + str(token).replace('~', '~0').replace('/', '~1')
+                   for token in tokens)
+
+
+def changed_pointers(old_tree, new_tree, max_depth):
+    """
+    Return the sorted JSON pointers of the subtrees that differ between two
+    Merkle trees, as (pointer, '+', '-' or '~') pairs. Subtrees with equal
+    digests are skipped; a change is reported where the trees stop having
+    the same members, or at max_depth.
+    """
+    changes = []
+    stack = [((), old_tree, new_tree)]
+    while stack:
+        path, old, new = stack.pop()
+        if old[0] == new[0]:
+            continue
+        old_children, new_children = old[1], new[1]
+        if len(path) == max_depth or type(old_children) != type(
+                new_children) or old_children is None:
+            changes.append((encode_pointer(path), '~'))
+        elif isinstance(old_children, dict):
+            for key in set(old_children) | set(new_children):
+                if key not in new_children:
+                    changes.append((encode_pointer(path + (key,)), '-'))
+                elif key not in old_children:
+                    changes.append((encode_pointer(path + (key,)), '+'))
+                else:
+                    stack.append((path + (key,), old_children[key],
+                                  new_children[key]))
+        elif len(old_children) != len(new_children):
+            changes.append((encode_pointer(path), '~'))
+        else:
+            for index, (old_child, new_child) in enumerate(
+                    zip(old_children, new_children)):
+                stack.append((path + (index,), old_child, new_child))
+    return sorted(changes)
+
+
+def diff_entries(old_entries, new_entries, detail_depth,
+                 old_digests=None, new_digests=None, skip_keys=()):
+    """
+    Compare two mappings of entries, e.g. the definitions of two specs,
+    leaving out skip_keys. Entries are compared by their old_digests and
+    new_digests first when both are given, so that entries with equal
+    digests are never read.
+    Returns the added and removed keys and the changed keys with the
+    changes within each entry.
+    """
+    old_keys = set(old_entries) - set(skip_keys)
+    new_keys = set(new_entries) - set(skip_keys)
+    added = sorted(new_keys - old_keys)
+    removed = sorted(old_keys - new_keys)
+    changed = OrderedDict()
+    for key in sorted(old_keys & new_keys):
+        if (old_digests is not None and new_digests is not None and
+                old_digests.get(key) == new_digests.get(key)):
+            continue
+        details = changed_pointers(
+            merkle_tree(old_entries[key]), merkle_tree(new_entries[key]),
+            detail_depth)
+        if details:
+            changed[key] = details
+    return OrderedDict(
+        [('added', added), ('removed', removed), ('changed', changed)])
+
+
+def spec_operations(spec, path_names):
+    """Return the operations of some paths of a spec by operationId."""
+    operations = {}
+    for path_name in path_names:
+        for method in SWAGGER_OPERATIONS:
+            operation = spec['paths'][path_name].get(method)
+            if isinstance(operation, dict):
+                operation_id = operation.get(
+                    'operationId', '{} {}'.format(method.upper(), path_name))
+                operations[operation_id] = (
+                    method, path_name, merkle_tree(operation)[0])
+    return operations
+
+
+def diff_specs(old_spec, new_spec, detail_depth):
+    """Compare the paths, operations and definitions of two specs."""
+    report = OrderedDict()
+    old_tree = merkle_tree(old_spec)
+    new_tree = merkle_tree(new_spec)
+    for section in ('paths', 'definitions'):
+        report[section] = diff_entries(
+            old_spec.get(section, {}), new_spec.get(section, {}),
+            detail_depth,
+            dict((key, tree[0]) for key, tree in
+                 old_tree[1].get(section, (None, {}))[1].items()),
+            dict((key, tree[0]) for key, tree in
+                 new_tree[1].get(section, (None, {}))[1].items()))
+
+    # only the operations of the paths that differ can differ
+    paths = report['paths']
+    old_operations = spec_operations(
+        old_spec, paths['removed'] + list(paths['changed']))
+    new_operations = spec_operations(
+        new_spec, paths['added'] + list(paths['changed']))
+    operations = OrderedDict([
+        ('added', sorted(
+            '{} ({} {})'.format(operation_id, method.upper(), path_name)
+            for operation_id, (method, path_name, _) in new_operations.items()
+            if operation_id not in old_operations)),
+        ('removed', sorted(
+            '{} ({} {})'.format(operation_id, method.upper(), path_name)
+            for operation_id, (method, path_name, _) in old_operations.items()
+            if operation_id not in new_operations)),
+        ('changed', sorted(
+            '{} ({} {})'.format(operation_id, method.upper(), path_name)
+            for operation_id, (method, path_name, digest) in
+            new_operations.items()
+            if operation_id in old_operations and
+            old_operations[operation_id] != (method, path_name, digest)))])
+    report['operations'] = operations
+
+    report['other'] = [
+        change for change in changed_pointers(old_tree, new_tree, 2)
+        if not change[0].startswith(('/paths/', '/definitions/'))]
+    return report
+
+
+def diff_snapshots(old_snapshot, new_snapshot, detail_depth):
+    """Compare the end points, directory and version of two snapshots."""
+    digests = []
+    for snapshot in (old_snapshot, new_snapshot):
+        if isinstance(snapshot, papi_schema_snapshots.StoredSnapshot):
+            digests.append(snapshot.index)
+        else:
+            digests.append(None)
+    report = OrderedDict()
+    report['end points'] = diff_entries(
+        old_snapshot, new_snapshot, detail_depth, *digests,
+        skip_keys=SNAPSHOT_KEYS)
+    old_directory = set(old_snapshot.get('directory') or [])
+    new_directory = set(new_snapshot.get('directory') or [])
+    report['directory'] = OrderedDict([
+        ('added', sorted(new_directory - old_directory)),
+        ('removed', sorted(old_directory - new_directory))])
+    report['other'] = []
+    if old_snapshot.get('version') != new_snapshot.get('version'):
+        report['other'].append(('/version', '~'))
+    return report
+
+
+def load_document(file_name):
+    """Load a spec or a snapshot in any format."""
+    return papi_schema_snapshots.load_snapshot(file_name)
+
+
+def diff_documents(old_document, new_document, detail_depth=2):
+    """Compare two specs, or two snapshots if either is not a spec."""
+    if 'swagger' in old_document and 'swagger' in new_document:
+        return diff_specs(old_document, new_document, detail_depth)
+    return diff_snapshots(old_document, new_document, detail_depth)
+
+
+def report_has_changes(report):
+    """Return whether a report lists any difference."""
+    for section in report.values():
+        if isinstance(section, dict):
+            if any(section.values()):
+                return True
+        elif section:
+            return True
+    return False
+
+
+def print_report(report):
+    """Print a report as compact text."""
+    for section_name, section in report.items():
+        if section_name == 'other':
+            for pointer, change in section:
+                print('{} {}'.format(change, pointer))
+            continue
+        if not any(section.values()):
+            continue
+        print('{}: {}'.format(section_name, ', '.join(
+            '{} {}'.format(len(section[change]), change)
+            for change in section if section[change])))
+        for key in section['added']:
+            print('  + {}'.format(key))
+        for key in section['removed']:
+            print('  - {}'.format(key))
+        changed = section.get('changed', [])
+        for key in changed:
+            if isinstance(changed, dict):
+                print('  ~ {}: {}'.format(key, ' '.join(
+                    '{}{}'.format(change, pointer or '/')
+                    for pointer, change in changed[key])))
+            else:
+                print('  ~ {}'.format(key))
+
+
+def main():
+    """Main method for the schema_diff executable."""
+    argparser = argparse.ArgumentParser(
+        description='Compares two specs or two PAPI schema snapshots.')
+    argparser.add_argument(
+        'old_file', metavar='OLD',
+        help='Path to a spec or a papi_schemas snapshot in any format')
+    argparser.add_argument(
+        'new_file', metavar='NEW',
+        help='Path to a spec or a papi_schemas snapshot in any format')
+    argparser.add_argument(
+        '-d', '--depth', dest='detail_depth',
+        help='Depth within a changed entry down to which changes are '
+             'listed',
+        action='store', type=int, default=2)
+    argparser.add_argument(
+        '--json', dest='json_report',
+        help='Print the report as JSON',
+        action='store_true', default=False)
+    args = argparser.parse_args()
+
+    old_document = load_document(args.old_file)
+    new_document = load_document(args.new_file)
+    try:
+        report = diff_documents(old_document, new_document, args.detail_depth)
+    finally:
+        papi_schema_snapshots.close_snapshot(old_document)
+        papi_schema_snapshots.close_snapshot(new_document)
+    if args.json_report:
+        print(json.dumps(report, indent=4, separators=(',', ': ')))
+    else:
+        print_report(report)
+    if report_has_changes(report):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
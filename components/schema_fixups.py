@@ -0,0 +1,397 @@
+'''
+Table driven fixups of invalid PAPI schemas.
+The rules in schema_fixups.json are grouped by stage: 'schema' rules are
+applied to every object schema while it is converted, under the name of the
+definition it becomes, 'definitions' rules to the definitions of the
+finished spec. A rule names the definitions it applies to, exactly or by a
+pattern with a leading and/or trailing '*', and holds a JSON patch
+(RFC 6902) applied to the schema when all of its conditions hold:
+{
+    "name": "job-policies-types",
+    "description": "Renamed 'types' property to 'policies'",
+    "definitions": ["JobPolicies"],
+    "when": [{"op": "exists", "path": "/properties/types"}],
+    "patch": [{"op": "move", "from": "/properties/types",
+               "path": "/properties/policies"}]
+}
+Conditions are 'exists' and 'absent' paths and the 'test' of a path against
+a value. Besides add, remove, replace, move and copy a patch may use
+remove with "optional": true, which does nothing if the path is missing.
+The rules that apply to a definition run in the order of the file, a rule
+with "final": true skips the rules after it once it has been applied.
+'''
+from collections import OrderedDict
+from copy import deepcopy
+import json
+import logging as log
+import os
+
+FIXUPS_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'schema_fixups.json')
+
+FIXUP_STAGES = ('schema', 'definitions')
+
+CONDITION_OPS = ('exists', 'absent', 'test')
+PATCH_OPS = ('add', 'remove', 'replace', 'move', 'copy')
+
+
+def decode_pointer(pointer):
+    """Split a JSON pointer into its reference tokens."""
+    if pointer == '':
+        return []
+    if not pointer.startswith('/'):
+        raise ValueError('Invalid JSON pointer: {}'.format(pointer))
+    return [token.replace('~1', '/').replace('~0', '~')
+            for token in pointer[1:].split('/')]
+
+
+def resolve_pointer(document, tokens):
+    """Return the value tokens refer to, raises LookupError if missing."""
+    value = document
+    for token in tokens:
+        if isinstance(value, list):
+            if not token.isdigit():
+                raise LookupError(token)
+            value = value[int(token)]
+        elif isinstance(value, dict):
+            value = value[token]
+        else:
+            raise LookupError(token)
+    return value
+
+
+def pointer_exists(document, tokens):
+    """Return whether tokens refer to a value in document."""
+    try:
+        resolve_pointer(document, tokens)
+    except LookupError:
+        return False
+    return True
+
+
+def add_value(document, tokens, value):
+    """Add or set the value tokens refer to."""
+    parent = resolve_pointer(document, tokens[:-1])
+    if isinstance(parent, list):
+        if tokens[-1] == '-':
+            parent.append(value)
+        else:
+            parent.insert(int(tokens[-1]), value)
+    else:
+        parent[tokens[-1]] = value
+
+
+def replace_value(document, tokens, value):
+    """Set the value tokens refer to, which must exist."""
+    parent = resolve_pointer(document, tokens[:-1])
+    resolve_pointer(parent, tokens[-1:])
+    if isinstance(parent, list):
+        parent[int(tokens[-1])] = value
+    else:
+        parent[tokens[-1]] = value
+
+
+def remove_value(document, tokens):
+    """Remove and return the value tokens refer to."""
+    parent = resolve_pointer(document, tokens[:-1])
+    if isinstance(parent, list):
+        return parent.pop(int(tokens[-1]))
+    return parent.pop(tokens[-1])
+
+
+class FixupRule(object):
+    """A fixup rule as read from the rules file."""
+
+    def __init__(self, rule):
+        self.name = rule['name']
+        self.description = rule.get('description', '')
+        self.definitions = rule['definitions']
+        self.final = rule.get('final', False)
+        self.when = []
+        for condition in rule.get('when', []):
+            if condition['op'] not in CONDITION_OPS:
+                raise ValueError('Unknown condition {} in fixup {}'.format(
+                    condition['op'], self.name))
+            self.when.append((condition['op'],
+                              decode_pointer(condition['path']),
+                              condition.get('value')))
+        self.patch = []
+        for operation in rule['patch']:
+            if operation['op'] not in PATCH_OPS:
+                raise ValueError('Unknown operation {} in fixup {}'.format(
+                    operation['op'], self.name))
+            if operation['op'] in ('move', 'copy'):
+                source = decode_pointer(operation['from'])
+            else:
+                source = None
+            tokens = decode_pointer(operation['path'])
+            if not tokens:
+                raise ValueError('Fixup {} can not {} the whole schema'.format(
+                    self.name, operation['op']))
+            self.patch.append((operation['op'], tokens, source,
+                               operation.get('value'),
+                               operation.get('optional', False)))
+
+    def applies(self, schema):
+        """Return whether all conditions of the rule hold for schema."""
+        for condition, tokens, value in self.when:
+            if condition == 'test':
+                try:
+                    if resolve_pointer(schema, tokens) != value:
+                        return False
+                except LookupError:
+                    return False
+            elif pointer_exists(schema, tokens) != (condition == 'exists'):
+                return False
+        return True
+
+    def apply(self, schema):
+        """Apply the patch of the rule to schema in place."""
+        for operation, tokens, source, value, optional in self.patch:
+            try:
+                if operation == 'add':
+                    add_value(schema, tokens, deepcopy(value))
+                elif operation == 'remove':
+                    if not optional or pointer_exists(schema, tokens):
+                        remove_value(schema, tokens)
+                elif operation == 'replace':
+                    replace_value(schema, tokens, deepcopy(value))
+                elif operation == 'move':
+                    add_value(schema, tokens, remove_value(schema, source))
+                else:
+                    add_value(schema, tokens,
+                              deepcopy(resolve_pointer(schema, source)))
+            except (LookupError, ValueError):
+                raise RuntimeError('Fixup {} failed to {} {}'.format(
+                    self.name, operation, '/'.join([''] + tokens)))
+
+
+class DefinitionIndex(object):
+    """
+    Values indexed by the definition name patterns they apply to: exact
+    names in a dict, prefixes in a character trie and the few suffix and
+    substring patterns in a list checked for every name, so that a
+    definition only meets the values that can apply to it.
+    """
+
+    def __init__(self):
+        self.exact = {}
+        # trie nodes are (children by character, values of the prefix)
+        self.prefixes = ({}, [])
+        self.patterns = []
+        self.size = 0
+        self.candidate_values = {}
+
+    def add(self, patterns, value):
+        """Index value under a list of definition name patterns."""
+        entry = (self.size, value)
+        self.size += 1
+        self.candidate_values.clear()
+        for pattern in patterns:
+            if pattern.startswith('*'):
+                self.patterns.append((pattern, entry))
+            elif pattern.endswith('*'):
+                node = self.prefixes
+                for char in pattern[:-1]:
+                    node = node[0].setdefault(char, ({}, []))
+                node[1].append(entry)
+            else:
+                self.exact.setdefault(pattern, []).append(entry)
+
+    def candidates(self, definition_name):
+        """
+        Return the values that apply to definition_name in the order they
+        were added.
+        """
+        if definition_name in self.candidate_values:
+            return self.candidate_values[definition_name]
+        entries = dict(self.exact.get(definition_name, []))
+        node = self.prefixes
+        entries.update(node[1])
+        for char in definition_name:
+            node = node[0].get(char)
+            if node is None:
+                break
+            entries.update(node[1])
+        for pattern, entry in self.patterns:
+            if pattern.endswith('*'):
+                if pattern[1:-1] in definition_name:
+                    entries[entry[0]] = entry[1]
+            elif definition_name.endswith(pattern[1:]):
+                entries[entry[0]] = entry[1]
+        values = [entries[order] for order in sorted(entries)]
+        self.candidate_values[definition_name] = values
+        return values
+
+
+class FixupRegistry(object):
+    """The fixup rules of one stage, indexed by definition name."""
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.index = DefinitionIndex()
+        self.fired = OrderedDict((rule.name, 0) for rule in rules)
+        if len(self.fired) != len(rules):
+            raise ValueError('Duplicate fixup rule names')
+        for rule in rules:
+            self.index.add(rule.definitions, rule)
+
+    def apply(self, definition_name, schema):
+        """
+        Apply the rules that apply to definition_name to schema in place.
+        Returns the names of the rules that were applied.
+        """
+        applied = []
+        for rule in self.index.candidates(definition_name):
+            if not rule.applies(schema):
+                continue
+            rule.apply(schema)
+            self.fired[rule.name] += 1
+            applied.append(rule.name)
+            log.warning('Fixup %s of %s: %s',
+                        rule.name, definition_name, rule.description)
+            if rule.final:
+                break
+        return applied
+
+
+class SchemaVisitor(object):
+    """
+    Walks schemas and hands every node to the handlers registered for its
+    path in the definition being walked, e.g. '/properties/*' for every
+    property or '/**/items' for the items of every array. The walk keeps its
+    own stack instead of recursing, so deeply nested schemas can not hit
+    the recursion limit, and only descends into nodes that the path of some
+    handler can still match.
+    Handlers are called as handler(definition_name, key, node, parent) in
+    the order they were registered, all with the same node, so each sees the
+    changes the handlers before it made to the node in place, and node_type
+    is checked against the node as those left it. The walk then descends
+    into parent[key], whatever the handlers left there.
+    """
+
+    def __init__(self):
+        self.handlers = DefinitionIndex()
+
+    def register(self, definitions, path, handler, node_type=None):
+        """
+        Register handler for the nodes at path, a JSON pointer in which '*'
+        matches any key and '**' any number of keys, of the definitions
+        matching the name patterns.
+        With node_type only schemas of that type are handed to it.
+        """
+        pattern = tuple(decode_pointer(path))
+        self.handlers.add(definitions, (
+            pattern, node_type, handler,
+            frozenset(expand_path_states(pattern, {0}))))
+
+    def handles(self, definitions, path, node_type=None):
+        """Decorator registering a handler, see register."""
+        def register_handler(handler):
+            self.register(definitions, path, handler, node_type)
+            return handler
+        return register_handler
+
+    def visit(self, definition_name, schema):
+        """Walk the schema of a definition."""
+        # every stack entry carries the handlers whose path can still match
+        # the node or its descendants, with the positions reached in the
+        # path of each
+        active = [(handler, handler[3])
+                  for handler in self.handlers.candidates(definition_name)]
+        if not active:
+            return
+        stack = [(active, None, schema, None)]
+        while stack:
+            active, key, node, parent = stack.pop()
+            for (pattern, node_type, handler, _), states in active:
+                if len(pattern) in states and (node_type is None or (
+                        isinstance(node, dict) and
+                        node.get('type') == node_type)):
+                    handler(definition_name, key, node, parent)
+            active = [(handler, states) for handler, states in active
+                      if min(states) < len(handler[0])]
+            if not active:
+                continue
+            if parent is not None:
+                # handlers may have replaced or removed the node
+                try:
+                    node = parent[key]
+                except LookupError:
+                    continue
+            if isinstance(node, dict):
+                children = list(node.items())
+            elif isinstance(node, list):
+                children = list(enumerate(node))
+            else:
+                continue
+            for child_key, child in reversed(children):
+                child_active = []
+                for handler, states in active:
+                    child_states = advance_path_states(
+                        handler[0], states, str(child_key))
+                    if child_states:
+                        child_active.append((handler, child_states))
+                if child_active:
+                    stack.append((child_active, child_key, child, node))
+
+    def visit_definitions(self, definitions):
+        """Walk all definitions of a spec."""
+        for definition_name, definition in definitions.items():
+            self.visit(definition_name, definition)
+
+
+def expand_path_states(pattern, states):
+    """Add the positions a '**' in a handler path can skip to."""
+    states = set(states)
+    pending = list(states)
+    while pending:
+        state = pending.pop()
+        if (state < len(pattern) and pattern[state] == '**' and
+                state + 1 not in states):
+            states.add(state + 1)
+            pending.append(state + 1)
+    return states
+
+
+def advance_path_states(pattern, states, token):
+    """Return the positions reached in a handler path after a key."""
+    next_states = set()
+    for state in states:
+        if state == len(pattern):
+            continue
+        if pattern[state] == '**':
+            next_states.add(state)
+        elif pattern[state] == '*' or pattern[state] == token:
+            next_states.add(state + 1)
+    return expand_path_states(pattern, next_states)
+
+
+def load_fixups(fixups_file=FIXUPS_FILE):
+    """Return the FixupRegistry of every stage of a rules file by stage."""
+    with open(fixups_file, 'r') as fixups:
+        stage_rules = json.loads(fixups.read())
+    for stage in stage_rules:
+        if stage not in FIXUP_STAGES:
+            raise ValueError('Unknown fixup stage {} in {}'.format(
+                stage, fixups_file))
+    return OrderedDict(
+        (stage, FixupRegistry(
+            [FixupRule(rule) for rule in stage_rules.get(stage, [])]))
+        for stage in FIXUP_STAGES)
+
+
+def print_fixup_report(fixups):
+    """
+    Print how often every rule was applied. Rules that were never applied
+    may have been fixed in PAPI and are candidates for removal.
+    """
+    print('\n{:<8} {:<48} {:>8}'.format('Stage', 'Fixup', 'applied'))
+    unused = []
+    for stage, registry in fixups.items():
+        for rule_name, count in registry.fired.items():
+            print('{:<8} {:<48} {:>8}'.format(stage, rule_name, count))
+            if not count:
+                unused.append(rule_name)
+    if unused:
+        print('\nFixups never applied: {}'.format(', '.join(unused)))
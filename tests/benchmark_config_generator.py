@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Benchmarks the create_swagger_config generator over the bundled
+papi_schemas snapshots, offline.
+Every run generates the spec of one OneFS version in a fresh process and
+splits its wall time into consecutive phases: load, ordering, conversion,
+fixups and serialization. Times are the best of --repeat runs, memory
+peaks come from one extra run under tracemalloc because tracing slows the
+generator down several times.
+Example usage:
+python tests/benchmark_config_generator.py -o report.json
+python tests/benchmark_config_generator.py -b report.json -t 0.2
+"""
+import argparse
+from collections import OrderedDict
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMPONENTS_DIR = os.path.join(ROOT_DIR, 'components')
+SCHEMAS_DIR = os.path.join(ROOT_DIR, 'papi_schemas')
+
+PHASES = ('load', 'ordering', 'conversion', 'fixups', 'serialization')
+# differences in time below this many seconds are never reported as a
+# regression, short phases vary by more than any sensible threshold
+TIME_NOISE_FLOOR = 0.005
+
+
+class PhaseTimer(object):
+    """Splits a generator run into consecutive PHASES."""
+
+    def __init__(self, trace):
+        self.trace = trace
+        self.times = OrderedDict()
+        self.peaks = OrderedDict()
+        self.phase = PHASES[0]
+        self.start = self.run_start = time.perf_counter()
+
+    def next_phase(self, phase):
+        """End the current phase and start the given one."""
+        now = time.perf_counter()
+        self.times[self.phase] = (
+            self.times.get(self.phase, 0.0) + now - self.start)
+        if self.trace:
+            self.peaks[self.phase] = max(
+                self.peaks.get(self.phase, 0),
+                tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        self.phase = phase
+        self.start = now
+
+    def wrap(self, module, func_name, before=None, after=None):
+        """Switch phases around calls of module.func_name."""
+        func = getattr(module, func_name)
+
+        def wrapper(*args, **kwargs):
+            if before is not None:
+                self.next_phase(before)
+            result = func(*args, **kwargs)
+            if after is not None:
+                self.next_phase(after)
+            return result
+        setattr(module, func_name, wrapper)
+
+
+def run_generator(onefs_version, trace):
+    """
+    Generate the spec of onefs_version in this process.
+    Returns the wall time, phase times and, if trace is set, the tracemalloc
+    peaks of the run.
+    """
+    sys.path.insert(0, COMPONENTS_DIR)
+    import create_swagger_config as csc
+
+    timer = PhaseTimer(trace)
+    timer.wrap(csc.papi_schema_snapshots, 'load_snapshot', after='ordering')
+    timer.wrap(csc, 'get_endpoint_paths', after='conversion')
+    timer.wrap(csc, 'fix_multiple_data_types_in_schema',
+               before='fixups', after='serialization')
+
+    output_dir = tempfile.mkdtemp()
+    output_file = os.path.join(output_dir, onefs_version + '.json')
+    sys.argv = ['create_swagger_config.py', '-a', '-l', 'CRITICAL',
+                '-v', onefs_version, '-o', output_file]
+    if trace:
+        tracemalloc.start()
+    timer.start = timer.run_start = time.perf_counter()
+    try:
+        csc.main()
+        timer.next_phase(None)
+    finally:
+        if os.path.exists(output_file):
+            os.remove(output_file)
+        os.rmdir(output_dir)
+    result = {
+        'wall': time.perf_counter() - timer.run_start,
+        'phases': timer.times}
+    if trace:
+        result['peak_memory'] = max(timer.peaks.values())
+        result['phase_peak_memory'] = timer.peaks
+    return result
+
+
+def benchmark_version(onefs_version, repeat):
+    """
+    Run the generator for onefs_version in fresh processes.
+    Returns the best times of repeat runs and the memory peaks of one
+    traced run, or the error of a failing run.
+    """
+    best = None
+    for trace in [False] * repeat + [True]:
+        command = [sys.executable, os.path.abspath(__file__),
+                   '--run', onefs_version]
+        if trace:
+            command.append('--trace')
+        process = subprocess.run(
+            command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            universal_newlines=True)
+        if process.returncode != 0:
+            return {'error': process.stderr.strip().splitlines()[-1]}
+        result = json.loads(process.stdout)
+        if trace:
+            best['peak_memory'] = result['peak_memory']
+            best['phase_peak_memory'] = result['phase_peak_memory']
+        elif best is None:
+            best = result
+        else:
+            best['wall'] = min(best['wall'], result['wall'])
+            for phase, phase_time in result['phases'].items():
+                best['phases'][phase] = min(
+                    best['phases'][phase], phase_time)
+    return best
+
+
+def bundled_versions():
+    """Return the OneFS versions of the bundled snapshots."""
+    versions = set()
+    for file_name in os.listdir(SCHEMAS_DIR):
+        version = file_name.split('.json')[0].split('.manifest')[0]
+        if re.match(r'^\d+(\.\d+)+$', version):
+            versions.add(version)
+    return sorted(versions, key=lambda v: [int(n) for n in v.split('.')])
+
+
+def report_metrics(result):
+    """Return the comparable metrics of a version result by name."""
+    metrics = OrderedDict()
+    metrics['wall'] = result['wall']
+    for phase in PHASES:
+        metrics[phase] = result['phases'].get(phase, 0.0)
+    if 'peak_memory' in result:
+        metrics['peak_memory'] = result['peak_memory']
+    return metrics
+
+
+def compare_reports(baseline, report, threshold):
+    """
+    Print every metric next to its baseline.
+    Returns the number of metrics that grew by more than threshold.
+    """
+    regressions = 0
+    print('{:<10} {:<14} {:>14} {:>14} {:>8}'.format(
+        'version', 'metric', 'baseline', 'current', 'change'))
+    for version, result in report['results'].items():
+        baseline_result = baseline['results'].get(version)
+        if baseline_result is None or 'error' in baseline_result:
+            continue
+        if 'error' in result:
+            print('{:<10} {}'.format(version, result['error']))
+            regressions += 1
+            continue
+        baseline_metrics = report_metrics(baseline_result)
+        for metric, value in report_metrics(result).items():
+            if metric not in baseline_metrics:
+                continue
+            baseline_value = baseline_metrics[metric]
+            change = (value / baseline_value - 1) if baseline_value else 0.0
+            regressed = change > threshold and (
+                metric == 'peak_memory' or
+                value - baseline_value > TIME_NOISE_FLOOR)
+            regressions += regressed
+            value_format = ('{:>14d}' if metric == 'peak_memory'
+                            else '{:>14.4f}')
+            print(('{:<10} {:<14} ' + value_format + ' ' + value_format +
+                   ' {:>+7.1%}{}').format(
+                       version, metric, baseline_value, value, change,
+                       ' REGRESSION' if regressed else ''))
+    return regressions
+
+
+def main():
+    """Main method for the benchmark executable."""
+    argparser = argparse.ArgumentParser(
+        description='Benchmarks create_swagger_config over the bundled '
+                    'PAPI schema snapshots.')
+    argparser.add_argument(
+        '-v', '--versions', dest='versions',
+        help='Comma separated OneFS versions, defaults to all bundled '
+             'snapshots',
+        action='store', default=None)
+    argparser.add_argument(
+        '-r', '--repeat', dest='repeat',
+        help='Number of timed runs per version, the best one is reported',
+        action='store', type=int, default=3)
+    argparser.add_argument(
+        '-o', '--output', dest='output_file',
+        help='Path to write the JSON report to',
+        action='store', default=None)
+    argparser.add_argument(
+        '-b', '--baseline', dest='baseline_file',
+        help='Path to a previous JSON report to compare against',
+        action='store', default=None)
+    argparser.add_argument(
+        '-t', '--threshold', dest='threshold',
+        help='Relative growth of a metric over the baseline that counts as '
+             'a regression',
+        action='store', type=float, default=0.2)
+    argparser.add_argument(
+        '--run', dest='run_version', help=argparse.SUPPRESS, default=None)
+    argparser.add_argument(
+        '--trace', dest='trace', help=argparse.SUPPRESS,
+        action='store_true', default=False)
+    args = argparser.parse_args()
+
+    if args.run_version:
+        print(json.dumps(run_generator(args.run_version, args.trace)))
+        return
+
+    versions = (args.versions.split(',') if args.versions
+                else bundled_versions())
+    report = {
+        'python': sys.version.split()[0],
+        'repeat': args.repeat,
+        'results': OrderedDict()}
+    for version in versions:
+        result = benchmark_version(version, args.repeat)
+        report['results'][version] = result
+        if 'error' in result:
+            print('{}: {}'.format(version, result['error']))
+        else:
+            print('{}: {:.3f}s ({}), peak {:.1f} MB'.format(
+                version, result['wall'], ', '.join(
+                    '{} {:.3f}s'.format(phase, result['phases'][phase])
+                    for phase in PHASES if phase in result['phases']),
+                result['peak_memory'] / 1024.0 / 1024.0))
+
+    if args.output_file:
+        with open(args.output_file, 'w') as output_file:
+            output_file.write(json.dumps(
+                report, indent=4, separators=(',', ': ')))
+
+    if args.baseline_file:
+        with open(args.baseline_file, 'r') as baseline_file:
+            baseline = json.loads(baseline_file.read())
+        if compare_reports(baseline, report, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,9 +4,21 @@ Basic unit/smoke tests for the create_swagger_config generator.
 Does not assume access to any cluster for the ability to actually generate
 a swagger config.
 """
+import asyncio
+from collections import Counter, OrderedDict
 import copy
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
 import unittest
 
+import requests
+
+
 class TestCreateSwaggerConfig(unittest.TestCase):
     """Test class for components/create_swagger_config.py."""
 
@@ -523,6 +535,881 @@ class TestCreateSwaggerConfig(unittest.TestCase):
         }
         self.assertEqual(isi_schema, expected)
 
+    def test_find_or_add_obj_def(self):
+        """Reuse matching definitions and extend on required differences."""
+        props = {
+            'fingerprint_name': {'type': 'string'},
+            'fingerprint_size': {'type': 'integer'}
+        }
+        first_ref = csc.find_or_add_obj_def(
+            {'properties': copy.deepcopy(props), 'type': 'object'},
+            'FingerprintItem', 'Extended')
+        self.assertEqual(first_ref, '#/definitions/FingerprintItem')
+
+        # It reuses a definition with the same properties and required list.
+        same_ref = csc.find_or_add_obj_def(
+            {'properties': copy.deepcopy(props), 'type': 'object'},
+            'FingerprintOther', 'Extended')
+        self.assertEqual(same_ref, first_ref)
+
+        # It subclasses a definition that differs only in required props.
+        extended_ref = csc.find_or_add_obj_def(
+            {'properties': copy.deepcopy(props), 'type': 'object',
+             'required': ['fingerprint_name']},
+            'FingerprintItem', 'Extended')
+        self.assertEqual(
+            extended_ref, '#/definitions/FingerprintItemExtended')
+        self.assertEqual(
+            csc.SWAGGER_DEFS['FingerprintItemExtended']['allOf'][0],
+            {'$ref': '#/definitions/FingerprintItem'})
+
+    def test_flattened_def_cache(self):
+        """Flatten allOf definitions once until a definition changes."""
+        csc.set_object_def('FlattenBase', {
+            'properties': {'flatten_id': {'type': 'string'}},
+            'required': ['flatten_id']})
+        csc.set_object_def('FlattenBaseExtended', {'allOf': [
+            {'$ref': '#/definitions/FlattenBase'},
+            {'properties': {'flatten_size': {'type': 'integer'}}}]})
+        stats = csc.FLATTENED_DEFS_STATS
+        misses, hits, rebuilds = \
+            stats['misses'], stats['hits'], stats['rebuilds']
+
+        flattened = csc.get_object_def('FlattenBaseExtended')
+        self.assertEqual(
+            sorted(flattened['properties']), ['flatten_id', 'flatten_size'])
+        self.assertEqual(flattened['required'], ['flatten_id'])
+        self.assertIs(csc.get_object_def('FlattenBaseExtended'), flattened)
+        self.assertEqual(stats['misses'], misses + 1)
+        self.assertEqual(stats['hits'], hits + 1)
+
+        # It rebuilds the flattened definition after its base is replaced.
+        csc.set_object_def('FlattenBase', {
+            'properties': {'flatten_name': {'type': 'string'}}})
+        flattened = csc.get_object_def('FlattenBaseExtended')
+        self.assertEqual(
+            sorted(flattened['properties']), ['flatten_name', 'flatten_size'])
+        self.assertNotIn('required', flattened)
+        self.assertEqual(stats['rebuilds'], rebuilds + 1)
+
+    def test_fetch_end_point_descriptions(self):
+        """Fetch base and item end point descriptions in parallel."""
+        class FakeResponse(object):
+            def __init__(self, url):
+                self.url = url
+
+            def json(self):
+                return {'url': self.url}
+
+        class FakeSession(object):
+            def mount(self, prefix, adapter):
+                pass
+
+            def get(self, url, params=None, verify=True):
+                return FakeResponse(url)
+
+        end_point_paths = [
+            ('/3/protocols/nfs/exports', '/3/protocols/nfs/exports/<EID>'),
+            ('/1/cluster/config', None),
+            (None, '/1/auth/roles/<ROLE>')]
+        describe_docs = csc.fetch_end_point_descriptions(
+            'cluster', '8080', '/platform', FakeSession(), end_point_paths, 2)
+
+        self.assertEqual(len(describe_docs), 4)
+        self.assertEqual(
+            describe_docs['/1/auth/roles/<ROLE>'],
+            {'url': 'https://cluster:8080/platform/1/auth/roles/<ROLE>'})
+
+    def test_collect_schemas_async(self):
+        """Retry transient failures at the back of the queue, then give up."""
+        class FakeResponse(object):
+            def __init__(self, status_code, value=None):
+                self.status_code = status_code
+                self.text = 'status {}'.format(status_code)
+                self.value = value
+
+            def json(self):
+                if self.value is None:
+                    raise ValueError('No JSON object could be decoded')
+                return self.value
+
+        class FakeSession(object):
+            def __init__(self, responses):
+                # url -> responses to send in turn, the last one repeats
+                self.responses = responses
+                self.calls = Counter()
+
+            def mount(self, prefix, adapter):
+                pass
+
+            def get(self, url, params=None, verify=True):
+                self.calls[url] += 1
+                responses = self.responses[url]
+                response = responses[min(self.calls[url], len(responses)) - 1]
+                if isinstance(response, Exception):
+                    raise response
+                return response
+
+        base_url = 'https://cluster:8080/platform'
+        session = FakeSession({
+            base_url + '/1/flaky': [
+                FakeResponse(503),
+                requests.exceptions.ConnectionError('reset'),
+                FakeResponse(200, {'GET_args': {}})],
+            base_url + '/1/fine': [FakeResponse(200, {'POST_args': {}})],
+            base_url + '/1/down': [FakeResponse(502)],
+            base_url + '/1/broken': [FakeResponse(200)],
+            base_url + '/1/expired': [FakeResponse(401, {'errors': [
+                {'code': 'AEC_UNAUTHORIZED',
+                 'message': 'Authorization required'}]})]})
+        cached_schemas = {}
+        retry_backoff = cluster_ip.RETRY_BACKOFF
+        cluster_ip.RETRY_BACKOFF = 0.001
+        loop = asyncio.new_event_loop()
+        try:
+            counts = loop.run_until_complete(asyncio.wait_for(
+                cluster_ip.collect_schemas_async(
+                    loop, 'cluster', '8080', '/platform', session,
+                    ['/1/flaky', '/1/fine', '/1/down', '/1/broken',
+                     '/1/expired'],
+                    cached_schemas, 2, 2),
+                10))
+            # the workers are cancelled once the queue is done
+            if hasattr(asyncio, 'all_tasks'):
+                all_tasks = asyncio.all_tasks
+            else:
+                # Python 3.6
+                all_tasks = asyncio.Task.all_tasks
+            self.assertEqual(
+                [task for task in all_tasks(loop) if not task.done()], [])
+        finally:
+            loop.close()
+            cluster_ip.RETRY_BACKOFF = retry_backoff
+
+        self.assertEqual(counts, (2, 3))
+        self.assertEqual(cached_schemas, {'/1/flaky': {'GET_args': {}},
+                                          '/1/fine': {'POST_args': {}}})
+        self.assertEqual(session.calls[base_url + '/1/flaky'], 3)
+        # retried twice after the first attempt
+        self.assertEqual(session.calls[base_url + '/1/down'], 3)
+        # not worth retrying, and error bodies are not collected
+        self.assertEqual(session.calls[base_url + '/1/broken'], 1)
+        self.assertEqual(session.calls[base_url + '/1/expired'], 1)
+
+    def test_replay_conversion(self):
+        """Replay recorded conversions only while their refs still hold."""
+        isi_schema = {
+            'type': 'object',
+            'properties': {'replay_name': {'type': 'string'}}
+        }
+        conversion_record = {}
+        csc.begin_conversion(conversion_record)
+        csc.isi_schema_to_swagger_object(
+            'Replay', 'Item', isi_schema, 'Extended')
+        csc.end_conversion(
+            conversion_record, None, '/1/replay/item',
+            ['/1/replay/item', None], 'digest', None, None, {})
+        end_point_record = conversion_record['/1/replay/item']
+        self.assertEqual(
+            end_point_record['calls'][0][-1], '#/definitions/ReplayItem')
+
+        # It holds while the recorded definition is still found.
+        self.assertTrue(csc.replay_conversion(end_point_record))
+
+        # It rolls back when the recorded name now has a different schema.
+        csc.set_object_def('ReplayItem', {
+            'properties': {'replay_other': {'type': 'string'}}})
+        self.assertFalse(csc.replay_conversion(end_point_record))
+        self.assertNotIn('ReplayItemExtended', csc.SWAGGER_DEFS)
+        # the index entries of the other definitions are kept
+        indexed = csc.SWAGGER_DEFS_INDEXED
+        self.assertIn('ReplayItem', indexed)
+        self.assertEqual(indexed, list(csc.SWAGGER_DEFS)[:len(indexed)])
+
+    def test_convert_end_point_group(self):
+        """Convert a group of end points from the initial definitions."""
+        saved_defs = dict(csc.SWAGGER_DEFS)
+        csc.SHARD_INITIAL_DEFS = {'Initial': {'properties': {}}}
+        base_resp_json = {
+            'GET_args': {'description': 'List shard names.'},
+            'GET_output_schema': {
+                'type': 'object',
+                'properties': {'shard_name': {'type': 'string'}}
+            }
+        }
+        try:
+            csc.SWAGGER_DEFS['Stale'] = {'properties': {}}
+            conversion_record, swagger_paths = csc.convert_end_point_group(
+                ('/platform', [('/1/shard/names', None, base_resp_json,
+                                None)]))
+            self.assertNotIn('Stale', csc.SWAGGER_DEFS)
+            self.assertIn('Initial', csc.SWAGGER_DEFS)
+        finally:
+            csc.SWAGGER_DEFS.clear()
+            csc.SWAGGER_DEFS.update(saved_defs)
+            csc.invalidate_object_defs()
+        end_point_record = conversion_record['/1/shard/names']
+        self.assertIsNone(end_point_record['error'])
+        self.assertEqual(end_point_record['path'], '/platform/1/shard/names')
+        self.assertIn('get', swagger_paths['/platform/1/shard/names'])
+        self.assertEqual(
+            csc.end_point_family(None, '/3/protocols/nfs/exports/<ID>'),
+            'protocols')
+
+    def test_conversion_cache(self):
+        """Store, load and evict cached end point conversions."""
+        cache_dir = tempfile.mkdtemp()
+        try:
+            cache = csc.ConversionCache(cache_dir, 'generator', 1024 * 1024)
+            end_point_record = {
+                'pair': ['/1/cache/items', None], 'hash': 'digest',
+                'calls': [[{'properties': {'pattern': b'\\d+'}},
+                           'CacheItems', 'Extended',
+                           '#/definitions/CacheItems']],
+                'path': '/platform/1/cache/items', 'error': None}
+            path_obj = {'get': {'operationId': 'listCacheItems'}}
+            cache.put('/1/cache/items', end_point_record, path_obj)
+
+            self.assertEqual(
+                cache.get('/1/cache/items', ['/1/cache/items', None],
+                          'digest'),
+                (end_point_record, path_obj))
+            # It misses when the ?describe document changed.
+            self.assertEqual(
+                cache.get('/1/cache/items', ['/1/cache/items', None],
+                          'other'),
+                (None, None))
+
+            # It evicts entries once the cache outgrows its maximum size.
+            cache.max_size = 0
+            cache.evict()
+            self.assertEqual(cache.stats['evicted'], 1)
+            self.assertEqual(
+                cache.get('/1/cache/items', ['/1/cache/items', None],
+                          'digest'),
+                (None, None))
+        finally:
+            shutil.rmtree(cache_dir)
+
+    def test_write_json(self):
+        """Write the same text as json.dumps, chunk by chunk."""
+        class BytesSerializer(json.JSONEncoder):
+            def default(self, value):
+                if isinstance(value, bytes):
+                    return str(value)
+                return super(BytesSerializer, self).default(value)
+
+        value = {
+            'paths': {'/b': {'get': [1, 2.5, None]}, '/a': {}},
+            'definitions': {'Pattern': {'pattern': b'\\d+'}},
+            'list': ['x' * csc.JSON_WRITE_CHUNK_SIZE, True, []]
+        }
+        expected = json.dumps(value, cls=BytesSerializer, sort_keys=True,
+                              indent=4, separators=(',', ': '))
+        output_file = io.StringIO()
+        csc.write_json(output_file, value, BytesSerializer)
+        self.assertEqual(output_file.getvalue(), expected)
+
+        schema_pool = {}
+        for _ in range(2):
+            output_file = io.StringIO()
+            csc.write_json(output_file, value, BytesSerializer, schema_pool)
+            self.assertEqual(output_file.getvalue(), expected)
+        # the two paths and the definition
+        self.assertEqual(len(schema_pool), 3)
+        output_file = io.StringIO()
+        csc.write_json(output_file, {}, BytesSerializer, schema_pool)
+        self.assertEqual(output_file.getvalue(), '{}')
+
+    def test_generate_versions(self):
+        """Build several versions in one run like standalone builds."""
+        def run_main(argv):
+            saved_argv = sys.argv
+            sys.argv = ['create_swagger_config.py'] + argv
+            try:
+                csc.main()
+            finally:
+                sys.argv = saved_argv
+
+        def read_file(file_name):
+            with open(file_name, 'r') as spec_file:
+                return spec_file.read()
+
+        versions = ['8.0.0.5', '8.0.1.2']
+        selection = ['-a', '-l', 'ERROR', '--include', 'quota',
+                     '--include', 'snapshot']
+        output_dir = tempfile.mkdtemp()
+        try:
+            with self.assertLogs(level='INFO') as logs:
+                run_main(['--versions', ','.join(versions),
+                          '-o', os.path.join(output_dir, 'versions')] +
+                         selection)
+            # the second version reuses conversions of the first
+            reused = [int(record.getMessage().split()[1])
+                      for record in logs.records
+                      if record.getMessage().startswith('Reused ')]
+            self.assertEqual(len(reused), 2)
+            self.assertGreater(reused[1], 0)
+
+            # standalone builds before and after the other version
+            for onefs_version in versions + versions[:1]:
+                spec_file = os.path.join(output_dir, onefs_version + '.json')
+                run_main(['-v', onefs_version, '-o', spec_file] + selection)
+                self.assertEqual(
+                    read_file(spec_file),
+                    read_file(os.path.join(
+                        output_dir, 'versions', onefs_version + '.json')),
+                    onefs_version)
+        finally:
+            shutil.rmtree(output_dir)
+
+    def test_indexed_snapshot(self):
+        """Read an indexed snapshot record by record."""
+        snapshots = csc.papi_schema_snapshots
+        schemas = {
+            'version': 5,
+            'directory': ['/1/snap/items', '/1/snap/items/<ID>'],
+            '/1/snap/items': {'GET_args': {'description': 'List items.'}}
+        }
+        schemas_dir = tempfile.mkdtemp()
+        try:
+            schemas_file = snapshots.snapshot_file(schemas_dir, '1.2.3')
+            self.assertTrue(schemas_file.endswith('1.2.3.json'))
+            snapshots.write_indexed_snapshot(
+                schemas_file + 'l', schemas)
+            schemas_file = snapshots.snapshot_file(schemas_dir, '1.2.3')
+            self.assertTrue(schemas_file.endswith('1.2.3.jsonl'))
+
+            snapshot = snapshots.load_snapshot(schemas_file)
+            self.assertEqual(len(snapshot.records), 0)
+            self.assertIn('directory', snapshot)
+            self.assertNotIn('/1/snap/items/<ID>', snapshot)
+            self.assertEqual(
+                snapshot['/1/snap/items'], schemas['/1/snap/items'])
+            self.assertEqual(list(snapshot.records), ['/1/snap/items'])
+
+            # the newest snapshot of a version wins over older formats
+            json_file = schemas_file[:-1]
+            snapshots.write_json_snapshot(json_file, schemas)
+            os.utime(schemas_file, (0, 0))
+            self.assertEqual(
+                snapshots.snapshot_file(schemas_dir, '1.2.3'), json_file)
+            os.utime(json_file, (0, 0))
+            self.assertEqual(
+                snapshots.snapshot_file(schemas_dir, '1.2.3'), schemas_file)
+            self.assertEqual(dict(snapshot), schemas)
+            snapshots.close_snapshot(snapshot)
+            self.assertTrue(snapshot.snapshot.closed)
+            with snapshots.load_snapshot(schemas_file) as snapshot:
+                self.assertEqual(snapshot['version'], 5)
+            self.assertTrue(snapshot.snapshot.closed)
+        finally:
+            shutil.rmtree(schemas_dir)
+
+    def test_stored_snapshot(self):
+        """Keep each value once across stored snapshots."""
+        snapshots = csc.papi_schema_snapshots
+        schemas = {
+            'version': 5,
+            '/1/snap/items': {'GET_args': {'description': 'List items.'}}
+        }
+        schemas_dir = tempfile.mkdtemp()
+        try:
+            first_file = snapshots.snapshot_file(
+                schemas_dir, '1.2.3', 'stored')
+            snapshots.write_snapshot(first_file, schemas, compress=True)
+            schemas['version'] = 6
+            second_file = snapshots.snapshot_file(
+                schemas_dir, '1.2.4', 'stored')
+            snapshots.write_snapshot(second_file, schemas)
+
+            first = snapshots.load_snapshot(first_file)
+            second = snapshots.load_snapshot(second_file)
+            self.assertEqual(first.index['/1/snap/items'],
+                             second.index['/1/snap/items'])
+            self.assertEqual(first['version'], 5)
+            self.assertEqual(dict(second), schemas)
+            self.assertEqual(
+                snapshots.snapshot_file(schemas_dir, '1.2.4'), second_file)
+        finally:
+            shutil.rmtree(schemas_dir)
+
+    def test_encoded_snapshot(self):
+        """Keep collected documents unchanged and write them as JSON."""
+        snapshots = csc.papi_schema_snapshots
+        resp_json = {'GET_args': {'description': 'List items.'}}
+        schemas = snapshots.EncodedSnapshot()
+        schemas['version'] = 5
+        schemas['/1/snap/items'] = resp_json
+        resp_json['GET_args']['description'] = 'Changed by a fixup.'
+        schemas['/1/snap/items']['GET_args']['description'] = 'Changed.'
+        self.assertEqual(schemas['/1/snap/items'],
+                         {'GET_args': {'description': 'List items.'}})
+
+        schemas_dir = tempfile.mkdtemp()
+        try:
+            schemas_file = snapshots.snapshot_file(schemas_dir, '1.2.3')
+            for value in (schemas, {}):
+                snapshots.write_snapshot(schemas_file, value)
+                with open(schemas_file, 'r') as schemas_in:
+                    self.assertEqual(
+                        schemas_in.read(),
+                        json.dumps(dict(value), sort_keys=True, indent=4,
+                                   separators=(',', ': ')))
+        finally:
+            shutil.rmtree(schemas_dir)
+
+    def test_cluster_nodes(self):
+        """Spread requests over nodes and fail over from a node that is down."""
+        resources = csc.common_resources
+
+        class FakeResponse(object):
+            def __init__(self, value):
+                self.value = value
+
+            def json(self):
+                return self.value
+
+        class FakeSession(object):
+            def __init__(self, down=False, directory=None):
+                self.down = down
+                self.directory = directory or ['/1/a']
+                self.urls = []
+
+            def get(self, url, params=None, verify=True, timeout=None):
+                self.urls.append(url)
+                if self.down:
+                    raise csc.requests.exceptions.ConnectionError(url)
+                if url.endswith('/cluster/nodes'):
+                    return FakeResponse({'nodes': [
+                        {'lnn': 1}, {'lnn': 2},
+                        {'lnn': 3, 'state': {'smartfail': {'down': True}}}]})
+                if url.endswith('/network/interfaces'):
+                    return FakeResponse({'interfaces': [
+                        {'lnn': lnn, 'name': 'ext-1', 'status': 'up',
+                         'owners': [{'pool': 'pool0'}],
+                         'ip_addrs': ['10.0.0.{}'.format(lnn)]}
+                        for lnn in (2, 1, 3)] + [
+                        {'lnn': 1, 'name': 'int-a', 'status': 'up',
+                         'owners': [], 'ip_addrs': ['128.0.0.1']}]})
+                return FakeResponse({'directory': self.directory})
+
+        self.assertEqual(resources.discover_cluster_nodes(
+            'node1', '8080', FakeSession()), ['10.0.0.1', '10.0.0.2'])
+
+        sessions = OrderedDict([
+            ('node1', FakeSession()), ('node2', FakeSession(down=True)),
+            ('node3', FakeSession(directory=['/1/b']))])
+        nodes = resources.ClusterNodes(sessions, 1)
+        for _ in range(4):
+            nodes.get('https://node1:8080/platform/1/a')
+        self.assertEqual(sessions['node1'].urls,
+                         ['https://node1:8080/platform/1/a'] * 2)
+        self.assertEqual(sessions['node2'].urls,
+                         ['https://node2:8080/platform/1/a'])
+        self.assertEqual(sessions['node3'].urls,
+                         ['https://node3:8080/platform/1/a'] * 2)
+        self.assertEqual(nodes.in_flight,
+                         {'node1': 0, 'node2': 0, 'node3': 0})
+
+        with self.assertLogs(level='WARNING') as logs:
+            nodes.check_consistency(
+                'https://node1:8080/platform', None,
+                {'directory': ['/1/a']}, 'directory')
+        self.assertEqual(len(logs.output), 2)
+        self.assertIn('node3 reports a different directory', logs.output[1])
+
+        nodes = resources.ClusterNodes(
+            OrderedDict([('node2', FakeSession(down=True))]), 1)
+        with self.assertRaises(csc.requests.exceptions.ConnectionError):
+            nodes.get('https://node2:8080/platform/1/a')
+
+    def test_adaptive_concurrency(self):
+        """Grow the window additively and halve it once per round."""
+        adaptive = csc.common_resources.AdaptiveConcurrency(8, 0.5)
+        for _ in range(60):
+            adaptive.acquire()
+            adaptive.release(0.1)
+        self.assertEqual(adaptive.window, 8)
+
+        for _ in range(8):
+            adaptive.acquire()
+        adaptive.release(0.1, overloaded=True)
+        self.assertEqual(adaptive.window, 4)
+        # requests in flight at the decrease do not decrease it again
+        for _ in range(7):
+            adaptive.release(2.0)
+        self.assertEqual(adaptive.window, 4)
+        adaptive.acquire()
+        adaptive.release(2.0)
+        self.assertEqual(adaptive.window, 2)
+        self.assertEqual(adaptive.in_flight, 0)
+        self.assertEqual(
+            csc.common_resources.percentile(adaptive.latencies, 50), 0.1)
+
+    def test_delta_crawl(self):
+        """Fetch new end points and a sample, copy the rest."""
+        resources = csc.common_resources
+        baseline = {
+            '/3/quota/quotas': {'GET_args': {}},
+            '/3/quota/quotas/<QID>': {'PUT_args': {}},
+            '/1/job/jobs': {'POST_args': {}}}
+        end_point_paths = [
+            ('/3/quota/quotas', '/3/quota/quotas/<QID>'),
+            ('/5/job/jobs', None)]
+        fetched, sampled, copied = resources.plan_delta_crawl(
+            end_point_paths, baseline, 1)
+        self.assertEqual(len(sampled), 1)
+        self.assertEqual(fetched, ['/5/job/jobs'] + sampled)
+        self.assertEqual(
+            sorted(sampled + copied),
+            ['/3/quota/quotas', '/3/quota/quotas/<QID>'])
+        self.assertEqual(resources.plan_delta_crawl(
+            end_point_paths, baseline, 1, 7), resources.plan_delta_crawl(
+                end_point_paths, baseline, 1, 7))
+
+        schemas = dict((end_point, baseline[end_point])
+                       for end_point in sampled)
+        self.assertEqual(resources.copy_from_baseline(
+            baseline, schemas, sampled, copied), [])
+        self.assertEqual(sorted(schemas), sorted(sampled + copied))
+
+        schemas = dict((end_point, {}) for end_point in sampled)
+        self.assertEqual(resources.copy_from_baseline(
+            baseline, schemas, sampled, copied), copied)
+        self.assertEqual(sorted(schemas), sampled)
+
+    def test_journaled_snapshot(self):
+        """Resume a collection from its journal, dropping a torn record."""
+        snapshots = csc.papi_schema_snapshots
+        schemas_dir = tempfile.mkdtemp()
+        try:
+            journal_file = snapshots.snapshot_file(
+                schemas_dir, '1.2.3') + snapshots.JOURNAL_EXT
+            schemas = snapshots.JournaledSnapshot(journal_file)
+            schemas['version'] = 5
+            schemas['/1/snap/items'] = {'GET_args': {}}
+            schemas['/1/snap/old'] = None
+            del schemas['/1/snap/old']
+            schemas.close()
+            with open(journal_file, 'ab') as journal:
+                journal.write(b'["/1/snap/items/<ID>", {"GET_')
+
+            schemas = snapshots.JournaledSnapshot(journal_file, resume=True)
+            self.assertEqual(dict(schemas), {
+                'version': 5, '/1/snap/items': {'GET_args': {}}})
+            schemas['/1/snap/items/<ID>'] = {'PUT_args': {}}
+            schemas.close()
+            schemas = snapshots.JournaledSnapshot(journal_file, resume=True)
+            self.assertEqual(schemas['/1/snap/items/<ID>'], {'PUT_args': {}})
+            self.assertEqual(len(schemas), 3)
+            schemas.remove()
+            self.assertEqual(os.listdir(schemas_dir), [])
+        finally:
+            shutil.rmtree(schemas_dir)
+
+    def test_conversion_profile(self):
+        """Count nested calls of a profiled function once in its time."""
+        profile = csc.ConversionProfile(5, None)
+
+        def countdown(num):
+            return countdown(num - 1) if num else 0
+        countdown = profile.timed('countdown', countdown)
+        countdown(3)
+        func_times = profile.function_times['countdown']
+        self.assertEqual(func_times['calls'], 4)
+        self.assertEqual(func_times['depth'], 0)
+        self.assertGreater(func_times['seconds'], 0.0)
+
+        profile.add_end_point('/1/profile/items', 1.0, 1.5, 3.0)
+        self.assertEqual(
+            profile.end_point_times['/1/profile/items'], (0.5, 1.5))
+
+    def test_get_endpoint_paths(self):
+        """Pair the highest versions of end points in sorted order."""
+        end_point_list = [
+            '/1/a/items', '/3/a/items', '/3.1/a/items',
+            '/1/a/items/<ID>', '/2/a/items/<ID>',
+            '/2/ab', '/2/a', '/2/a/b', '/2/excluded',
+            '/1/c/items/<ID>', '/2/c', '/3/c']
+        self.assertEqual(
+            csc.common_resources.get_endpoint_paths(
+                end_point_list, ['/2/excluded']),
+            [(None, '/1/c/items/<ID>'), ('/2/a/b', None), ('/2/ab', None),
+             ('/2/a', None), ('/3/a/items', '/2/a/items/<ID>'),
+             ('/3/c', None)])
+        # same end points that are not next to each other are both used
+        self.assertEqual(
+            csc.common_resources.get_endpoint_paths(
+                ['/1/d', '/1/d/<ID>', '/2/d', '/2/d/<ID>'], []),
+            [('/1/d', '/1/d/<ID>'), ('/2/d', '/2/d/<ID>')])
+
+    def test_end_point_selector(self):
+        """Select end points by paths, globs, version ranges and families."""
+        selector = csc.common_resources.EndPointSelector(
+            include=['quota', '/3-5/protocols/nfs/**', '/*/sra/*/<ID>'],
+            exclude=['/*/quota/reports/**', '/4/protocols/nfs/exports'],
+            exclude_paths=['/1/quota/settings'])
+        for end_point in ['/1/quota/quotas', '/7/quota/quotas/<QID>',
+                          '/3/protocols/nfs', '/5/protocols/nfs/aliases',
+                          '/2/sra/jobs/<ID>']:
+            self.assertTrue(selector.selects(end_point), end_point)
+        for end_point in ['/1/quota/settings', '/1/quota/reports',
+                          '/3/quota/reports/<RID>/about',
+                          '/4/protocols/nfs/exports', '/6/protocols/nfs',
+                          '/3.1/protocols/nfs', '/2/sra/jobs',
+                          '/3/protocols/smb/shares']:
+            self.assertFalse(selector.selects(end_point), end_point)
+        self.assertTrue(
+            csc.common_resources.EndPointSelector().selects('/3/any'))
+
+        # a snapshot collected with rules only lists the end points it holds
+        resources = csc.common_resources
+        self.assertEqual(selector.unmatched_rules(
+            ['/1/quota/quotas', '/3/protocols/nfs']),
+            ['/*/sra/*/<ID>', '/*/quota/reports/**',
+             '/4/protocols/nfs/exports'])
+        end_point_list = ['/1/quota/quotas', '/1/quota/quotas/<QID>',
+                          '/1/quota/settings', '/3/protocols/smb/shares']
+        end_point_paths = resources.get_endpoint_paths(
+            end_point_list, selector)
+        self.assertEqual(
+            resources.selected_directory(
+                end_point_list, end_point_paths, selector),
+            ['/1/quota/quotas', '/1/quota/quotas/<QID>'])
+        excluding = resources.EndPointSelector(
+            exclude_paths=['/1/quota/settings'])
+        self.assertEqual(
+            resources.selected_directory(
+                end_point_list, end_point_paths, excluding),
+            end_point_list)
+
+    def test_schema_fixups(self):
+        """Apply the fixup rules that match a definition name."""
+        rules = [
+            {'name': 'rename', 'definitions': ['Job*'],
+             'when': [{'op': 'exists', 'path': '/properties/types'}],
+             'patch': [{'op': 'move', 'from': '/properties/types',
+                        'path': '/properties/policies'}]},
+            {'name': 'digest', 'definitions': ['*Policies', 'Other'],
+             'when': [{'op': 'absent', 'path': '/properties/digest'},
+                      {'op': 'test', 'path': '/type', 'value': 'object'}],
+             'patch': [{'op': 'add', 'path': '/properties/digest',
+                        'value': {'type': 'string'}},
+                       {'op': 'remove', 'path': '/properties/resume',
+                        'optional': True}],
+             'final': True},
+            {'name': 'skipped', 'definitions': ['*Polic*'],
+             'patch': [{'op': 'remove', 'path': '/type'}]}]
+        registry = csc.schema_fixups.FixupRegistry(
+            [csc.schema_fixups.FixupRule(rule) for rule in rules])
+        schema = {'properties': {'types': {'type': 'array'}},
+                  'type': 'object'}
+
+        self.assertEqual(
+            registry.apply('JobPolicies', schema), ['rename', 'digest'])
+        self.assertEqual(schema, {
+            'properties': {'policies': {'type': 'array'},
+                           'digest': {'type': 'string'}},
+            'type': 'object'})
+        self.assertEqual(registry.apply('JobPolicies', schema), ['skipped'])
+        self.assertEqual(registry.apply('Jobs', schema), [])
+        self.assertEqual(list(registry.fired.values()), [1, 1, 1])
+
+    def test_schema_visitor(self):
+        """Walk deeply nested schemas without recursion."""
+        visitor = csc.schema_fixups.SchemaVisitor()
+        visited = []
+        visitor.register(
+            ['Deep*'], '/properties/*',
+            lambda name, key, node, parent: visited.append((name, key)))
+        visitor.register(
+            ['*Schema'], '/**/items', node_type='integer',
+            handler=lambda name, key, node, parent: node.pop('maximum'))
+        schema = {'properties': {
+            'a': {'type': 'array',
+                  'items': {'type': 'integer', 'maximum': 1}},
+            'b': {'type': 'array',
+                  'items': {'type': 'string', 'maximum': 1}}}}
+        leaf = schema
+        for _ in range(2 * sys.getrecursionlimit()):
+            leaf['items'] = {'type': 'array'}
+            leaf = leaf['items']
+        leaf['items'] = {'type': 'integer', 'maximum': 1}
+
+        visitor.visit('DeepSchema', schema)
+        visitor.visit('Other', schema)
+        self.assertEqual(visited, [('DeepSchema', 'a'), ('DeepSchema', 'b')])
+        self.assertEqual(schema['properties']['a']['items'],
+                         {'type': 'integer'})
+        self.assertEqual(schema['properties']['b']['items'],
+                         {'type': 'string', 'maximum': 1})
+        self.assertEqual(leaf['items'], {'type': 'integer'})
+
+    def test_schema_diff(self):
+        """Report only the entries whose subtrees changed."""
+        old_spec = {
+            'swagger': '2.0', 'info': {'version': '1'},
+            'paths': {
+                '/a': {'get': {'operationId': 'getA', 'parameters': []}},
+                '/b': {'get': {'operationId': 'getB'}}},
+            'definitions': {
+                'A': {'properties': {'x': {'type': 'string'},
+                                     'y': {'type': 'integer'}}},
+                'B': {'properties': {}}}}
+        new_spec = copy.deepcopy(old_spec)
+        new_spec['info']['version'] = '2'
+        new_spec['paths']['/a']['get']['parameters'].append({'name': 'z'})
+        new_spec['paths']['/c'] = new_spec['paths'].pop('/b')
+        new_spec['paths']['/c']['post'] = {'operationId': 'createC'}
+        new_spec['definitions']['A']['properties']['y']['type'] = 'string'
+        del new_spec['definitions']['A']['properties']['x']
+        new_spec['definitions']['C'] = new_spec['definitions'].pop('B')
+
+        report = schema_diff.diff_documents(old_spec, new_spec)
+        self.assertEqual(report['paths']['added'], ['/c'])
+        self.assertEqual(report['paths']['removed'], ['/b'])
+        self.assertEqual(report['paths']['changed'],
+                         {'/a': [('/get/parameters', '~')]})
+        self.assertEqual(report['operations']['added'],
+                         ['createC (POST /c)'])
+        self.assertEqual(report['operations']['removed'], [])
+        self.assertEqual(report['operations']['changed'],
+                         ['getA (GET /a)', 'getB (GET /c)'])
+        self.assertEqual(report['definitions']['added'], ['C'])
+        self.assertEqual(report['definitions']['changed'], {'A': [
+            ('/properties/x', '-'), ('/properties/y', '~')]})
+        self.assertEqual(report['other'], [('/info/version', '~')])
+        self.assertFalse(schema_diff.report_has_changes(
+            schema_diff.diff_documents(old_spec, copy.deepcopy(old_spec))))
+
+        # equal values have equal digests whatever their key order, and
+        # different types of equal text never do
+        self.assertEqual(schema_diff.merkle_tree({'a': 1, 'b': [None]})[0],
+                         schema_diff.merkle_tree({'b': [None], 'a': 1})[0])
+        self.assertNotEqual(schema_diff.merkle_tree({'a': 1})[0],
+                            schema_diff.merkle_tree({'a': '1'})[0])
+
+    def test_slim_spec(self):
+        """Keep selected operations and the definitions they refer to."""
+        swagger_json = {
+            'paths': {
+                '/quotas': {
+                    'get': {'operationId': 'listQuotas', 'tags': ['Quota'],
+                            'responses': {'200': {'schema': {
+                                '$ref': '#/definitions/Quotas'}}}},
+                    'post': {'operationId': 'createQuota',
+                             'tags': ['Quota']}},
+                '/jobs': {
+                    'get': {'operationId': 'listJobs', 'tags': ['Job'],
+                            'responses': {'200': {'schema': {
+                                '$ref': '#/definitions/Jobs'}}}},
+                    'put': {'operationId': 'updateJobs', 'tags': ['Job'],
+                            'responses': {'200': {'schema': {
+                                '$ref': '#/definitions/Empty'}}}}}},
+            'definitions': {
+                'Quotas': {'items': {'$ref': '#/definitions/QuotaItem'}},
+                'QuotaItem': {'properties': {'usage': {
+                    '$ref': '#/definitions/QuotaUsage'}}},
+                'QuotaUsage': {'type': 'object'},
+                'Jobs': {'type': 'object'},
+                'Empty': {'type': 'object'}}}
+
+        csc.slim_spec(swagger_json, ['quota'], ['updateJobs'])
+        self.assertEqual(sorted(swagger_json['paths']), ['/jobs', '/quotas'])
+        self.assertEqual(sorted(swagger_json['paths']['/quotas']),
+                         ['get', 'post'])
+        self.assertEqual(list(swagger_json['paths']['/jobs']), ['put'])
+        self.assertEqual(sorted(swagger_json['definitions']),
+                         ['Empty', 'QuotaItem', 'QuotaUsage', 'Quotas'])
+
+    def test_papi_replay_server(self):
+        """Replay a snapshot behind a session, failing requests on demand."""
+        server = papi_replay_server.create_server(
+            papi_replay_server.parse_arguments(
+                ['-v', '8.0.1.2', '--port', '0', '-l', 'WARNING']))
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            base_url = 'http://127.0.0.1:{}'.format(server.server_address[1])
+            session = requests.Session()
+            response = session.get(base_url + '/platform/latest')
+            self.assertEqual(response.status_code, 401)
+
+            response = session.post(
+                base_url + '/session/1/session',
+                json={'username': 'root', 'password': 'a',
+                      'services': ['platform']})
+            self.assertEqual(response.status_code, 201)
+            self.assertIn('isisessid', session.cookies)
+            self.assertEqual(
+                session.get(base_url + '/platform/latest').json(),
+                {'latest': str(server.schemas['version'])})
+            directory = session.get(
+                base_url + '/platform', params='describe&list&json').json()
+            self.assertEqual(directory['directory'],
+                             server.schemas['directory'])
+            response = session.get(
+                base_url + '/platform/1/snapshot/settings',
+                params='describe&json')
+            self.assertEqual(response.json(),
+                             server.schemas['/1/snapshot/settings'])
+            response = session.get(
+                base_url + '/platform/1/no/such/end/point',
+                params='describe&json')
+            self.assertEqual(response.status_code, 404)
+
+            server.args.error_rate = 1.0
+            server.args.error_codes = [503]
+            response = session.get(base_url + '/platform/latest')
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(server.status_counts[503], 1)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_cluster_node_connections(self):
+        """Keep a connection to every node while requests alternate."""
+        server = papi_replay_server.create_server(
+            papi_replay_server.parse_arguments(
+                ['-v', '8.0.1.2', '--port', '0', '-l', 'WARNING']))
+        accepted = []
+        get_request = server.get_request
+
+        def counting_get_request():
+            request = get_request()
+            accepted.append(request[1])
+            return request
+
+        server.get_request = counting_get_request
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            port = server.server_address[1]
+            sessions = OrderedDict()
+            for host in ('127.0.0.1', 'localhost'):
+                sessions[host] = requests.Session()
+                sessions[host].post(
+                    'http://{}:{}/session/1/session'.format(host, port),
+                    json={'username': 'root', 'password': 'a'})
+            nodes = csc.common_resources.ClusterNodes(sessions, 1)
+            # the adapter the crawls mount, made for a single host
+            nodes.mount('http://', requests.adapters.HTTPAdapter(
+                pool_connections=1, pool_maxsize=1))
+            accepted[:] = []
+            for _ in range(6):
+                response = nodes.get(
+                    'http://127.0.0.1:{}/platform/latest'.format(port))
+                self.assertEqual(response.status_code, 200)
+            self.assertEqual(nodes.request_counts,
+                             {'127.0.0.1': 3, 'localhost': 3})
+            self.assertEqual(len(accepted), 2)
+        finally:
+            server.shutdown()
+            server.server_close()
+
     def test_singularize_status(self):
         """FirmwareStatus to FirmwareStatusItem."""
         used = csc.PostFixUsed()
@@ -580,12 +1467,19 @@ class TestCreateSwaggerConfig(unittest.TestCase):
 
 if __name__ == '__main__':
     if __package__ is None:
-        import sys
         from os import path
         # Append swagger-config-generator root directory.
         sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
         from components import create_swagger_config as csc
+        from components import (
+            generate_PAPIschemas_from_ClusterIP as cluster_ip)
+        from components import papi_replay_server
+        from components import schema_diff
         unittest.main()
     else:
         from ..components import create_swagger_config as csc
+        from ..components import (
+            generate_PAPIschemas_from_ClusterIP as cluster_ip)
+        from ..components import papi_replay_server
+        from ..components import schema_diff
         unittest.main()